@@ -0,0 +1,6 @@
+"""
+Bayer GMP Reporter - 性能测试与基准工具
+
+包含Dify/Spring本地替身服务以及负载驱动脚本，仅用于离线测量插件吞吐与延迟，
+不会随插件工具一起被调用。
+"""
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 对话压缩效果
+
+对不同长度的合成对话（最后一条助手消息为Markdown表格）测量压缩前后提示词中对话内容的估算token数、
+保留/丢弃的消息数，以及压缩耗时和压缩过程中的内存峰值（生成器逐条处理，峰值不随对话长度线性增长的部分为已见行的哈希）。
+
+示例：
+    python -m benchmarks.bench_compaction --messages 10,100,1000,10000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.common import configure_benchmark_logging, print_table, write_json
+from benchmarks import synthetic
+
+from compaction import ConversationCompactor, format_message
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='对话压缩效果')
+    parser.add_argument('--messages', default='10,100,1000,10000', help='对话消息条数，逗号分隔（默认: 10,100,1000,10000）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def measure(message_count: int) -> dict:
+    """压缩一段对话并汇总"""
+    conversation = synthetic.generate_conversation(message_count, with_table=True)
+    original_chars = len("\n".join(format_message(message) for message in conversation))
+
+    compactor = ConversationCompactor()
+    tracemalloc.start()
+    start = time.perf_counter()
+    text = "\n".join(format_message(message) for message in compactor.compact(iter(conversation)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "messages": message_count,
+        "kept": compactor.kept,
+        "dropped": compactor.dropped,
+        "original_chars": original_chars,
+        "compacted_chars": len(text),
+        "original_tokens": compactor.original_tokens,
+        "compacted_tokens": compactor.compacted_tokens,
+        "saved": f"{1 - compactor.compacted_tokens / max(compactor.original_tokens, 1):.0%}",
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging("ERROR")
+    rows = [measure(int(count)) for count in args.messages.split(",") if count.strip()]
+    print_table(rows, ["messages", "kept", "dropped", "original_tokens", "compacted_tokens", "saved",
+                       "elapsed_ms", "peak_kb"])
+    if args.output:
+        write_json(args.output, {"config": vars(args), "results": rows})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
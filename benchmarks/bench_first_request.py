@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 首个请求延迟测量
+
+每次运行都在全新的子进程中导入PDF生成工具并调用它，模拟插件进程刚启动时的第一份报告：
+- first_ms:     第一次调用的耗时（需要解析域名并建立连接）
+- second_ms:    紧接着的第二次调用（复用连接池中的连接）
+- reconnect_ms: 关闭连接池后再次调用（需要重新建立连接，域名解析可命中DNS缓存）
+
+两种配置对照：
+- cold:   GMP_DNS_CACHE_TTL=0，不预热（改动前的行为）
+- warmed: 开启DNS缓存，调用前先执行warmup.warm_up()（即GMP_WARMUP=true时启动阶段完成的工作）
+
+Spring替身服务监听127.0.0.1，通过localhost访问以经过真实的域名解析；本机解析几乎没有耗时，
+用--dns-latency为每次解析加上固定延迟来模拟访问远程DNS服务器。TLS握手未模拟。
+
+示例：
+    python -m benchmarks.bench_first_request --runs 10 --dns-latency 0.05
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from benchmarks.common import percentile, print_table, write_json
+from benchmarks.stub_servers import SpringStubServer, build_sample_report
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = """
+import json, socket, sys, time
+from benchmarks.common import configure_benchmark_logging
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+import dns_cache, http_client, warmup
+
+configure_benchmark_logging("ERROR")
+config = json.loads(sys.argv[1])
+
+# 在gevent替换socket之后、DNS缓存安装之前包装解析函数，模拟远程DNS的延迟
+_resolve = socket.getaddrinfo
+def _slow_getaddrinfo(*args, **kwargs):
+    time.sleep(config["dns_latency"])
+    return _resolve(*args, **kwargs)
+socket.getaddrinfo = _slow_getaddrinfo
+
+result = {}
+if config["warm"]:
+    start = time.perf_counter()
+    warmup.warm_up([config["base_url"]])
+    result["warmup_ms"] = (time.perf_counter() - start) * 1000
+
+params = {"report_data": config["report_data"], "renderer": "spring",
+          "credentials": {"spring_app_api_key": "bench-key", "spring_app_url": config["base_url"]}}
+
+def invoke():
+    start = time.perf_counter()
+    messages = list(GMPGeneratePDFTool(None, None)._invoke(dict(params)))
+    elapsed = (time.perf_counter() - start) * 1000
+    ok = any(getattr(getattr(m, "message", None), "json_object", {}).get("success") for m in messages)
+    if not ok:
+        raise SystemExit("PDF generation failed")
+    return elapsed
+
+result["first_ms"] = invoke()
+result["second_ms"] = invoke()
+http_client.get_session().close()
+result["reconnect_ms"] = invoke()
+result["dns"] = dns_cache.get_stats()
+print("RESULT " + json.dumps(result), flush=True)
+"""
+
+CASES = {
+    "cold": {"warm": False, "env": {"GMP_DNS_CACHE_TTL": "0"}},
+    "warmed": {"warm": True, "env": {"GMP_DNS_CACHE_TTL": "60"}},
+}
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='首个请求延迟测量')
+    parser.add_argument('--runs', type=int, default=10, help='每种配置的子进程次数（默认: 10）')
+    parser.add_argument('--dns-latency', type=float, default=0.05,
+                        help='每次域名解析附加的延迟，秒（默认: 0.05）')
+    parser.add_argument('--spring-latency', type=float, default=0.01, help='Spring替身服务的延迟，秒（默认: 0.01）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def run_child(base_url: str, report_data: str, dns_latency: float, case: Dict[str, Any]) -> Dict[str, Any]:
+    """在新进程中执行一次测量"""
+    config = {"base_url": base_url, "report_data": report_data, "dns_latency": dns_latency, "warm": case["warm"]}
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, GMP_WARMUP="false", **case["env"])
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, json.dumps(config)], cwd=ROOT_DIR,
+                            capture_output=True, text=True, env=env)
+    for line in result.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"测量失败: {result.stderr[-2000:]}")
+
+
+def summarize(case: str, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按中位数汇总各次运行"""
+    row: Dict[str, Any] = {"case": case, "runs": len(samples)}
+    for key in ("warmup_ms", "first_ms", "second_ms", "reconnect_ms"):
+        values = [sample[key] for sample in samples if key in sample]
+        row[f"p50_{key}"] = round(percentile(values, 50), 1) if values else "-"
+    row["dns_hits"] = sum(sample.get("dns", {}).get("hits", 0) for sample in samples)
+    return row
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    report_data = json.dumps(build_sample_report(), ensure_ascii=False)
+
+    with SpringStubServer(latency=args.spring_latency) as server:
+        base_url = server.base_url.replace("127.0.0.1", "localhost")
+        rows = []
+        for name, case in CASES.items():
+            samples = [run_child(base_url, report_data, args.dns_latency, case) for _ in range(args.runs)]
+            rows.append(summarize(name, samples))
+
+    print(f"域名解析附加延迟: {args.dns_latency * 1000:.0f}ms，Spring替身服务延迟: {args.spring_latency * 1000:.0f}ms\n")
+    print_table(rows, ["case", "runs", "p50_warmup_ms", "p50_first_ms", "p50_second_ms", "p50_reconnect_ms", "dns_hits"])
+
+    if args.output:
+        write_json(args.output, {"config": vars(args), "cases": rows})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
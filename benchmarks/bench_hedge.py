@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 对冲请求效果
+
+Dify替身服务的/completion-messages以--tail-rate的概率额外延迟--tail-latency，模拟LLM耗时的长尾；
+分别在关闭和开启对冲（GMP_HEDGE）时调用call_dify_model，对比耗时分布、对冲率、对冲胜率，
+以及替身服务实际收到的请求数（对冲带来的额外负载）。
+
+示例：
+    python -m benchmarks.bench_hedge --calls 200 --latency 0.1 --tail-rate 0.05 --tail-latency 1.0
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.common import configure_benchmark_logging, print_table, summarize_latencies, write_json
+from benchmarks.stub_servers import DifyStubServer
+
+import hedge
+from utils import call_dify_model
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='对冲请求效果')
+    parser.add_argument('--calls', type=int, default=200, help='每种配置的调用次数（默认: 200）')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发调用数（默认: 4）')
+    parser.add_argument('--latency', type=float, default=0.1, help='LLM的基础延迟，秒（默认: 0.1）')
+    parser.add_argument('--tail-rate', type=float, default=0.05, help='落入长尾的概率（默认: 0.05）')
+    parser.add_argument('--tail-latency', type=float, default=1.0, help='长尾的额外延迟，秒（默认: 1.0）')
+    parser.add_argument('--percentile', type=float, default=hedge.HEDGE_PERCENTILE,
+                        help=f'触发对冲的耗时百分位（默认: {hedge.HEDGE_PERCENTILE:g}）')
+    parser.add_argument('--budget', type=float, default=hedge.HEDGE_BUDGET,
+                        help=f'对冲请求占调用数的最大比例（默认: {hedge.HEDGE_BUDGET:g}）')
+    parser.add_argument('--seed', type=int, default=7, help='随机数种子（默认: 7）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def run_case(name: str, args, hedged: bool) -> Dict[str, Any]:
+    """以给定配置调用call_dify_model并汇总"""
+    hedge.HEDGE_ENABLED = hedged
+    hedge.hedger = hedge.Hedger(percentile=args.percentile, default_delay=hedge.HEDGE_DELAY,
+                                budget=hedge.HedgeBudget(budget=args.budget))
+    with DifyStubServer(latency=args.latency, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                        seed=args.seed) as dify:
+        context = {"api_base": dify.base_url, "api_key": "bench-key"}
+        latencies: List[float] = []
+        failures = 0
+
+        def invoke(_):
+            start = time.perf_counter()
+            answer = call_dify_model("请优化报告", context, task="optimize")
+            return time.perf_counter() - start, bool(answer)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for elapsed, ok in executor.map(invoke, range(args.calls)):
+                latencies.append(elapsed)
+                failures += 0 if ok else 1
+        wall_time = time.perf_counter() - start
+        # 输掉的对冲请求可能仍在进行，稍等其返回后再统计替身服务收到的请求数
+        time.sleep(args.tail_latency + args.latency)
+        backend_requests = dify.stats()["/completion-messages"]["requests"]
+
+    row = summarize_latencies(latencies, wall_time)
+    stats = hedge.get_stats()
+    row.update({"case": name, "failures": failures, "backend_requests": backend_requests,
+                "hedge_rate": stats["hedge_rate"] if hedged else "-",
+                "hedge_win_rate": stats["hedge_win_rate"] if hedged else "-",
+                "throttled": stats["throttled"] if hedged else "-"})
+    return row
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging("ERROR")
+    rows = [run_case("no_hedge", args, hedged=False), run_case("hedge", args, hedged=True)]
+    print(f"基础延迟: {args.latency * 1000:.0f}ms，长尾: {args.tail_rate:.0%}的请求额外{args.tail_latency * 1000:.0f}ms\n")
+    print_table(rows, ["case", "count", "failures", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+                       "backend_requests", "hedge_rate", "hedge_win_rate", "throttled"])
+    if args.output:
+        write_json(args.output, {"config": vars(args), "cases": rows})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
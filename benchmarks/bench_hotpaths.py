@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 解析与规范化热点路径微基准
+
+测量CPU密集的解析/规范化函数随输入规模的耗时变化：
+- utils.extract_json_from_text：不同噪声类型的LLM输出、整段对话文本
+- GMPExtractDataTool._fix_json_format / _extract_json_from_conversation_id /
+  _extract_from_markdown_tables / _process_extracted_data / _extract_gmp_report_data
+- GMPGeneratePDFTool._prepare_report_payload（原_make_api_request中的措施规范化）
+
+结果以JSON写出，可用--baseline与之前的结果对比，耗时增长超过--tolerance的用例会被标记为回归。
+测量前先检查模型不可用时的兜底提取确实从用户的故障描述生成了事件，兜底路径出错时以非零状态退出。
+
+示例：
+    python -m benchmarks.bench_hotpaths --output hotpaths.json
+    python -m benchmarks.bench_hotpaths --quick --baseline hotpaths.json
+"""
+import argparse
+import copy
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from benchmarks.common import configure_benchmark_logging, percentile, print_table, write_json
+from benchmarks import synthetic
+
+from utils import extract_json_from_text
+from tools.gmp_extract_data import GMPExtractDataTool
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+
+MESSAGE_COUNTS = [10, 100, 1000, 10000]
+ACTION_COUNTS = [10, 100, 500]
+QUICK_MESSAGE_COUNTS = [10, 1000]
+QUICK_ACTION_COUNTS = [10, 100]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='解析与规范化热点路径微基准')
+    parser.add_argument('--quick', action='store_true', help='只运行较小的规模组合')
+    parser.add_argument('--min-time', type=float, default=0.2, help='每个用例的最短测量时间，秒（默认: 0.2）')
+    parser.add_argument('--max-iterations', type=int, default=2000, help='每个用例的最大迭代次数（默认: 2000）')
+    parser.add_argument('--filter', default=None, help='只运行名称包含该字符串的用例')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    parser.add_argument('--baseline', default=None, help='与之前的JSON结果对比')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='p50耗时相对基线的增长超过该比例视为回归（默认: 0.2）')
+    return parser.parse_args()
+
+
+def build_cases(quick: bool) -> List[Dict[str, Any]]:
+    """构建基准用例：名称、规模参数、输入字节数和被测函数"""
+    extract_tool = GMPExtractDataTool(None, None)
+    pdf_tool = GMPGeneratePDFTool(None, None)
+    message_counts = QUICK_MESSAGE_COUNTS if quick else MESSAGE_COUNTS
+    action_counts = QUICK_ACTION_COUNTS if quick else ACTION_COUNTS
+    cases = []
+
+    def add(name: str, param: int, payload: Any, func: Callable[[], Any]) -> None:
+        size = len(payload.encode("utf-8")) if isinstance(payload, str) else \
+            len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        cases.append({"name": name, "param": param, "input_bytes": size, "func": func})
+
+    for actions in action_counts:
+        for noise in ("clean", "fenced", "prose"):
+            text = synthetic.generate_llm_output(action_count=actions, noise=noise)
+            add(f"extract_json_from_text.{noise}", actions, text, lambda text=text: extract_json_from_text(text))
+
+        broken = synthetic.generate_llm_output(action_count=actions, noise="truncated")
+        add("fix_json_format", actions, broken, lambda broken=broken: extract_tool._fix_json_format(broken))
+
+        for style in ("marker", "python"):
+            conversation_id = synthetic.generate_conversation_id_payload(action_count=actions, style=style)
+            add(f"extract_json_from_conversation_id.{style}", actions, conversation_id,
+                lambda cid=conversation_id: extract_tool._extract_json_from_conversation_id(cid))
+
+        report = synthetic.generate_report(action_count=actions)
+        add("process_extracted_data", actions, report,
+            lambda report=report: extract_tool._process_extracted_data(copy.deepcopy(report)))
+        add("prepare_report_payload", actions, report,
+            lambda report=report: pdf_tool._prepare_report_payload(report))
+
+        table = synthetic.generate_markdown_table(extra_rows=actions)
+        add("extract_from_markdown_tables", actions, table,
+            lambda table=table: extract_tool._extract_from_markdown_tables(table))
+
+    for messages in message_counts:
+        conversation = synthetic.generate_conversation(messages, with_table=True)
+        add("extract_gmp_report_data.table", messages, conversation,
+            lambda conversation=conversation: extract_tool._extract_gmp_report_data(conversation))
+        plain = synthetic.generate_conversation(messages)
+        add("extract_gmp_report_data.fallback", messages, plain,
+            lambda plain=plain: extract_tool._extract_gmp_report_data(plain))
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in plain) + "\n" + \
+            synthetic.generate_llm_output(action_count=10, noise="fenced")
+        add("extract_json_from_text.transcript", messages, transcript,
+            lambda transcript=transcript: extract_json_from_text(transcript))
+    return cases
+
+
+def check_fallback() -> bool:
+    """模型不可用时，_extract_gmp_report_data应走兜底提取，并把用户描述的故障记为事件"""
+    conversation = synthetic.generate_conversation(10)
+    faults = [m for m in conversation if m["role"] == "user" and "故障" in m["content"]]
+    data = GMPExtractDataTool(None, None)._extract_gmp_report_data(conversation)
+    described = [e for e in data.get("events", []) if "用户报告故障" in str(e.get("description", ""))]
+    if len(described) != len(faults):
+        print(f"兜底提取异常: 对话中有{len(faults)}条用户故障描述，生成了{len(described)}个事件")
+        return False
+    return True
+
+
+def measure(func: Callable[[], Any], min_time: float, max_iterations: int) -> Dict[str, Any]:
+    """重复调用直到达到最短测量时间或最大迭代次数"""
+    func()  # 预热
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_iterations and (len(samples) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "iterations": len(samples),
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 2),
+        "p50_us": round(percentile(samples, 50) * 1e6, 2),
+        "p95_us": round(percentile(samples, 95) * 1e6, 2),
+        "min_us": round(min(samples) * 1e6, 2),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> int:
+    """与基线结果对比，返回回归用例数"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r["name"], r["param"]): r for r in json.load(f).get("results", [])}
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result["name"], result["param"]))
+        if not previous or not previous.get("p50_us"):
+            result["vs_baseline"] = "new"
+            continue
+        ratio = result["p50_us"] / previous["p50_us"]
+        result["vs_baseline"] = f"{ratio:.2f}x"
+        if ratio > 1 + tolerance:
+            result["vs_baseline"] += " REGRESSION"
+            regressions += 1
+    return regressions
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging("ERROR")
+    if not check_fallback():
+        return 1
+
+    results = []
+    for case in build_cases(args.quick):
+        if args.filter and args.filter not in case["name"]:
+            continue
+        row = {"name": case["name"], "param": case["param"], "input_bytes": case["input_bytes"]}
+        row.update(measure(case["func"], args.min_time, args.max_iterations))
+        results.append(row)
+
+    columns = ["name", "param", "input_bytes", "iterations", "p50_us", "p95_us"]
+    regressions = 0
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        columns.append("vs_baseline")
+    print_table(results, columns)
+
+    if args.output:
+        write_json(args.output, {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "quick": args.quick,
+            },
+            "results": results,
+        })
+        print(f"\n结果已保存到: {args.output}")
+    if regressions:
+        print(f"\n{regressions}个用例相对基线变慢超过{args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 日志开销测量
+
+以相同的调用分别在三种日志配置下运行PDF生成工具，比较每次调用的平均耗时：
+- off:    只记录ERROR，作为基线
+- sync:   原先的同步FileHandler，INFO级别
+- queued: logging_setup的队列+后台写入线程，INFO级别
+每次调用的日志开销 = 该配置的平均耗时 - 基线平均耗时。
+最后用一个很小的队列突发写入日志，验证过载时的丢弃策略。
+
+示例：
+    python -m benchmarks.bench_logging --invocations 200
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import print_table, summarize_latencies, write_json
+from benchmarks.load_test import invoke_once
+from benchmarks.stub_servers import SpringStubServer, build_sample_report
+
+import logging_setup
+from correlation import RequestIdFilter
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+
+LOG_FORMAT = logging_setup.LOG_FORMAT
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='日志开销测量')
+    parser.add_argument('--invocations', type=int, default=100, help='每种日志配置的调用次数（默认: 100）')
+    parser.add_argument('--actions', type=int, default=20, help='报告中的措施条数（默认: 20）')
+    parser.add_argument('--renderer', choices=['spring', 'local'], default='local',
+                        help='PDF渲染方式，local可排除网络抖动（默认: local）')
+    parser.add_argument('--burst', type=int, default=50000, help='过载测试写入的日志条数（默认: 50000）')
+    parser.add_argument('--burst-queue-size', type=int, default=1000, help='过载测试的队列上限（默认: 1000）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def _reset_root() -> None:
+    logging_setup.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    logging.getLogger("bayer_gmp").setLevel(logging.NOTSET)
+
+
+def _configure(mode: str, log_file: str) -> None:
+    _reset_root()
+    root = logging.getLogger()
+    if mode == "off":
+        root.setLevel(logging.ERROR)
+    elif mode == "sync":
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(RequestIdFilter())
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        logging_setup.setup_logging(log_file, level="INFO", console=False)
+
+
+def run_mode(mode: str, params, invocations: int, log_dir: str):
+    """在一种日志配置下顺序调用工具并汇总耗时"""
+    log_file = os.path.join(log_dir, f"{mode}.log")
+    _configure(mode, log_file)
+    factory = lambda: GMPGeneratePDFTool(None, None)
+    invoke_once(factory, params)  # 预热
+
+    latencies = []
+    for _ in range(invocations):
+        elapsed, _success = invoke_once(factory, params)
+        latencies.append(elapsed)
+    _reset_root()
+
+    summary = summarize_latencies(latencies)
+    summary["stage"] = f"logging.{mode}"
+    summary["mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0
+    summary["log_bytes"] = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    return summary
+
+
+def run_burst(count: int, queue_size: int, log_dir: str):
+    """突发写入大量INFO日志，统计入队耗时和丢弃条数"""
+    handler = logging_setup.setup_logging(os.path.join(log_dir, "burst.log"), level="INFO",
+                                          console=False, queue_size=queue_size)
+    logger = logging.getLogger("bayer_gmp")
+    start = time.perf_counter()
+    for i in range(count):
+        logger.info(f"burst line {i}")
+    logger.warning("burst finished")
+    elapsed = time.perf_counter() - start
+    dropped = handler.dropped_total()
+    _reset_root()
+    return {
+        "lines": count,
+        "queue_size": queue_size,
+        "dropped": dropped,
+        "enqueue_us_per_line": round(elapsed / count * 1e6, 3) if count else 0.0,
+    }
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    report_json = json.dumps(build_sample_report(action_count=args.actions), ensure_ascii=False)
+    stages = []
+
+    with tempfile.TemporaryDirectory() as log_dir, SpringStubServer(latency=0) as spring:
+        params = {
+            "report_data": report_json,
+            "renderer": args.renderer,
+            "credentials": {"spring_app_api_key": "bench-key", "spring_app_url": spring.base_url},
+        }
+        for mode in ("off", "sync", "queued"):
+            stages.append(run_mode(mode, params, args.invocations, log_dir))
+        burst = run_burst(args.burst, args.burst_queue_size, log_dir)
+
+    baseline = stages[0]["mean_ms"]
+    for stage in stages:
+        stage["overhead_ms"] = round(stage["mean_ms"] - baseline, 3)
+
+    print_table(stages, ["stage", "count", "mean_ms", "overhead_ms", "p50_ms", "p95_ms", "log_bytes"])
+    print(f"\n过载测试: 写入{burst['lines']}条, 队列上限{burst['queue_size']}, 丢弃{burst['dropped']}条, "
+          f"每条入队耗时{burst['enqueue_us_per_line']}us")
+
+    if args.output:
+        write_json(args.output, {"config": vars(args), "stages": stages, "burst": burst})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
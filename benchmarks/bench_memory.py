@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 大报告的内存峰值测量
+
+构造约--report-mb大小的报告JSON，开启阶段内存高水位跟踪后调用PDF生成工具，
+输出单次调用（tool.generate）和各阶段相对进入时新增的内存峰值：
+- spring.streamed: 超过GMP_STREAM_REPORT_BYTES，走精简路径并以chunked方式发送请求体
+- spring.buffered: 关闭精简路径，请求体整体序列化后发送（对照）
+- local:           本地渲染
+最后检查超过GMP_MAX_REPORT_BYTES的输入会在解析前被拒绝。
+
+Spring替身服务运行在子进程中，避免其解析请求体的内存计入本进程的统计。
+默认路径（spring.streamed）的单次调用峰值超过 --max-ratio × 输入大小、任一阶段峰值超过
+--max-stage-ratio × 输入大小，或没有记录到阶段峰值时以非零状态退出，可作为回归检查；其余用例只作对照。
+
+示例：
+    python -m benchmarks.bench_memory --report-mb 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import configure_benchmark_logging, print_table, write_json
+from benchmarks import synthetic
+
+import memory_guard
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+
+STUB_SCRIPT = (
+    "import sys, time\n"
+    "from benchmarks.stub_servers import SpringStubServer\n"
+    "server = SpringStubServer(latency=0)\n"
+    "print(server.start(), flush=True)\n"
+    "sys.stdin.read()\n"
+    "server.stop()\n"
+)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='大报告的内存峰值测量')
+    parser.add_argument('--report-mb', type=float, default=5.0, help='报告JSON的目标大小，MB（默认: 5）')
+    parser.add_argument('--max-ratio', type=float, default=2.5,
+                        help='spring.streamed单次调用峰值与输入大小之比的上限（默认: 2.5）')
+    parser.add_argument('--max-stage-ratio', type=float, default=1.0,
+                        help='spring.streamed各阶段峰值与输入大小之比的上限（默认: 1.0）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def build_report_json(target_bytes: int) -> str:
+    """按目标大小生成报告JSON字符串"""
+    probe = len(json.dumps(synthetic.generate_report(action_count=100), ensure_ascii=False).encode("utf-8"))
+    actions = max(int(target_bytes / (probe / 100)), 1)
+    return json.dumps(synthetic.generate_report(action_count=actions), ensure_ascii=False)
+
+
+def start_spring_stub() -> subprocess.Popen:
+    """在子进程中启动Spring替身服务，返回进程对象（base_url保存在process.base_url）"""
+    process = subprocess.Popen([sys.executable, "-c", STUB_SCRIPT], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, text=True)
+    process.base_url = process.stdout.readline().strip()
+    return process
+
+
+def run_case(name: str, params, input_bytes: int, stream_threshold: int):
+    """调用一次工具并返回单次调用及各阶段的内存峰值"""
+    memory_guard.STREAM_REPORT_BYTES = stream_threshold
+    memory_guard.reset_stage_peaks()
+    tool = GMPGeneratePDFTool(None, None)
+    start = time.perf_counter()
+    messages = list(tool._invoke(dict(params)))
+    elapsed = time.perf_counter() - start
+
+    result = {}
+    for message in messages:
+        json_object = getattr(getattr(message, "message", None), "json_object", None)
+        if isinstance(json_object, dict):
+            result = json_object
+    peaks = memory_guard.get_stage_peaks()
+    invocation_peak = peaks.pop("tool.generate", 0)
+    return {
+        "case": name,
+        "success": bool(result.get("success")),
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "peak_mb": round(invocation_peak / 1024 / 1024, 2),
+        "peak_ratio": round(invocation_peak / input_bytes, 2) if input_bytes else 0.0,
+        "stages": {stage: round(peak / 1024 / 1024, 2) for stage, peak in sorted(peaks.items())},
+        "message": result.get("message", ""),
+    }
+
+
+def check_stage_peaks(case: Dict[str, Any], input_bytes: int, max_ratio: float) -> List[str]:
+    """检查用例的各阶段峰值不超过max_ratio × 输入大小，返回未通过的说明"""
+    if not case["stages"]:
+        return [f"{case['case']}没有记录到阶段峰值"]
+    limit_mb = input_bytes * max_ratio / 1024 / 1024
+    return [f"{case['case']}的{stage}阶段峰值{peak}MB，超过{limit_mb:.2f}MB"
+            for stage, peak in case["stages"].items() if peak > limit_mb]
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging("ERROR")
+    memory_guard.enable_tracking()
+
+    report_json = build_report_json(int(args.report_mb * 1024 * 1024))
+    input_bytes = len(report_json.encode("utf-8"))
+    print(f"报告JSON大小: {input_bytes / 1024 / 1024:.2f} MB\n")
+
+    stub = start_spring_stub()
+    try:
+        credentials = {"spring_app_api_key": "bench-key", "spring_app_url": stub.base_url}
+        spring_params = {"report_data": report_json, "renderer": "spring", "credentials": credentials}
+        local_params = {"report_data": report_json, "renderer": "local", "credentials": credentials}
+        default_threshold = memory_guard.STREAM_REPORT_BYTES
+        cases = [
+            run_case("spring.streamed", spring_params, input_bytes, default_threshold),
+            run_case("spring.buffered", spring_params, input_bytes, 0),
+            run_case("local", local_params, input_bytes, default_threshold),
+        ]
+        memory_guard.STREAM_REPORT_BYTES = default_threshold
+
+        # 超过上限的输入应在解析前被拒绝
+        memory_guard.MAX_REPORT_BYTES, original_limit = input_bytes - 1, memory_guard.MAX_REPORT_BYTES
+        rejected = run_case("rejected", spring_params, input_bytes, default_threshold)
+        memory_guard.MAX_REPORT_BYTES = original_limit
+        cases.append(rejected)
+    finally:
+        stub.stdin.close()
+        stub.wait(timeout=10)
+
+    print_table(cases, ["case", "success", "elapsed_ms", "peak_mb", "peak_ratio"])
+    print("\n各阶段峰值(MB):")
+    for case in cases:
+        stages = ", ".join(f"{stage}={peak}" for stage, peak in case["stages"].items())
+        print(f"  {case['case']}: {stages or '-'}")
+    print(f"\n拒绝过大输入: {rejected['message']}")
+
+    if args.output:
+        write_json(args.output, {"config": vars(args), "input_bytes": input_bytes, "cases": cases})
+        print(f"\n结果已保存到: {args.output}")
+
+    failures = [case["case"] for case in cases[:3] if not case["success"]]
+    if cases[0]["peak_ratio"] > args.max_ratio:
+        failures.append(f"spring.streamed峰值为输入的{cases[0]['peak_ratio']}倍，超过{args.max_ratio}倍")
+    failures.extend(check_stage_peaks(cases[0], input_bytes, args.max_stage_ratio))
+    if rejected["success"]:
+        failures.append("rejected")
+    if failures:
+        print(f"\n未通过: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - PDF渲染方式吞吐量对比
+
+对比插件内本地渲染与Spring渲染（JSON链接模式和二进制+MinIO上传模式）的吞吐量与延迟。
+Spring路径使用本地替身服务，通过--spring-latency模拟真实网络和渲染耗时。
+
+示例：
+    python -m benchmarks.bench_renderer --invocations 100 --concurrency 4 --spring-latency 0.2
+"""
+import argparse
+import json
+
+from benchmarks.common import configure_benchmark_logging, print_table, write_json
+from benchmarks.load_test import run_stage
+from benchmarks.stub_servers import SpringStubServer, build_sample_report
+
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='PDF渲染方式吞吐量对比')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发调用数（默认: 4）')
+    parser.add_argument('--invocations', type=int, default=50, help='每种渲染方式的调用次数（默认: 50）')
+    parser.add_argument('--spring-latency', type=float, default=0.1,
+                        help='Spring替身服务每个请求的延迟，秒（默认: 0.1）')
+    parser.add_argument('--actions', type=int, default=10, help='报告中的措施条数（默认: 10）')
+    parser.add_argument('--events', type=int, default=5, help='报告中的事件条数（默认: 5）')
+    parser.add_argument('--log-level', default='ERROR', help='工具日志级别（默认: ERROR）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging(args.log_level)
+
+    report_json = json.dumps(build_sample_report(action_count=args.actions, event_count=args.events),
+                             ensure_ascii=False)
+    factory = lambda: GMPGeneratePDFTool(None, None)
+    stages = []
+
+    stage = run_stage("generate", factory, {"report_data": report_json, "renderer": "local"},
+                      args.invocations, args.concurrency)
+    stage["stage"] = "renderer.local"
+    stages.append(stage)
+
+    for pdf_mode in ("json", "binary"):
+        with SpringStubServer(pdf_mode=pdf_mode, latency=args.spring_latency) as spring:
+            params = {
+                "report_data": report_json,
+                "renderer": "spring",
+                "credentials": {"spring_app_api_key": "bench-key", "spring_app_url": spring.base_url},
+            }
+            stage = run_stage("generate", factory, params, args.invocations, args.concurrency)
+            stage["stage"] = f"renderer.spring.{pdf_mode}"
+            stages.append(stage)
+
+    print_table(stages, ["stage", "count", "failures", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms"])
+    if args.output:
+        write_json(args.output, {"config": vars(args), "stages": stages})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 本地报告存储的查找耗时
+
+在临时SQLite数据库中写入--reports份合成报告（每份一条生成结果），测量写入吞吐，
+以及按调查编号、文档编号、编制日期（整日和整月前缀）、对话ID查找的耗时分布，并输出各查找所用的查询计划，
+确认都走了索引。
+
+示例：
+    python -m benchmarks.bench_report_store --reports 10000,100000 --lookups 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import configure_benchmark_logging, print_table, summarize_latencies, write_json
+from benchmarks import synthetic
+
+from report_store import ReportStore, owner_key
+
+# 报告分属的调用方（凭据哈希），查找按调用方过滤
+OWNERS = [owner_key(f"spring-key-{i}") for i in range(4)]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='本地报告存储的查找耗时')
+    parser.add_argument('--reports', default='10000,100000', help='数据库中的报告数，逗号分隔（默认: 10000,100000）')
+    parser.add_argument('--lookups', type=int, default=1000, help='每种查找的次数（默认: 1000）')
+    parser.add_argument('--seed', type=int, default=7, help='随机数种子（默认: 7）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def _report(base: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """以一份合成报告为模板，生成索引字段各不相同的报告"""
+    day = index % 730
+    report = dict(base)
+    report.update({
+        "investigationId": f"INV-{index:07d}",
+        "docId": f"FORM-GMP-{index % 5000:05d}",
+        "preparedDate": f"{2024 + day // 365}-{(day % 365) // 31 % 12 + 1:02d}-{day % 28 + 1:02d}",
+    })
+    return report
+
+
+def measure(count: int, args) -> List[Dict[str, Any]]:
+    """写入count份报告后测量各查找的耗时"""
+    rng = random.Random(args.seed)
+    base = synthetic.generate_report(action_count=10, event_count=3, seed=args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ReportStore(os.path.join(directory, "reports.db"))
+        start = time.perf_counter()
+        for i in range(count):
+            store.save(_report(base, i), {"renderer": "spring", "filename": f"GMP_INV-{i:07d}.pdf",
+                                          "download_url": f"http://minio/gmp-reports/{i}.pdf"},
+                       OWNERS[i % len(OWNERS)], conversation_id=f"conv-{i:07d}")
+        save_seconds = time.perf_counter() - start
+
+        cases = {
+            "investigation_id": lambda i: {"investigation_id": f"INV-{i:07d}"},
+            "doc_id": lambda i: {"doc_id": f"FORM-GMP-{i % 5000:05d}"},
+            "prepared_date": lambda i: {"prepared_date": _report(base, i)["preparedDate"]},
+            "prepared_month": lambda i: {"prepared_date": _report(base, i)["preparedDate"][:7]},
+            "conversation_id": lambda i: {"conversation_id": f"conv-{i:07d}"},
+        }
+        rows = []
+        for name, criteria in cases.items():
+            plan = store._connection().execute(
+                "EXPLAIN QUERY PLAN SELECT 1 FROM reports r JOIN artifacts a ON a.report_id = r.report_id WHERE " +
+                {"investigation_id": "r.investigation_id = 'x'", "doc_id": "r.doc_id = 'x'",
+                 "prepared_date": "r.prepared_date >= 'x' AND r.prepared_date < 'y'",
+                 "prepared_month": "r.prepared_date >= 'x' AND r.prepared_date < 'y'",
+                 "conversation_id": "a.conversation_id = 'x'"}[name] + " AND a.owner = 'o'").fetchall()
+            latencies, matched = [], 0
+            for _ in range(args.lookups):
+                index = rng.randrange(count)
+                params = criteria(index)
+                lookup_start = time.perf_counter()
+                matched += len(store.lookup(OWNERS[index % len(OWNERS)], limit=10, **params))
+                latencies.append(time.perf_counter() - lookup_start)
+            row = summarize_latencies(latencies)
+            row.update({"reports": count, "lookup": name, "avg_results": round(matched / args.lookups, 1),
+                        "index": "; ".join(step[-1] for step in plan)})
+            rows.append(row)
+        store.close()
+    rows.insert(0, {"reports": count, "lookup": "save", "count": count,
+                    "throughput_per_s": round(count / save_seconds, 1)})
+    return rows
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging("ERROR")
+    rows = []
+    for count in args.reports.split(","):
+        if count.strip():
+            rows.extend(measure(int(count), args))
+    print_table(rows, ["reports", "lookup", "count", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms",
+                       "avg_results", "index"])
+    if args.output:
+        write_json(args.output, {"config": vars(args), "results": rows})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
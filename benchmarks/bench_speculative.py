@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 推测渲染对比
+
+optimize_data=true时，对比先优化再渲染（改动前的行为）与推测渲染（优化的同时渲染原始数据）的延迟，
+并统计推测渲染各结果的次数：
+- optimized:     优化在期限内完成，返回优化后的PDF，推测渲染作废（wasted）
+- deadline:      优化超过期限，返回推测渲染的PDF（win）
+- unchanged:     优化未改变数据，直接返回推测渲染的PDF
+- render_failed: 优化后的数据渲染失败，返回推测渲染的PDF
+
+Dify替身服务的/completion-messages模拟LLM优化，--llm-latency为其延迟；
+替身返回的报告改写了summary，无论GMP_OPTIMIZE_MODE为patch还是full，优化结果总会与原始数据不同。
+
+示例：
+    python -m benchmarks.bench_speculative --llm-latency 1.0 --spring-latency 0.2 --deadlines 0.5,5
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import configure_benchmark_logging, print_table, summarize_latencies, write_json
+from benchmarks.stub_servers import DifyStubServer, SpringStubServer, build_sample_report
+
+import tools.gmp_generate_pdf as generate_pdf
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='推测渲染对比')
+    parser.add_argument('--invocations', type=int, default=20, help='每种配置的调用次数（默认: 20）')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发调用数（默认: 4）')
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='LLM优化的延迟，秒（默认: 1.0）')
+    parser.add_argument('--spring-latency', type=float, default=0.2, help='Spring渲染的延迟，秒（默认: 0.2）')
+    parser.add_argument('--deadlines', default='0.5,5',
+                        help='推测渲染的期限，秒，逗号分隔（默认: 0.5,5）')
+    parser.add_argument('--log-level', default='ERROR', help='工具日志级别（默认: ERROR）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def invoke_once(params: Dict[str, Any]) -> tuple:
+    """调用一次PDF生成工具，返回(耗时秒, 是否成功, 推测渲染结果)"""
+    start = time.perf_counter()
+    messages = list(GMPGeneratePDFTool(None, None)._invoke(dict(params)))
+    elapsed = time.perf_counter() - start
+    result: Dict[str, Any] = {}
+    for message in messages:
+        json_object = getattr(message.message, "json_object", None)
+        if isinstance(json_object, dict):
+            result = json_object
+    return elapsed, bool(result.get("success")), result.get("speculative", "-")
+
+
+def run_case(name: str, params: Dict[str, Any], invocations: int, concurrency: int,
+             speculative: bool, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """以给定配置执行一组调用并汇总"""
+    generate_pdf.SPECULATIVE_RENDER = speculative
+    if deadline is not None:
+        generate_pdf.SPECULATIVE_DEADLINE = deadline
+
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 每次调用使用不同的对话ID，避免相同请求被合并
+        futures = [executor.submit(invoke_once, dict(params, conversation_id=f"bench-{name}-{i}"))
+                   for i in range(invocations)]
+        for future in futures:
+            elapsed, success, outcome = future.result()
+            latencies.append(elapsed)
+            failures += 0 if success else 1
+            outcomes[outcome] += 1
+
+    row = summarize_latencies(latencies, time.perf_counter() - start)
+    row.update({"case": name, "failures": failures})
+    if speculative:
+        row["wasted"] = outcomes["optimized"]
+        row["win_rate"] = round((invocations - outcomes["optimized"]) / invocations, 2) if invocations else 0.0
+        row["outcomes"] = dict(outcomes)
+    return row
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging(args.log_level)
+    deadlines = [float(value) for value in args.deadlines.split(",") if value.strip()]
+
+    report = build_sample_report()
+    optimized = dict(report, summary=report["summary"] + "设备已恢复正常运行。")
+    report_json = json.dumps(report, ensure_ascii=False)
+    with DifyStubServer(report=optimized, endpoint_latency={"/completion-messages": args.llm_latency}) as dify, \
+            SpringStubServer(latency=args.spring_latency) as spring:
+        params = {
+            "report_data": report_json,
+            "optimize_data": True,
+            "renderer": "spring",
+            "api_base": dify.base_url,
+            "api_key": "bench-key",
+            "credentials": {"spring_app_api_key": "bench-key", "spring_app_url": spring.base_url},
+        }
+        rows = [run_case("sequential", params, args.invocations, args.concurrency, speculative=False)]
+        for deadline in deadlines:
+            rows.append(run_case(f"speculative@{deadline:g}s", params, args.invocations, args.concurrency,
+                                 speculative=True, deadline=deadline))
+
+    print(f"LLM优化延迟: {args.llm_latency * 1000:.0f}ms，Spring渲染延迟: {args.spring_latency * 1000:.0f}ms\n")
+    print_table(rows, ["case", "count", "failures", "p50_ms", "p95_ms", "wasted", "win_rate"])
+    if args.output:
+        write_json(args.output, {"config": vars(args), "cases": rows})
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 插件冷启动耗时测量
+
+在全新的子进程中重复导入插件的全部模块（与插件进程启动时加载的一致：main.py依赖的配置与日志模块、
+三个工具、提供程序和指标端点），分别统计dify_plugin本身的导入耗时，以及在其之后导入插件自身代码的耗时
+（即插件带来的额外冷启动开销）。dify_plugin的导入耗时波动较大，因此两者在同一进程中分开计时。
+
+同时用 python -X importtime 输出导入剖析：插件自身模块按累计耗时排序，以及全部模块中自身耗时最高的若干项。
+
+示例：
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --runs 10 --output startup.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from benchmarks.common import percentile, print_table, write_json
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLUGIN_MODULES = [
+    "config",
+    "logging_setup",
+    "warmup",
+    "tools.gmp_extract_data",
+    "tools.gmp_generate_pdf",
+    "tools.gmp_preview_report",
+    "provider.bayer_gmp",
+    "endpoints.metrics",
+]
+BASELINE_MODULES = ["dify_plugin"]
+
+# 插件自身的模块名（用于从导入剖析中筛选）
+OWN_PREFIXES = ("tools", "provider", "endpoints", "config", "utils", "http_client", "metrics",
+                "logging_setup", "payload_logging", "profiling", "pdf_renderer", "memory_guard", "correlation",
+                "warmup", "dns_cache", "singleflight", "compaction", "model_router", "hedge",
+                "deadline", "report_store")
+
+TIMING_SCRIPT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "{baseline}\n"
+    "middle = time.perf_counter()\n"
+    "{imports}\n"
+    "print('IMPORT_SECONDS', middle - start, time.perf_counter() - middle, flush=True)\n"
+)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='插件冷启动耗时测量')
+    parser.add_argument('--runs', type=int, default=10, help='每种配置的子进程次数（默认: 10）')
+    parser.add_argument('--top', type=int, default=15, help='导入剖析中列出的模块数（默认: 15）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=ROOT_DIR, capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONPATH=ROOT_DIR))
+
+
+def _summarize(stage: str, samples: List[float]) -> Dict[str, Any]:
+    return {
+        "stage": stage,
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def measure_imports(runs: int) -> List[Dict[str, Any]]:
+    """在新进程中导入runs次，返回dify_plugin和插件模块各自的导入耗时统计(毫秒)"""
+    script = TIMING_SCRIPT.format(baseline="\n".join(f"import {name}" for name in BASELINE_MODULES),
+                                  imports="\n".join(f"import {name}" for name in PLUGIN_MODULES))
+    baseline_samples, plugin_samples = [], []
+    for _ in range(runs):
+        result = _run(["-c", script])
+        if result.returncode != 0:
+            raise RuntimeError(f"导入失败: {result.stderr[-2000:]}")
+        for line in result.stdout.splitlines():
+            if line.startswith("IMPORT_SECONDS"):
+                _, baseline_seconds, plugin_seconds = line.split()
+                baseline_samples.append(float(baseline_seconds))
+                plugin_samples.append(float(plugin_seconds))
+    return [_summarize("dify_plugin", baseline_samples), _summarize("plugin", plugin_samples)]
+
+
+def import_profile(modules: List[str]) -> List[Dict[str, Any]]:
+    """用 -X importtime 获取每个模块的自身和累计导入耗时(微秒)"""
+    result = _run(["-X", "importtime", "-c", "; ".join(f"import {name}" for name in modules)])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return rows
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+
+    startup = measure_imports(args.runs)
+    print_table(startup, ["stage", "runs", "p50_ms", "min_ms", "max_ms"])
+
+    # 先导入dify_plugin，使剖析中插件模块的累计耗时不包含共享依赖
+    profile = import_profile(BASELINE_MODULES + PLUGIN_MODULES)
+    own_modules = [row for row in profile if row["module"].split(".")[0] in OWN_PREFIXES]
+    own_modules.sort(key=lambda row: row["cumulative_us"], reverse=True)
+    print(f"\n插件模块导入剖析（累计耗时前{args.top}）:")
+    print_table(own_modules[:args.top], ["module", "self_us", "cumulative_us"])
+
+    heaviest = sorted(profile, key=lambda row: row["self_us"], reverse=True)[:args.top]
+    print(f"\n全部模块中自身耗时前{args.top}:")
+    print_table(heaviest, ["module", "self_us", "cumulative_us"])
+
+    if args.output:
+        write_json(args.output, {
+            "config": vars(args),
+            "startup": startup,
+            "own_modules": own_modules,
+            "heaviest": heaviest,
+        })
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
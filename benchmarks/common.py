@@ -0,0 +1,58 @@
+"""
+Bayer GMP Reporter - 基准脚本公共函数
+"""
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+# 添加项目根目录到Python路径，使基准脚本可以直接导入工具模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from metrics import percentile  # noqa: E402,F401  基准脚本从这里导入
+
+
+def summarize_latencies(latencies: Sequence[float], wall_time: Optional[float] = None) -> Dict[str, Any]:
+    """汇总一组延迟样本
+
+    Args:
+        latencies: 延迟样本(秒)
+        wall_time: 该阶段的总墙钟时间(秒)，提供时计算吞吐量
+
+    Returns:
+        包含count、吞吐量和p50/p95/p99(毫秒)的字典
+    """
+    summary = {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+    if wall_time:
+        summary["throughput_per_s"] = round(len(latencies) / wall_time, 3)
+    return summary
+
+
+def configure_benchmark_logging(level: str = "ERROR") -> None:
+    """为基准脚本设置日志级别，避免工具的大量INFO日志干扰测量"""
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.ERROR),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger("bayer_gmp").setLevel(getattr(logging, level.upper(), logging.ERROR))
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[str]) -> None:
+    """以简单的对齐表格打印结果"""
+    widths = {col: max([len(col)] + [len(str(row.get(col, ""))) for row in rows]) for col in columns}
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print("  ".join(str(row.get(col, "")).ljust(widths[col]) for col in columns))
+
+
+def write_json(path: str, data: Dict[str, Any]) -> None:
+    """将结果写入JSON文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
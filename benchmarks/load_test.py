@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 离线负载测试
+
+启动Dify和Spring替身服务，以N个并发调用真实的工具类，统计每个阶段的吞吐量和
+p50/p95/p99延迟。阶段包括三个工具的整体调用以及替身服务观察到的各端点耗时。
+
+示例：
+    python -m benchmarks.load_test --concurrency 8 --invocations 200
+    python -m benchmarks.load_test --pdf-mode binary --llm-latency 0.3 --error-rate 0.02
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.common import configure_benchmark_logging, print_table, summarize_latencies, write_json
+from benchmarks.stub_servers import DifyStubServer, SpringStubServer, build_sample_report
+
+import http_client
+import singleflight
+from tools.gmp_extract_data import GMPExtractDataTool
+from tools.gmp_generate_pdf import GMPGeneratePDFTool
+from tools.gmp_preview_report import GMPPreviewReportTool
+
+TOOL_NAMES = ["extract", "preview", "generate"]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Bayer GMP Reporter离线负载测试')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发调用数（默认: 4）')
+    parser.add_argument('--invocations', type=int, default=50, help='每个工具的调用次数（默认: 50）')
+    parser.add_argument('--tools', default=','.join(TOOL_NAMES),
+                        help='要测试的工具，逗号分隔: extract,preview,generate')
+    parser.add_argument('--pdf-mode', choices=['json', 'binary'], default='json',
+                        help='Spring PDF生成接口的响应模式（默认: json）')
+    parser.add_argument('--latency', type=float, default=0.01, help='替身服务的基础延迟，秒（默认: 0.01）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='替身服务的随机抖动上限，秒')
+    parser.add_argument('--llm-latency', type=float, default=None,
+                        help='/completion-messages 的延迟，秒（默认与--latency相同）')
+    parser.add_argument('--spring-latency', type=float, default=None,
+                        help='Spring PDF生成接口的延迟，秒（默认与--latency相同）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='错误注入概率 0-1')
+    parser.add_argument('--messages', type=int, default=10, help='模拟对话的消息条数（默认: 10）')
+    parser.add_argument('--actions', type=int, default=4, help='示例报告的措施条数（默认: 4）')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    parser.add_argument('--spring-limit', type=int, default=None,
+                        help='Spring的进程内并发上限，0为不限制（默认取GMP_SPRING_MAX_CONCURRENCY）')
+    parser.add_argument('--dify-limit', type=int, default=None,
+                        help='Dify的进程内并发上限，0为不限制（默认取GMP_DIFY_MAX_CONCURRENCY）')
+    parser.add_argument('--queue-timeout', type=float, default=None,
+                        help='并发已满时的最长排队时间，秒（默认取GMP_BACKEND_QUEUE_TIMEOUT）')
+    parser.add_argument('--duplicates', type=int, default=1,
+                        help='每个不同请求同时发出的相同副本数，用于观察相同请求合并（默认: 1，即每次调用的对话ID都不同）')
+    parser.add_argument('--log-level', default='ERROR', help='工具日志级别（默认: ERROR）')
+    parser.add_argument('--output', default=None, help='将结果写入JSON文件')
+    return parser.parse_args()
+
+
+def build_invocations(dify_url: str, spring_url: str, report: Dict[str, Any]) -> Dict[str, Tuple[Callable[[], Any], Dict[str, Any]]]:
+    """为每个工具构建 (工具工厂, 调用参数)"""
+    credentials = {"spring_app_api_key": "load-test-key", "spring_app_url": spring_url}
+    dify_context = {"api_base": dify_url, "api_key": "load-test-key", "user_id": "load-test"}
+    report_json = json.dumps(report, ensure_ascii=False)
+    return {
+        "extract": (
+            lambda: GMPExtractDataTool(None, None),
+            {"conversation_id": "load-test-conversation", "context": dify_context},
+        ),
+        "preview": (
+            lambda: GMPPreviewReportTool(None, None),
+            {"report_data": report_json, "credentials": credentials},
+        ),
+        "generate": (
+            lambda: GMPGeneratePDFTool(None, None),
+            {"report_data": report_json, "credentials": credentials,
+             "api_base": dify_url, "api_key": "load-test-key", "user_id": "load-test"},
+        ),
+    }
+
+
+def invoke_once(factory: Callable[[], Any], params: Dict[str, Any]) -> Tuple[float, bool]:
+    """调用一次工具，返回 (耗时秒, 是否成功)"""
+    tool = factory()
+    start = time.perf_counter()
+    messages = list(tool._invoke(dict(params)))
+    elapsed = time.perf_counter() - start
+    success = False
+    for message in messages:
+        json_object = getattr(getattr(message, "message", None), "json_object", None)
+        if isinstance(json_object, dict) and json_object.get("success"):
+            success = True
+    return elapsed, success
+
+
+def vary_params(params: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """为第index个不同请求生成参数：对话ID不同，避免被相同请求合并"""
+    varied = dict(params)
+    base = params.get("conversation_id", "load-test-conversation")
+    varied["conversation_id"] = f"{base}-{index}"
+    return varied
+
+
+def run_stage(name: str, factory: Callable[[], Any], params: Dict[str, Any],
+              invocations: int, concurrency: int, duplicates: int = 1) -> Dict[str, Any]:
+    """以给定并发执行一个阶段并汇总结果；每duplicates个相邻调用的参数相同"""
+    latencies: List[float] = []
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(invoke_once, factory, vary_params(params, i // max(duplicates, 1)))
+                   for i in range(invocations)]
+        for future in futures:
+            try:
+                elapsed, success = future.result()
+                latencies.append(elapsed)
+                failures += 0 if success else 1
+            except Exception:
+                failures += 1
+    wall_time = time.perf_counter() - start
+    summary = summarize_latencies(latencies, wall_time)
+    summary.update({"stage": f"tool.{name}", "failures": failures})
+    return summary
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    configure_benchmark_logging(args.log_level)
+
+    llm_latency = args.llm_latency if args.llm_latency is not None else args.latency
+    spring_latency = args.spring_latency if args.spring_latency is not None else args.latency
+    stub_options = {"latency": args.latency, "jitter": args.jitter,
+                    "error_rate": args.error_rate, "seed": args.seed}
+
+    dify = DifyStubServer(message_count=args.messages,
+                          report=build_sample_report(action_count=args.actions),
+                          endpoint_latency={"/completion-messages": llm_latency}, **stub_options)
+    spring = SpringStubServer(pdf_mode=args.pdf_mode,
+                              endpoint_latency={"/api/pdf/generate": spring_latency}, **stub_options)
+
+    for backend, limit in (("spring", args.spring_limit), ("dify", args.dify_limit)):
+        if limit is not None or args.queue_timeout is not None:
+            current = http_client.get_limiter_stats()[backend]["limit"]
+            http_client.configure_limits(backend, current if limit is None else limit, args.queue_timeout)
+
+    selected = [name.strip() for name in args.tools.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in TOOL_NAMES]
+    if unknown:
+        raise SystemExit(f"Unknown tools: {', '.join(unknown)}")
+
+    results: Dict[str, Any] = {
+        "config": vars(args),
+        "stages": [],
+        "endpoints": [],
+        "compression": {},
+        "limits": [],
+        "singleflight": [],
+    }
+    with dify, spring:
+        invocations = build_invocations(dify.base_url + "/v1", spring.base_url,
+                                        build_sample_report(action_count=args.actions))
+        for name in selected:
+            factory, params = invocations[name]
+            results["stages"].append(run_stage(name, factory, params, args.invocations, args.concurrency,
+                                               args.duplicates))
+
+        for server in (dify, spring):
+            for endpoint, stats in server.stats().items():
+                row = summarize_latencies(stats["latencies"])
+                row.update({"stage": f"{server.name}{endpoint}", "failures": stats["errors"],
+                            "bytes_in": stats["bytes_in"], "bytes_out": stats["bytes_out"],
+                            "max_in_flight": stats["max_in_flight"]})
+                results["endpoints"].append(row)
+        results["compression"] = http_client.get_compression_stats()
+        results["limits"] = list(http_client.get_limiter_stats().values())
+        results["singleflight"] = [dict(counts, group=group) for group, counts in singleflight.get_stats().items()]
+
+    columns = ["stage", "count", "failures", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    print("\n工具调用阶段:")
+    print_table(results["stages"], columns)
+    print("\n替身服务端点（服务端观测）:")
+    print_table(results["endpoints"], columns[:3] + columns[4:] + ["max_in_flight"])
+    print("\n请求/响应压缩（客户端观测，字节）:")
+    print_table([dict(stats, endpoint=endpoint) for endpoint, stats in results["compression"].items()],
+                ["endpoint", "requests", "requests_compressed", "request_bytes_saved", "response_bytes_saved"])
+
+    print("\n后端并发限制与排队（客户端观测）:")
+    print_table(results["limits"], ["backend", "limit", "requests", "queued", "timeouts", "avg_wait_ms", "max_wait_ms"])
+
+    print("\n相同请求合并:")
+    print_table(results["singleflight"], ["group", "leader", "follower", "timeout"])
+
+    if args.output:
+        write_json(args.output, results)
+        print(f"\n结果已保存到: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,446 @@
+"""
+Bayer GMP Reporter - Dify/Spring本地替身服务
+
+在进程内启动轻量HTTP服务，模拟插件依赖的外部接口：
+- Dify: GET /messages, POST /completion-messages
+- Spring: POST /api/pdf/generate (JSON或二进制PDF), POST /api/pdf/upload,
+  POST /api/reports/preview-from-data
+
+每个服务都支持全局及按端点配置的延迟、抖动和错误注入，并记录每个端点的请求统计。
+"""
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# 端点处理函数返回 (状态码, 响应头, 响应体)
+StubResponse = Tuple[int, Dict[str, str], bytes]
+
+# 一个最小但结构完整的PDF文件，供二进制模式返回
+MINIMAL_PDF = (
+    b"%PDF-1.4\n"
+    b"1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n"
+    b"%%EOF\n"
+)
+
+
+def build_sample_report(action_count: int = 4, event_count: int = 2) -> Dict[str, Any]:
+    """构建一份结构完整的示例报告数据
+
+    Args:
+        action_count: 纠正/预防措施的总条数
+        event_count: 事件条数
+
+    Returns:
+        报告数据字典
+    """
+    actions = []
+    for i in range(action_count):
+        if i % 2 == 0:
+            actions.append(f"纠正措施: 更换第{i + 1}号灌装阀门密封圈")
+        else:
+            actions.append(f"预防措施: 增加第{i + 1}号设备的定期维护频率")
+
+    return {
+        "refSop": "GMP-PRD00137",
+        "docId": "FORM-GMP-PRD-F03",
+        "version": "4.0",
+        "title": "无菌灌装线故障调查报告",
+        "investigationId": "PRDINV-2025-04-15",
+        "preparedBy": "王恒辉",
+        "preparedDate": "2025-04-15",
+        "summary": "灌装线FL-301输送带卡住导致批次BLF-2025041201灌装中断约30分钟。",
+        "rootCause": "输送带齿轮缺乏定期润滑和检查导致磨损错位。",
+        "impactAssessment": "仅影响生产效率，不影响产品质量。",
+        "investigation": "使用5Why分析方法进行根本原因调查。",
+        "handling": "更换齿轮并对整条输送系统进行全面检查。",
+        "eventSummary": "所有补救措施已实施，建议正式关闭本次调查。",
+        "events": [
+            {"date": "2025-04-12", "description": f"灌装线输送带卡住故障（记录{i + 1}）"}
+            for i in range(event_count)
+        ],
+        "actions": actions,
+        "reviewers": [{"name": "李明", "date": "2025-04-20"}],
+    }
+
+
+def build_sample_conversation(message_count: int = 10) -> List[Dict[str, Any]]:
+    """构建指定条数的示例对话历史（与Dify /messages接口中插件所用字段一致）
+
+    Args:
+        message_count: 消息条数
+
+    Returns:
+        消息列表
+    """
+    user_lines = [
+        "我需要记录一起无菌灌装线故障事件，灌装线FL-301在2025年4月12日发生输送带卡住故障。",
+        "参考SOP是GMP-PRD00137，文档ID是FORM-GMP-PRD-F03，版本4.0。",
+        "经过排查，发现是输送带齿轮磨损导致的错位，维修团队更换了齿轮。",
+        "为防止类似问题，我们增加了齿轮检查和润滑的频率，并开展了SOP培训。",
+    ]
+    assistant_lines = [
+        "您好，我是拜耳GMP报告生成助手，请问有什么可以帮助您的？",
+        "已记录。请问这次故障对产品质量有没有影响？",
+        "好的。请问采取了哪些纠正和预防措施？",
+    ]
+    messages = []
+    for i in range(message_count):
+        if i % 2 == 0:
+            messages.append({"id": str(i), "role": "assistant",
+                             "content": assistant_lines[(i // 2) % len(assistant_lines)]})
+        else:
+            messages.append({"id": str(i), "role": "user",
+                             "content": user_lines[(i // 2) % len(user_lines)]})
+    return messages
+
+
+class _EndpointStats:
+    """单个端点的请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latencies: List[float] = []
+
+
+class StubServer:
+    """可注入延迟和错误的进程内HTTP替身服务基类"""
+
+    name = "stub"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0,
+                 endpoint_latency: Optional[Dict[str, float]] = None,
+                 endpoint_error_rate: Optional[Dict[str, float]] = None,
+                 accept_compressed_requests: bool = True, compress_responses: bool = True,
+                 seed: Optional[int] = None):
+        """初始化替身服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency: 每个请求的基础延迟(秒)
+            jitter: 在基础延迟上叠加的随机抖动上限(秒)
+            tail_rate: 请求落入长尾的概率(0-1)
+            tail_latency: 长尾请求额外的延迟(秒)
+            error_rate: 返回错误响应的概率(0-1)
+            error_status: 注入错误时使用的HTTP状态码
+            endpoint_latency: 按端点覆盖的基础延迟，键为端点后缀（如"/completion-messages"）
+            endpoint_error_rate: 按端点覆盖的错误概率
+            accept_compressed_requests: 是否接受gzip/deflate压缩的请求体，否则返回415
+            compress_responses: 客户端声明Accept-Encoding时是否gzip压缩响应
+            seed: 随机数种子，便于复现
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.endpoint_latency = endpoint_latency or {}
+        self.endpoint_error_rate = endpoint_error_rate or {}
+        self.accept_compressed_requests = accept_compressed_requests
+        self.compress_responses = compress_responses
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._stats: Dict[str, _EndpointStats] = {}
+        self._stats_lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        # (方法, 路径后缀) -> 处理函数
+        self.routes: Dict[Tuple[str, str], Callable[..., StubResponse]] = {}
+
+    @property
+    def base_url(self) -> str:
+        """服务的基础URL"""
+        if not self._server:
+            raise RuntimeError(f"{self.name} stub server is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """在后台线程中启动服务
+
+        Returns:
+            服务的基础URL
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写出，开启Nagle时复用的连接上每个响应会被延迟确认卡住约40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def log_message(self, format, *args):
+                # 替身服务不输出访问日志，避免干扰测量
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name=f"{self.name}-stub", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        """停止服务"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回每个端点的请求统计快照"""
+        with self._stats_lock:
+            return {
+                endpoint: {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "bytes_in": s.bytes_in,
+                    "bytes_out": s.bytes_out,
+                    "max_in_flight": s.max_in_flight,
+                    "latencies": list(s.latencies),
+                }
+                for endpoint, s in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        """清空统计数据"""
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _match_route(self, method: str, path: str) -> Tuple[Optional[str], Optional[Callable[..., StubResponse]]]:
+        """按路径后缀匹配路由，允许Dify风格的/v1等前缀"""
+        for (route_method, suffix), handler in self.routes.items():
+            if route_method == method and path.endswith(suffix):
+                return suffix, handler
+        return None, None
+
+    @staticmethod
+    def _read_chunked(request: BaseHTTPRequestHandler) -> bytes:
+        """读取分块传输编码的请求体"""
+        chunks = []
+        while True:
+            size = int(request.rfile.readline().split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过可能的trailer直到空行
+                while request.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(request.rfile.read(size))
+            request.rfile.readline()
+
+    def _track_in_flight(self, endpoint: str, delta: int) -> None:
+        """记录端点同时处理中的请求数及其峰值"""
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, _EndpointStats())
+            stats.in_flight += delta
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+
+    def _sample(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    def _dispatch(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        """处理单个请求：读取请求体、注入延迟/错误、调用端点处理函数并写回响应"""
+        start = time.perf_counter()
+        parsed = urlparse(request.path)
+        endpoint, handler = self._match_route(method, parsed.path)
+
+        if "chunked" in (request.headers.get("Transfer-Encoding") or "").lower():
+            wire_body = self._read_chunked(request)
+        else:
+            length = int(request.headers.get("Content-Length") or 0)
+            wire_body = request.rfile.read(length) if length else b""
+        body = wire_body
+        content_encoding = (request.headers.get("Content-Encoding") or "").lower()
+
+        if content_encoding == "gzip" and self.accept_compressed_requests:
+            body = gzip.decompress(wire_body)
+        elif content_encoding == "deflate" and self.accept_compressed_requests:
+            body = zlib.decompress(wire_body)
+
+        if content_encoding and not self.accept_compressed_requests:
+            status, headers, payload = 415, {"Content-Type": "application/json"}, \
+                json.dumps({"message": "compressed request bodies are not supported"}).encode("utf-8")
+            injected_error = True
+        elif handler is None:
+            status, headers, payload = 404, {"Content-Type": "application/json"}, \
+                json.dumps({"message": f"No route for {method} {parsed.path}"}).encode("utf-8")
+            endpoint = parsed.path
+            injected_error = True
+        else:
+            self._track_in_flight(endpoint, 1)
+            try:
+                delay = self.endpoint_latency.get(endpoint, self.latency)
+                if self.jitter:
+                    delay += self._sample() * self.jitter
+                if self.tail_rate and self._sample() < self.tail_rate:
+                    delay += self.tail_latency
+                if delay > 0:
+                    time.sleep(delay)
+
+                error_rate = self.endpoint_error_rate.get(endpoint, self.error_rate)
+                injected_error = error_rate > 0 and self._sample() < error_rate
+                if injected_error:
+                    status, headers, payload = self.error_status, {"Content-Type": "application/json"}, \
+                        json.dumps({"message": "injected error"}).encode("utf-8")
+                else:
+                    try:
+                        status, headers, payload = handler(request, parsed, body)
+                    except Exception as e:
+                        injected_error = True
+                        status, headers, payload = 500, {"Content-Type": "application/json"}, \
+                            json.dumps({"message": f"stub handler error: {str(e)}"}).encode("utf-8")
+            finally:
+                self._track_in_flight(endpoint, -1)
+
+        accept_encoding = request.headers.get("Accept-Encoding") or ""
+        if self.compress_responses and "gzip" in accept_encoding and len(payload) >= 256 and status == 200:
+            payload = gzip.compress(payload)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+
+        request.send_response(status)
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, _EndpointStats())
+            stats.requests += 1
+            stats.errors += 1 if (injected_error or status >= 400) else 0
+            stats.bytes_in += len(wire_body)
+            stats.bytes_out += len(payload)
+            stats.latencies.append(time.perf_counter() - start)
+
+
+class DifyStubServer(StubServer):
+    """Dify API替身服务：/messages 与 /completion-messages"""
+
+    name = "dify"
+
+    def __init__(self, message_count: int = 10, report: Optional[Dict[str, Any]] = None, **kwargs):
+        """初始化Dify替身服务
+
+        Args:
+            message_count: /messages 返回的消息条数
+            report: /completion-messages 返回的报告JSON，默认使用示例报告
+            **kwargs: 传递给StubServer的延迟与错误注入参数
+        """
+        super().__init__(**kwargs)
+        self.messages = build_sample_conversation(message_count)
+        self.report = report or build_sample_report()
+        self.routes[("GET", "/messages")] = self._handle_messages
+        self.routes[("POST", "/completion-messages")] = self._handle_completion
+
+    def _handle_messages(self, request, parsed, body) -> StubResponse:
+        query = parse_qs(parsed.query)
+        if not query.get("conversation_id"):
+            return 400, {"Content-Type": "application/json"}, \
+                json.dumps({"message": "conversation_id is required"}).encode("utf-8")
+        payload = {"limit": len(self.messages), "has_more": False, "data": self.messages}
+        return 200, {"Content-Type": "application/json"}, \
+            json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _handle_completion(self, request, parsed, body) -> StubResponse:
+        payload = {
+            "message_id": str(uuid.uuid4()),
+            "mode": "completion",
+            "answer": "```json\n" + json.dumps(self.report, ensure_ascii=False) + "\n```",
+        }
+        return 200, {"Content-Type": "application/json"}, \
+            json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+class SpringStubServer(StubServer):
+    """Spring PDF服务替身：PDF生成、MinIO上传和HTML预览"""
+
+    name = "spring"
+
+    def __init__(self, pdf_mode: str = "json", pdf_bytes: bytes = MINIMAL_PDF, etags: bool = True, **kwargs):
+        """初始化Spring替身服务
+
+        Args:
+            pdf_mode: /api/pdf/generate 的响应模式，"json" 返回MinIO链接，"binary" 返回PDF二进制
+            pdf_bytes: 二进制模式下返回的PDF内容
+            etags: 预览接口是否返回ETag并支持If-None-Match条件请求
+            **kwargs: 传递给StubServer的延迟与错误注入参数
+        """
+        super().__init__(**kwargs)
+        if pdf_mode not in ("json", "binary"):
+            raise ValueError("pdf_mode must be 'json' or 'binary'")
+        self.pdf_mode = pdf_mode
+        self.pdf_bytes = pdf_bytes
+        self.etags = etags
+        self.routes[("POST", "/api/pdf/generate")] = self._handle_generate
+        self.routes[("POST", "/api/pdf/upload")] = self._handle_upload
+        self.routes[("POST", "/api/reports/preview-from-data")] = self._handle_preview
+
+    def _minio_url(self, filename: str) -> str:
+        return f"{self.base_url}/minio/gmp-reports/{uuid.uuid4().hex}/{filename}"
+
+    def _handle_generate(self, request, parsed, body) -> StubResponse:
+        report = json.loads(body or b"{}")
+        filename = f"GMP_{report.get('investigationId', 'report')}.pdf"
+        if self.pdf_mode == "binary":
+            return 200, {"Content-Type": "application/pdf"}, self.pdf_bytes
+        payload = {"success": True, "minio_url": self._minio_url(filename), "filename": filename}
+        return 200, {"Content-Type": "application/json"}, \
+            json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    def _handle_upload(self, request, parsed, body) -> StubResponse:
+        if b"%PDF-" not in body:
+            return 400, {"Content-Type": "application/json"}, \
+                json.dumps({"message": "upload does not contain a PDF"}).encode("utf-8")
+        payload = {"success": True, "minio_url": self._minio_url("upload.pdf")}
+        return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode("utf-8")
+
+    def _handle_preview(self, request, parsed, body) -> StubResponse:
+        report = json.loads(body or b"{}")
+        rows = "".join(
+            f"<tr><th>{key}</th><td>{value}</td></tr>"
+            for key, value in report.items() if isinstance(value, str)
+        )
+        html = f"<html><body><h1>{report.get('title', 'GMP调查报告')}</h1><table>{rows}</table></body></html>"
+        if not self.etags:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, html.encode("utf-8")
+        etag = '"' + hashlib.sha256(html.encode("utf-8")).hexdigest()[:32] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "text/html; charset=utf-8", "ETag": etag}, html.encode("utf-8")
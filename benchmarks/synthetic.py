@@ -0,0 +1,178 @@
+"""
+Bayer GMP Reporter - 合成测试数据
+
+为基准脚本生成可复现的输入：任意长度的对话、带噪声的LLM输出、含大量措施的报告、
+Markdown表格形式的助手回复，以及嵌入JSON的conversation_id。
+"""
+import json
+import random
+from typing import Any, Dict, List
+
+from benchmarks.stub_servers import build_sample_report
+
+_USER_PHRASES = [
+    "灌装线FL-301在{date}发生输送带卡住故障，批次{batch}灌装中断约{minutes}分钟。",
+    "维修团队排查后发现第{n}号齿轮磨损导致错位，已更换并重新校准。",
+    "受影响的批次{batch}已隔离，质检部门正在进行全检，暂未发现质量偏差。",
+    "我们计划把齿轮润滑频率从每月一次提高到每周一次，并开展SOP培训。",
+    "参考SOP是GMP-PRD00137，文档ID是FORM-GMP-PRD-F03，版本4.0，调查ID为PRDINV-{date}。",
+]
+_ASSISTANT_PHRASES = [
+    "已记录。请问这次故障对产品质量有没有影响？",
+    "好的。请问采取了哪些纠正和预防措施？是否确定了根本原因？",
+    "明白了，请补充事件发生的具体时间和涉及的批次号。",
+    "收到，我会把这些信息整理到调查报告的相应章节中。",
+]
+_PROSE = [
+    "根据对话内容，我整理了GMP调查报告所需的关键信息。",
+    "以下是提取结果，部分字段根据上下文推断，请核对。",
+    "注意：若有遗漏，请在后续对话中补充。",
+]
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    return template.format(
+        date=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        batch=f"BLF-2025{rng.randint(100000, 999999)}",
+        minutes=rng.randint(5, 120),
+        n=rng.randint(1, 40),
+    )
+
+
+def generate_report(action_count: int = 100, event_count: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """生成含大量措施的报告，措施混合前缀形式、纯文本和分列字段
+
+    Args:
+        action_count: 措施条数
+        event_count: 事件条数
+        seed: 随机数种子
+
+    Returns:
+        报告数据字典
+    """
+    rng = random.Random(seed)
+    report = build_sample_report(action_count=action_count, event_count=event_count)
+    corrective, preventive = [], []
+    for i in range(action_count):
+        text = f"第{i + 1}项：{_fill(rng.choice(_USER_PHRASES), rng)}"
+        (corrective if i % 3 == 0 else preventive).append(
+            text if i % 2 else f"{'纠正措施' if i % 3 == 0 else '预防措施'}: {text}")
+    report["correctiveActions"] = corrective
+    report["preventiveActions"] = preventive
+    return report
+
+
+def generate_conversation(message_count: int, with_table: bool = False, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成指定条数的对话历史
+
+    Args:
+        message_count: 消息条数
+        with_table: 最后一条助手消息是否为Markdown表格形式的报告数据
+        seed: 随机数种子
+
+    Returns:
+        消息列表，字段与Dify /messages接口一致
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(message_count):
+        role = "assistant" if i % 2 == 0 else "user"
+        phrases = _ASSISTANT_PHRASES if role == "assistant" else _USER_PHRASES
+        content = " ".join(_fill(rng.choice(phrases), rng) for _ in range(rng.randint(1, 3)))
+        messages.append({"id": str(i), "role": role, "content": content})
+    if with_table and messages:
+        messages.append({"id": str(message_count), "role": "assistant",
+                         "content": generate_markdown_table(seed=seed)})
+    return messages
+
+
+def generate_markdown_table(extra_rows: int = 20, seed: int = 0) -> str:
+    """生成助手以Markdown表格返回的GMP报告数据
+
+    Args:
+        extra_rows: 在关键字段之外附加的无关行数
+        seed: 随机数种子
+
+    Returns:
+        Markdown文本
+    """
+    rng = random.Random(seed)
+    rows = [
+        ("参考SOP编号", "GMP-PRD00137"),
+        ("文档ID", "FORM-GMP-PRD-F03"),
+        ("版本号", "4.0"),
+        ("报告标题", "无菌灌装线故障调查报告"),
+        ("调查ID", "PRDINV-2025-04-15"),
+        ("准备人员", "王恒辉"),
+        ("准备日期", "2025-04-15"),
+        ("故障时间", "2025-04-12 09:30"),
+        ("故障现象", "输送带卡住导致灌装中断"),
+        ("根本原因", "输送带齿轮缺乏润滑导致磨损错位"),
+        ("影响评估", "仅影响生产效率，不影响产品质量"),
+        ("纠正措施", "更换齿轮并全面检查输送系统"),
+        ("预防措施", "<br>".join(f"{i + 1}. 措施{i + 1}" for i in range(5))),
+        ("结论", "所有补救措施已实施，建议关闭调查"),
+    ]
+    for i in range(extra_rows):
+        rows.append((f"备注{i + 1}", _fill(rng.choice(_USER_PHRASES), rng)))
+    lines = ["以下是整理的GMP报告数据表格：", "", "| 字段 | 内容 |", "| --- | --- |"]
+    lines.extend(f"| {name} | {value} |" for name, value in rows)
+    return "\n".join(lines)
+
+
+def generate_llm_output(action_count: int = 20, noise: str = "fenced", seed: int = 0) -> str:
+    """生成带噪声的LLM输出
+
+    Args:
+        action_count: 报告中的措施条数，决定JSON大小
+        noise: 噪声类型
+            - clean: 纯JSON
+            - fenced: 说明文字 + ```json代码块 + 结尾说明
+            - prose: 说明文字中夹杂多个花括号片段，真正的JSON在最后
+            - truncated: 缺少结尾引号和花括号的JSON（需要修复）
+        seed: 随机数种子
+
+    Returns:
+        LLM输出文本
+    """
+    rng = random.Random(seed)
+    body = json.dumps(generate_report(action_count=action_count, seed=seed), ensure_ascii=False, indent=2)
+    if noise == "clean":
+        return body
+    if noise == "fenced":
+        return f"{rng.choice(_PROSE)}\n\n```json\n{body}\n```\n\n{rng.choice(_PROSE)}"
+    if noise == "prose":
+        decoys = " ".join(f"字段{{{i}}}示例{{未填写}}" for i in range(action_count))
+        return f"{rng.choice(_PROSE)} {decoys}\n{body}\n{rng.choice(_PROSE)}"
+    if noise == "truncated":
+        cut = body.rfind('"', 0, len(body) - 20)
+        return body[:cut + 10]
+    raise ValueError(f"Unknown noise type: {noise}")
+
+
+def generate_conversation_id_payload(action_count: int = 20, style: str = "marker", seed: int = 0) -> str:
+    """生成嵌入报告JSON的conversation_id参数
+
+    Args:
+        action_count: 报告中的措施条数
+        style: marker（"conv-id json: {...}"）或 python（单引号字典形式，走ast解析）
+        seed: 随机数种子
+
+    Returns:
+        conversation_id字符串
+    """
+    report = generate_report(action_count=action_count, seed=seed)
+    embedded = {
+        "基础文档信息": {key: report[key] for key in ("refSop", "docId", "version", "title",
+                                                   "investigationId", "preparedBy", "preparedDate")},
+        "根本原因分析": {"rootCause": report["rootCause"]},
+        "CAPA措施": {"correctiveActions": report["correctiveActions"],
+                    "preventiveActions": report["preventiveActions"]},
+        "结论和签名信息": {"conclusion": report["eventSummary"], "events": report["events"],
+                    "reviewers": report["reviewers"]},
+    }
+    if style == "python":
+        return repr(embedded)
+    if style == "marker":
+        return f"conv-{seed:08d} json: {json.dumps(embedded, ensure_ascii=False)}"
+    raise ValueError(f"Unknown style: {style}")
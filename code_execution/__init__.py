@@ -0,0 +1,5 @@
+"""
+Bayer GMP Reporter - 命令行流水线
+
+供gmp_workflow.py在插件进程之外直接调用工具生成报告，不会随插件工具一起被加载。
+"""
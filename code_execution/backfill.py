@@ -0,0 +1,311 @@
+"""
+Bayer GMP Reporter - 离线回填
+
+为已从Dify导出的历史对话批量重建报告，不调用Dify的/messages接口：
+- 输入为JSONL文件（或包含JSONL文件的目录），每行一个对话：
+  {"conversation_id": "...", "messages": [{"role": "user", "content": "..."}, ...]}，
+  消息也可以是Dify /messages接口的原始记录（query/answer字段）
+- 进程池中的工作进程依次执行数据提取和规范化、PDF渲染（默认本地渲染），
+  每完成一个对话立即写入报告JSON和PDF（先写临时文件再改名，中断时不会留下不完整的文件）
+- 每完成一个对话在检查点文件（JSONL）中追加一行结果；再次运行时跳过检查点中已成功的对话，
+  失败的对话会重新处理
+- 对话中没有助手整理的报告数据表格时，只有提供了API密钥才调用模型提取；否则（或模型提取失败时）
+  只能得到默认内容，这样的对话记为失败，不写报告文件、不保存到本地报告存储，再次运行时会重新处理
+
+主进程只读取输入、分发任务和写检查点，不导入工具模块（与workflow_integration的进程池模式相同）。
+同时在处理中的对话数限制为并发数的两倍，输入文件再大也不会一次读入内存。
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import config  # noqa: F401  加载.env
+
+from correlation import request_scope
+from code_execution.workflow_integration import _collect
+from metrics import percentile
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+
+def _load_tools() -> tuple:
+    """导入数据提取接口和PDF生成工具（只在工作进程中调用）"""
+    from tools.gmp_extract_data import extract_report_from_history
+    from tools.gmp_generate_pdf import GMPGeneratePDFTool
+    return extract_report_from_history, GMPGeneratePDFTool
+
+
+def _input_files(paths: List[str]) -> List[str]:
+    """展开输入路径：目录取其中的*.jsonl文件（按文件名排序）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".jsonl"))
+        else:
+            files.append(path)
+    return files
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """将Dify /messages接口的原始记录（query/answer）拆成role/content形式的消息"""
+    normalized = []
+    for message in messages:
+        if "role" in message:
+            normalized.append(message)
+            continue
+        if message.get("query"):
+            normalized.append({"id": message.get("id"), "role": "user", "content": message["query"]})
+        if message.get("answer"):
+            normalized.append({"id": message.get("id"), "role": "assistant", "content": message["answer"]})
+    return normalized
+
+
+def read_conversations(paths: List[str]) -> Iterator[Tuple[Optional[str], Any]]:
+    """逐行读取导出的对话
+
+    Yields:
+        (对话ID, 消息列表)；无法解析的行为 (None, 错误说明)
+    """
+    for path in _input_files(paths):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    conversation_id = str(record["conversation_id"])
+                    messages = record["messages"]
+                    if not isinstance(messages, list):
+                        raise ValueError("messages不是列表")
+                except Exception as e:
+                    yield None, f"{path}:{line_no}: {str(e)}"
+                    continue
+                yield conversation_id, _normalize_messages(messages)
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """读取检查点中已成功的对话ID；最后一行可能因中断而不完整，忽略无法解析的行"""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("success"):
+                done.add(entry["conversation_id"])
+            else:
+                done.discard(entry.get("conversation_id"))
+    return done
+
+
+def _safe_name(conversation_id: str) -> str:
+    """对话ID中不能用作文件名的字符替换为下划线"""
+    return re.sub(r"[^\w.-]", "_", conversation_id)[:120] or "conversation"
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    """先写临时文件再改名，中断时不会留下不完整的文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def backfill_conversation(conversation_id: str, messages: List[Dict[str, Any]], out_dir: str,
+                          context: Dict[str, Any], renderer: Optional[str] = "local") -> Dict[str, Any]:
+    """为一个导出的对话重建报告：提取和规范化数据，写入报告JSON，渲染并写入PDF
+
+    Args:
+        conversation_id: 对话ID
+        messages: 对话消息列表
+        out_dir: 输出目录，报告JSON写入其中的json/，PDF写入pdf/
+        context: Dify上下文（api_base、api_key、user_id），对话中没有报告数据表格时用于调用模型；
+            没有api_key时不调用模型
+        renderer: PDF渲染方式，为None时不生成PDF
+
+    Returns:
+        结果字典，包含success、message、conversation_id、request_id、elapsed_ms、json_path、pdf_path
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"success": False, "conversation_id": conversation_id}
+    try:
+        extract_report_from_history, GMPGeneratePDFTool = _load_tools()
+        with request_scope("gmp_backfill") as scope:
+            result["request_id"] = scope.request_id
+            extracted = extract_report_from_history(messages, context)
+            report_data = extracted.get("report_data")
+            if not extracted.get("success") or not report_data:
+                result["message"] = extracted.get("message") or "未能从对话中提取报告数据"
+                return result
+            if extracted.get("fallback"):
+                # 默认内容不是这个对话的报告，不写出也不保存，留待提供API密钥后重新处理
+                result["fallback"] = True
+                result["message"] = "对话中没有报告数据表格，模型提取失败，只得到默认内容，未生成报告" \
+                    if context.get("api_key") else "对话中没有报告数据表格且未提供API密钥，未生成报告"
+                return result
+
+            name = _safe_name(conversation_id)
+            json_path = os.path.join(out_dir, "json", f"{name}.json")
+            _write_atomic(json_path, json.dumps(report_data, ensure_ascii=False, indent=2).encode("utf-8"))
+            result["json_path"] = json_path
+
+            if renderer is None:
+                result.update(success=True, message="成功提取报告数据")
+                return result
+
+            # 传入对话ID，本地报告存储按对话记录生成结果
+            generate_params = dict(context, report_data=report_data, optimize_data=False, renderer=renderer,
+                                   conversation_id=conversation_id)
+            generated, blobs = _collect(GMPGeneratePDFTool(None, None)._invoke(generate_params))
+            generated.pop("request_id", None)
+            result.update(generated)
+            result.setdefault("message", "PDF生成失败")
+            for blob, _ in blobs:
+                pdf_path = os.path.join(out_dir, "pdf", f"{name}.pdf")
+                _write_atomic(pdf_path, blob)
+                result["pdf_path"] = pdf_path
+    except Exception as e:
+        logger.error(f"Backfill for conversation {conversation_id} failed: {str(e)}")
+        result["success"] = False
+        result["message"] = f"回填失败: {str(e)}"
+    finally:
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def _init_worker(log_file: Optional[str]) -> None:
+    """工作进程的初始化：忽略Ctrl+C（由主进程决定如何停止），导入工具模块，各进程写入自己的日志文件"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _load_tools()
+    from logging_setup import setup_logging
+
+    if log_file:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.worker{os.getpid()}{ext}"
+    setup_logging(log_file, console=False)
+
+
+def run_backfill(paths: List[str], out_dir: str, workers: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None, restart: bool = False,
+                 renderer: Optional[str] = "local", log_file: Optional[str] = None,
+                 **context) -> Dict[str, Any]:
+    """用进程池为导出的对话批量重建报告，中断后再次运行从检查点继续
+
+    Args:
+        paths: 输入的JSONL文件或目录
+        out_dir: 输出目录
+        workers: 工作进程数，默认CPU核数
+        checkpoint_path: 检查点文件，默认为输出目录下的checkpoint.jsonl
+        restart: 忽略已有的检查点，全部重新处理
+        renderer: PDF渲染方式，为None时只写报告JSON
+        log_file: 主进程的日志文件，工作进程在其旁边写各自的日志
+        **context: Dify上下文（api_base、api_key、user_id）
+
+    Returns:
+        汇总：total、succeeded、failed、skipped（检查点中已完成）、invalid（无法解析的行）、
+        interrupted、wall_seconds、throughput_per_s和单个对话耗时的p50/p95/max
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    checkpoint_path = checkpoint_path or os.path.join(out_dir, CHECKPOINT_FILE)
+    for sub_dir in ("json", "pdf") if renderer else ("json",):
+        os.makedirs(os.path.join(out_dir, sub_dir), exist_ok=True)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        logger.info(f"检查点中已完成{len(done)}个对话，将跳过")
+
+    latencies: List[float] = []
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "invalid": 0}
+    interrupted = False
+    seen: Set[str] = set()
+    start = time.perf_counter()
+    # 工作进程以spawn方式启动，不继承主进程的模块和连接状态
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(log_file,))
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        pending: Dict[Any, str] = {}
+
+        def record(future) -> None:
+            conversation_id = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # 工作进程异常退出等情况
+                result = {"success": False, "conversation_id": conversation_id, "message": f"回填失败: {str(e)}"}
+            checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            counts["succeeded" if result.get("success") else "failed"] += 1
+            if "elapsed_ms" in result:
+                latencies.append(result["elapsed_ms"])
+            logger.info(f"[{counts['succeeded'] + counts['failed']}] {conversation_id}: "
+                        f"{'成功' if result.get('success') else '失败'} {result.get('message', '')}")
+
+        try:
+            for conversation_id, messages in read_conversations(paths):
+                if conversation_id is None:
+                    logger.warning(f"跳过无法解析的行 {messages}")
+                    counts["invalid"] += 1
+                    continue
+                if conversation_id in done or conversation_id in seen:
+                    counts["skipped"] += 1
+                    continue
+                seen.add(conversation_id)
+                # 处理中的对话数达到上限时，等待有对话完成后再读取下一个
+                while len(pending) >= workers * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(future)
+                future = executor.submit(backfill_conversation, conversation_id, messages, out_dir,
+                                         context, renderer)
+                pending[future] = conversation_id
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(future)
+        except KeyboardInterrupt:
+            # 不再分发新的对话，等待正在处理的对话完成并写入检查点，下次运行从这里继续
+            interrupted = True
+            logger.warning(f"回填被中断，等待{len(pending)}个处理中的对话完成")
+            for future in list(pending):
+                if future.cancel():
+                    pending.pop(future)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(future)
+        finally:
+            executor.shutdown(wait=True)
+
+    wall_seconds = time.perf_counter() - start
+    processed = counts["succeeded"] + counts["failed"]
+    return dict(counts, **{
+        "total": processed,
+        "interrupted": interrupted,
+        "workers": workers,
+        "checkpoint": checkpoint_path,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(processed / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+    })
@@ -0,0 +1,228 @@
+"""
+Bayer GMP Reporter - 进程内报告生成流水线
+
+在本进程内依次调用数据提取接口（extract_report）和PDF生成工具（可选的数据优化由PDF生成工具完成），
+不经过Dify工作流：
+- integrate_workflow: 为单个对话生成报告，返回结果字典
+- run_batch: 用线程池或进程池并发处理多个对话，结果按完成顺序逐行写入JSONL，返回吞吐汇总
+
+导入dify_plugin（工具模块依赖它）会执行gevent的monkey.patch_all，线程池中的线程实际是协程：
+以等待Dify和Spring为主时线程池即可；本地渲染等CPU密集的场景使用进程池才能利用多核。
+进程池模式下主进程不导入工具模块（gevent替换后的线程和管道无法驱动进程池），
+每个工作进程各自导入工具模块、建立连接并写入自己的日志文件。
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional
+
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import config  # noqa: F401  加载.env
+
+from correlation import request_scope
+from metrics import percentile
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+POOL_TYPES = ("thread", "process")
+
+
+def _load_tools() -> tuple:
+    """导入数据提取接口和PDF生成工具
+
+    导入时dify_plugin会执行gevent的monkey.patch_all，必须在主线程中、创建线程池之前完成。
+    """
+    from tools.gmp_extract_data import extract_report
+    from tools.gmp_generate_pdf import GMPGeneratePDFTool
+    return extract_report, GMPGeneratePDFTool
+
+
+def _collect(messages: Iterable[Any]) -> tuple:
+    """从工具消息中取出最后一个JSON结果和所有二进制内容
+
+    Returns:
+        tuple: (JSON结果字典, [(二进制内容, meta)])
+    """
+    result: Dict[str, Any] = {}
+    blobs = []
+    for message in messages:
+        payload = getattr(message, "message", None)
+        json_object = getattr(payload, "json_object", None)
+        if isinstance(json_object, dict):
+            result = json_object
+        blob = getattr(payload, "blob", None)
+        if blob is not None:
+            blobs.append((blob, getattr(message, "meta", None) or {}))
+    return result, blobs
+
+
+def integrate_workflow(conversation_id: str, api_base: str, api_key: str, user_id: str = "plugin-user",
+                       optimize_data: bool = False, spring_app_url: Optional[str] = None,
+                       spring_app_api_key: Optional[str] = None, renderer: Optional[str] = None,
+                       pdf_dir: Optional[str] = None) -> Dict[str, Any]:
+    """为单个对话生成GMP报告：提取数据 ->（可选）优化 -> 生成PDF
+
+    Args:
+        conversation_id: Dify对话ID
+        api_base: Dify API基础URL
+        api_key: Dify API密钥
+        user_id: 用户ID
+        optimize_data: 是否使用Dify模型优化报告数据
+        spring_app_url: Spring服务URL，默认取SPRING_APP_URL
+        spring_app_api_key: Spring服务API密钥，默认取SPRING_APP_API_KEY
+        renderer: PDF渲染方式 spring、local或auto，默认取GMP_PDF_RENDERER
+        pdf_dir: 本地渲染的PDF保存目录，为None时不保存
+
+    Returns:
+        结果字典，包含success、message、conversation_id、request_id、elapsed_ms，
+        以及PDF生成工具返回的download_url、filename等字段
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"success": False, "conversation_id": conversation_id}
+    try:
+        extract_report, GMPGeneratePDFTool = _load_tools()
+        with request_scope("gmp_workflow") as context:
+            result["request_id"] = context.request_id
+            dify_context = {"api_base": api_base, "api_key": api_key, "user_id": user_id}
+
+            extracted = extract_report(conversation_id, dify_context)
+            report_data = extracted.get("report_data")
+            if not extracted.get("success") or not report_data:
+                result["message"] = extracted.get("message") or "未能从对话中提取报告数据"
+                return result
+            result["extract_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+            credentials = {}
+            if spring_app_url:
+                credentials["spring_app_url"] = spring_app_url
+            if spring_app_api_key:
+                credentials["spring_app_api_key"] = spring_app_api_key
+            # 传入对话ID，本地报告存储按对话记录生成结果
+            generate_params = dict(dify_context, report_data=report_data, optimize_data=optimize_data,
+                                   credentials=credentials, conversation_id=conversation_id)
+            if extracted.get("fallback"):
+                # 提取失败时的默认内容仍生成PDF，但不保存到本地报告存储
+                generate_params["report_fallback"] = True
+            if renderer:
+                generate_params["renderer"] = renderer
+
+            generated, blobs = _collect(GMPGeneratePDFTool(None, None)._invoke(generate_params))
+            generated.pop("request_id", None)
+            result.update(generated)
+            result.setdefault("message", "PDF生成失败")
+
+            if pdf_dir and blobs:
+                os.makedirs(pdf_dir, exist_ok=True)
+                for blob, meta in blobs:
+                    # 不同对话的报告可能同名，文件名以对话ID开头
+                    filename = os.path.basename(f"{conversation_id}_{meta.get('filename') or 'GMP_report.pdf'}")
+                    path = os.path.join(pdf_dir, filename)
+                    with open(path, "wb") as f:
+                        f.write(blob)
+                    result["pdf_path"] = path
+    except Exception as e:
+        logger.error(f"Workflow for conversation {conversation_id} failed: {str(e)}")
+        result["success"] = False
+        result["message"] = f"工作流执行失败: {str(e)}"
+    finally:
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def read_conversation_ids(path: str) -> List[str]:
+    """读取对话ID文件：每行一个ID，忽略空行和#开头的注释，重复的ID只保留一个"""
+    ids = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            conversation_id = line.strip()
+            if conversation_id and not conversation_id.startswith("#") and conversation_id not in seen:
+                seen.add(conversation_id)
+                ids.append(conversation_id)
+    return ids
+
+
+def _init_worker(log_file: Optional[str]) -> None:
+    """进程池工作进程的初始化：导入工具模块，各进程写入自己的日志文件，避免多个进程轮转同一个文件"""
+    _load_tools()
+    from logging_setup import setup_logging
+
+    if log_file:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.worker{os.getpid()}{ext}"
+    setup_logging(log_file, console=False)
+
+
+def run_batch(conversation_ids: List[str], output_path: str, workers: int = 4, pool: str = "thread",
+              log_file: Optional[str] = None, **workflow_kwargs) -> Dict[str, Any]:
+    """并发为多个对话生成报告
+
+    Args:
+        conversation_ids: 对话ID列表
+        output_path: JSONL结果文件路径，每完成一个对话写入一行
+        workers: 并发数
+        pool: thread（线程池）或process（进程池）
+        log_file: 主进程的日志文件，进程池的工作进程在其旁边写各自的日志
+        **workflow_kwargs: 传给integrate_workflow的其余参数
+
+    Returns:
+        吞吐汇总：total、succeeded、failed、wall_seconds、throughput_per_s和单个对话耗时的p50/p95/max
+    """
+    if pool not in POOL_TYPES:
+        raise ValueError(f"不支持的并发方式: {pool}，可选: {', '.join(POOL_TYPES)}")
+    workers = max(1, workers)
+    if pool == "process":
+        # 工作进程以spawn方式启动，不继承主进程的模块和连接状态
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(log_file,))
+    else:
+        _load_tools()
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    latencies: List[float] = []
+    succeeded = failed = 0
+    start = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as out, executor:
+        futures = {executor.submit(integrate_workflow, conversation_id, **workflow_kwargs): conversation_id
+                   for conversation_id in conversation_ids}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # 进程池中工作进程异常退出等情况
+                result = {"success": False, "conversation_id": futures[future], "message": f"工作流执行失败: {str(e)}"}
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+
+            if result.get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+            if "elapsed_ms" in result:
+                latencies.append(result["elapsed_ms"])
+            logger.info(f"[{succeeded + failed}/{len(futures)}] {result['conversation_id']}: "
+                        f"{'成功' if result.get('success') else '失败'} {result.get('message', '')}")
+
+    wall_seconds = time.perf_counter() - start
+    total = succeeded + failed
+    return {
+        "total": total,
+        "succeeded": succeeded,
+        "failed": failed,
+        "pool": pool,
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(total / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+    }
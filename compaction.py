@@ -0,0 +1,200 @@
+"""
+Bayer GMP Reporter - 对话压缩
+
+从对话历史提取报告数据时，原先把每条消息原样以"role: content"拼进提示词，
+其中包括助手的问候、反复的追问以及已经解析过的Markdown表格。这里在拼接前压缩对话：
+- 用户消息：保留事实，去掉"好的""谢谢"之类的应答，重复出现的较长句子只保留第一次；
+  批号、"是"之类的短句重复出现时各有所指，全部保留
+- 助手消息：简短的问候和追问直接丢弃，只保留最后一条总结（放在末尾），其中的Markdown表格去掉分隔行和单元格填充；
+  以问候开头的长回复仍视为总结
+- 追问后的简短回答（如"没有""是的"）本身就是事实，与追问合并为一行"问：…… 答：……"保留
+- GMP_COMPACTION：是否压缩（默认true）
+- 压缩前后的估算token数导出为 gmp_compaction_tokens_total{kind}，kind为original或compacted
+
+压缩以生成器逐条处理消息，除已见过的较长句子的哈希和最后一条助手总结外不保留其他消息，适用于很长的对话。
+"""
+import hashlib
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否在提示词中压缩对话
+COMPACTION_ENABLED = os.getenv("GMP_COMPACTION", "true").strip().lower() in ("1", "true", "yes", "on")
+
+COMPACTION_TOKENS = "gmp_compaction_tokens_total"
+COMPACTION_MESSAGES = "gmp_compaction_messages_total"
+
+metrics.registry.describe(COMPACTION_TOKENS, "Estimated prompt tokens of conversation history before (original) "
+                                             "and after (compacted) compaction")
+metrics.registry.describe(COMPACTION_MESSAGES, "Conversation messages kept or dropped by compaction")
+
+# 助手的问候语
+_GREETING = re.compile(r"^\s*(您好|你好|hi\b|hello\b)", re.IGNORECASE)
+# 助手只做了问候：以问候语开头且不超过该长度，更长的回复可能包含总结
+_GREETING_MAX_CHARS = 60
+# 助手只做了追问：较短且以问号结尾
+_QUESTION_MAX_CHARS = 120
+# 紧跟在追问后、不超过该长度的用户回答与追问合并
+_ANSWER_MAX_CHARS = 30
+# 用户的应答，跟在陈述后时不含事实
+_ACKNOWLEDGEMENT = re.compile(r"^\s*(好的?|嗯+|是的?|对|谢谢(你|您)?|没有了?|没了|可以|ok|okay|yes|no|thanks?)"
+                              r"\s*[。！!.,，~]*\s*$", re.IGNORECASE)
+# Markdown表格的分隔行，如 | --- | :---: |
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_WHITESPACE = re.compile(r"[ \t\u3000]+")
+# 用户消息中不少于该长度的句子才去重
+_DEDUP_MIN_CHARS = 20
+# 按句切分用户消息，句末标点保留在句中
+_SENTENCE = re.compile(r"[^。！？!?；;]+[。！？!?；;]*")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数：每个非ASCII字符（中文及全角标点）约1个token，ASCII文本约4个字符1个token"""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return len(text) - ascii_chars + (ascii_chars + 3) // 4
+
+
+def format_message(message: Dict[str, Any]) -> str:
+    """以"role: content"格式输出一条消息"""
+    return f"{message['role']}: {message['content']}"
+
+
+def _compact_table_line(line: str) -> Optional[str]:
+    """去掉Markdown表格的分隔行和单元格两侧的空白，非表格行原样返回（去掉多余空白）"""
+    if _TABLE_SEPARATOR.match(line):
+        return None
+    stripped = line.strip()
+    if stripped.startswith("|") and stripped.endswith("|"):
+        return "|".join(cell.strip() for cell in stripped.strip("|").split("|"))
+    return _WHITESPACE.sub(" ", stripped)
+
+
+def _is_question(content: str) -> bool:
+    """助手单纯的追问：较短且以问号结尾"""
+    text = content.strip()
+    return len(text) <= _QUESTION_MAX_CHARS and text.endswith(("？", "?"))
+
+
+def _is_boilerplate_reply(content: str) -> bool:
+    """助手简短的问候或单纯的追问"""
+    return (bool(_GREETING.match(content)) and len(content.strip()) <= _GREETING_MAX_CHARS) or _is_question(content)
+
+
+class ConversationCompactor:
+    """压缩一段对话历史，compact()返回压缩后消息的生成器
+
+    生成器耗尽后original_tokens、compacted_tokens、kept、dropped为本次统计，并计入指标。
+    """
+
+    def __init__(self):
+        self.original_tokens = 0
+        self.compacted_tokens = 0
+        self.kept = 0
+        self.dropped = 0
+        self._seen: Set[bytes] = set()
+
+    def compact(self, messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, str]]:
+        """逐条压缩消息
+
+        Args:
+            messages: 对话历史，每条包含role和content
+
+        Yields:
+            压缩后的消息 {"role", "content"}；助手的最后一条总结在最后输出
+        """
+        latest_summary: Optional[str] = None
+        # 上一条助手消息为追问时，暂存以便与用户的简短回答合并
+        pending_question: Optional[str] = None
+        for message in messages:
+            if "role" not in message or "content" not in message:
+                continue
+            role, content = message["role"], str(message["content"] or "")
+            self.original_tokens += estimate_tokens(format_message({"role": role, "content": content}))
+
+            if role == "assistant":
+                # 助手消息只保留最后一条总结，到最后才输出
+                if _is_boilerplate_reply(content):
+                    pending_question = _WHITESPACE.sub(" ", " ".join(content.split())) \
+                        if _is_question(content) else None
+                    self.dropped += 1
+                    continue
+                pending_question = None
+                if latest_summary is not None:
+                    self.dropped += 1
+                latest_summary = content
+                continue
+
+            question, pending_question = pending_question, None
+            answer = content.strip()
+            if question and answer and len(answer) <= _ANSWER_MAX_CHARS:
+                # 简短回答离开追问就没有意义（"没有"回答的是什么？），合并后保留；追问已计入丢弃
+                yield self._emit(role, f"问：{question} 答：{answer}")
+                continue
+
+            compacted = self._compact_user(content)
+            if compacted is None:
+                self.dropped += 1
+                continue
+            yield self._emit(role, compacted)
+
+        if latest_summary is not None:
+            lines = (_compact_table_line(line) for line in latest_summary.splitlines())
+            yield self._emit("assistant", "\n".join(line for line in lines if line))
+        self._record()
+
+    def _compact_user(self, content: str) -> Optional[str]:
+        """去掉应答和之前出现过的较长句子；没有剩余内容时返回None"""
+        if _ACKNOWLEDGEMENT.match(content):
+            return None
+        lines = []
+        for line in content.splitlines():
+            line = _compact_table_line(line)
+            if not line:
+                continue
+            sentences = []
+            for sentence in _SENTENCE.findall(line):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                if len(sentence) >= _DEDUP_MIN_CHARS:
+                    digest = hashlib.blake2b(sentence.encode("utf-8"), digest_size=8).digest()
+                    if digest in self._seen:
+                        continue
+                    self._seen.add(digest)
+                sentences.append(sentence)
+            if sentences:
+                lines.append(" ".join(sentences))
+        return "\n".join(lines) or None
+
+    def _emit(self, role: str, content: str) -> Dict[str, str]:
+        message = {"role": role, "content": content}
+        self.kept += 1
+        self.compacted_tokens += estimate_tokens(format_message(message))
+        return message
+
+    def _record(self) -> None:
+        """记录本次压缩的统计"""
+        metrics.registry.inc(COMPACTION_TOKENS, self.original_tokens, kind="original")
+        metrics.registry.inc(COMPACTION_TOKENS, self.compacted_tokens, kind="compacted")
+        metrics.registry.inc(COMPACTION_MESSAGES, self.kept, result="kept")
+        metrics.registry.inc(COMPACTION_MESSAGES, self.dropped, result="dropped")
+        if self.original_tokens:
+            logger.info(f"Conversation compacted: {self.kept} messages kept, {self.dropped} dropped, "
+                        f"~{self.original_tokens} -> ~{self.compacted_tokens} tokens "
+                        f"({1 - self.compacted_tokens / self.original_tokens:.0%} saved)")
+
+
+def conversation_text(messages: Iterable[Dict[str, Any]]) -> str:
+    """把对话历史拼接为提示词中的对话内容，GMP_COMPACTION开启时先压缩"""
+    if not COMPACTION_ENABLED:
+        return "\n".join(format_message(message) for message in messages
+                         if "role" in message and "content" in message)
+    return "\n".join(format_message(message) for message in ConversationCompactor().compact(messages))
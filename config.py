@@ -0,0 +1,42 @@
+"""
+Bayer GMP Reporter - 运行配置
+
+插件根目录下的.env只在这里加载一次。main.py最先导入本模块，保证其他模块在导入时通过
+os.getenv读取的GMP_*等配置已经包含.env中的值；工具模块被单独导入（测试、基准脚本）时也会先导入本模块。
+.env不存在时不导入dotenv，减少冷启动的导入开销。
+"""
+import os
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_FILE = os.path.join(ROOT_DIR, ".env")
+
+_env_loaded = False
+
+
+def load_env(path: str = ENV_FILE) -> bool:
+    """加载.env文件（只加载一次，已存在的环境变量不会被覆盖）
+
+    Args:
+        path: .env文件路径
+
+    Returns:
+        是否加载了.env文件
+    """
+    global _env_loaded
+    if _env_loaded:
+        return False
+    _env_loaded = True
+    if not os.path.exists(path):
+        return False
+    from dotenv import load_dotenv
+    return load_dotenv(path)
+
+
+load_env()
+
+# Spring服务
+SPRING_APP_URL = os.getenv("SPRING_APP_URL", "http://localhost:8080")
+SPRING_APP_API_KEY = os.getenv("SPRING_APP_API_KEY", "test_key")
+
+# 单次工具调用的最长时间(秒)，传给Dify插件运行时，也是模型路由的时间预算
+MAX_REQUEST_TIMEOUT = int(os.getenv("GMP_MAX_REQUEST_TIMEOUT", "120"))
@@ -0,0 +1,141 @@
+"""
+Bayer GMP Reporter - 请求关联ID
+
+每次工具调用生成一个关联ID，用于把插件日志与Dify、Spring和MinIO各自的日志对应起来：
+- RequestIdFilter 把当前ID写入每条日志记录（日志格式中的 %(request_id)s）
+- http_client 在发往Dify和Spring的请求中携带 X-Request-ID 请求头
+- 调用期间各阶段（metrics.span）的耗时按ID汇总，调用结束时写入一条日志
+- 工具返回的JSON结果中包含 request_id 字段
+
+嵌套调用（如PDF生成工具内部调用数据提取工具）沿用外层调用的ID；request_scope可在工具之外建立ID。
+新的ID同时建立本次调用的截止时间（见deadline）。
+"""
+import contextvars
+import functools
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import deadline
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class RequestContext:
+    """一次工具调用的关联ID和阶段耗时"""
+
+    __slots__ = ("request_id", "tool", "started", "stages")
+
+    def __init__(self, request_id: str, tool: str):
+        self.request_id = request_id
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def summary(self) -> str:
+        parts = [f"{stage}={total * 1000:.1f}ms" + (f"x{count}" if count > 1 else "")
+                 for stage, (count, total) in self.stages.items()]
+        return ", ".join(parts) or "-"
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("gmp_request_context", default=None)
+
+
+def new_request_id() -> str:
+    """生成新的关联ID"""
+    return uuid.uuid4().hex
+
+
+def current_request_id() -> Optional[str]:
+    """当前调用的关联ID，不在工具调用中时返回None"""
+    context = _current.get()
+    return context.request_id if context is not None else None
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录添加request_id字段，不在工具调用中时为"-" """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            context = _current.get()
+            record.request_id = context.request_id if context is not None else "-"
+        return True
+
+
+class _StageTimingListener:
+    """metrics.span的监听器，把阶段耗时记录到当前调用上"""
+
+    def enter(self, stage: str) -> Optional[tuple]:
+        context = _current.get()
+        return (context, time.perf_counter()) if context is not None else None
+
+    def exit(self, stage: str, token: Optional[tuple]) -> None:
+        if token is not None:
+            context, start = token
+            context.record(stage, time.perf_counter() - start)
+
+
+metrics.add_span_listener(_StageTimingListener())
+
+
+def _attach_request_id(message: Any, request_id: str) -> None:
+    json_object = getattr(getattr(message, "message", None), "json_object", None)
+    if isinstance(json_object, dict):
+        json_object.setdefault("request_id", request_id)
+
+
+@contextmanager
+def request_scope(name: str):
+    """在其中执行的代码共享一个关联ID，结束时输出各阶段耗时汇总
+
+    已在某个关联ID下时沿用外层ID（嵌套调用）。工具之外的调用方（如批处理流水线）
+    可用它把一份报告涉及的多次工具调用归到同一个ID下。
+
+    Yields:
+        RequestContext: 当前调用的上下文
+    """
+    context = _current.get()
+    if context is not None:
+        yield context
+        return
+
+    context = RequestContext(new_request_id(), name)
+    token = _current.set(context)
+    logger.info(f"Start {name}")
+    try:
+        with deadline.deadline_scope():
+            yield context
+    finally:
+        elapsed = time.perf_counter() - context.started
+        logger.info(f"Finished {name} in {elapsed * 1000:.1f}ms, stages: {context.summary()}")
+        _current.reset(token)
+
+
+def correlated(name: str):
+    """为工具的 _invoke 生成器分配关联ID的装饰器
+
+    应放在 @timed 之外，使工具本身的阶段耗时也记录在该ID下。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, tool_parameters: Dict[str, Any], *args, **kwargs):
+            with request_scope(name) as context:
+                for message in func(self, tool_parameters, *args, **kwargs):
+                    _attach_request_id(message, context.request_id)
+                    yield message
+        return wrapper
+    return decorator
@@ -0,0 +1,162 @@
+"""
+Bayer GMP Reporter - 调用截止时间
+
+Dify插件运行时限制单次工具调用的时间（MAX_REQUEST_TIMEOUT），超时的调用直接被终止，不返回任何结果。
+每次工具调用开始时（correlation.request_scope）创建一个截止时间，与关联ID一样通过contextvars传递给各阶段：
+- http_client发出的每个请求，超时时间取各自的上限与剩余时间中较小的一个，剩余时间用完时不再发送
+  （抛出DeadlineExceeded），排队等待后端并发名额的时间同样受剩余时间限制
+- 剩余时间不足时跳过价值较低的步骤：数据优化、优化后的重新渲染、改用其他模型路由重试
+- GMP_DEADLINE_MARGIN：预留给返回结果的时间（秒，默认2），截止时间 = 开始时间 + MAX_REQUEST_TIMEOUT - 预留
+- GMP_DEADLINE_OPTIMIZE_MIN：剩余时间少于该值（秒，默认45）时跳过数据优化
+- GMP_DEADLINE_RETRY_MIN：剩余时间少于该值（秒，默认5）时不再重试或改用其他路由
+- GMP_DEADLINE_RENDER_RESERVE：数据优化必须为之后的PDF渲染留出的时间（秒，默认30）
+- 跳过的步骤和因截止时间未发送的请求导出为 gmp_deadline_skipped_total{step}、gmp_deadline_exceeded_total{stage}
+
+在新线程中执行的阶段需要用contextvars.copy_context()沿用调用方的截止时间。
+"""
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import metrics
+from config import MAX_REQUEST_TIMEOUT
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 预留给返回结果的时间(秒)
+DEADLINE_MARGIN = float(os.getenv("GMP_DEADLINE_MARGIN", "2"))
+# 剩余时间少于该值(秒)时跳过数据优化
+DEADLINE_OPTIMIZE_MIN = float(os.getenv("GMP_DEADLINE_OPTIMIZE_MIN", "45"))
+# 剩余时间少于该值(秒)时不再重试或改用其他路由
+DEADLINE_RETRY_MIN = float(os.getenv("GMP_DEADLINE_RETRY_MIN", "5"))
+# 数据优化为之后的PDF渲染留出的时间(秒)
+DEADLINE_RENDER_RESERVE = float(os.getenv("GMP_DEADLINE_RENDER_RESERVE", "30"))
+
+DEADLINE_SKIPPED = "gmp_deadline_skipped_total"
+DEADLINE_EXCEEDED = "gmp_deadline_exceeded_total"
+
+metrics.registry.describe(DEADLINE_SKIPPED, "Optional steps skipped because too little of the request budget was left")
+metrics.registry.describe(DEADLINE_EXCEEDED, "Requests not sent because the request deadline had passed")
+
+
+class DeadlineExceeded(TimeoutError):
+    """本次调用的截止时间已过"""
+
+
+class Deadline:
+    """一次工具调用的截止时间
+
+    Args:
+        budget: 总时间(秒)
+        margin: 预留给返回结果的时间(秒)
+    """
+
+    __slots__ = ("budget", "started", "expires")
+
+    def __init__(self, budget: float = MAX_REQUEST_TIMEOUT, margin: float = DEADLINE_MARGIN):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires = self.started + max(budget - margin, 0.0)
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """提前seconds秒截止的子截止时间，为之后的阶段留出时间"""
+        child = Deadline.__new__(Deadline)
+        child.budget = self.budget
+        child.started = self.started
+        child.expires = self.expires - seconds
+        return child
+
+    def remaining(self) -> float:
+        """剩余时间(秒)，已过截止时间时为0"""
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def timeout(self, cap: Optional[float] = None, stage: str = "-") -> float:
+        """某个阶段可用的超时时间：cap与剩余时间中较小的一个
+
+        Raises:
+            DeadlineExceeded: 剩余时间已用完
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            metrics.registry.inc(DEADLINE_EXCEEDED, stage=stage)
+            raise DeadlineExceeded(f"Request deadline of {self.budget:g}s exceeded before {stage}")
+        return remaining if cap is None else min(cap, remaining)
+
+    def allows(self, step: str, needed: float) -> bool:
+        """剩余时间是否至少为needed秒；不足时记录跳过的步骤"""
+        remaining = self.remaining()
+        if remaining >= needed:
+            return True
+        logger.warning(f"Skipping {step}: {remaining:.1f}s of the request budget left, {needed:g}s needed")
+        metrics.registry.inc(DEADLINE_SKIPPED, step=step)
+        return False
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("gmp_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    """当前调用的截止时间，不在工具调用中时返回None"""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(budget: Optional[float] = None):
+    """在其中执行的代码共享一个截止时间；已有截止时间时沿用外层的（嵌套调用）
+
+    Args:
+        budget: 总时间(秒)，默认MAX_REQUEST_TIMEOUT
+
+    Yields:
+        Deadline
+    """
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+    deadline = Deadline(MAX_REQUEST_TIMEOUT if budget is None else budget)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def reserve(seconds: float):
+    """其中执行的阶段提前seconds秒截止，为之后的阶段留出时间；不在工具调用中时不做限制"""
+    outer = _current.get()
+    if outer is None:
+        yield None
+        return
+    token = _current.set(outer.reserve(seconds))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """当前调用的剩余时间(秒)，不在工具调用中时返回None"""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def timeout(cap: Optional[float] = None, stage: str = "-") -> Optional[float]:
+    """当前阶段可用的超时时间；不在工具调用中时返回cap
+
+    Raises:
+        DeadlineExceeded: 剩余时间已用完
+    """
+    deadline = _current.get()
+    return deadline.timeout(cap, stage) if deadline is not None else cap
+
+
+def allows(step: str, needed: float) -> bool:
+    """剩余时间是否足够执行可选步骤；不在工具调用中时总是允许"""
+    deadline = _current.get()
+    return deadline.allows(step, needed) if deadline is not None else True
@@ -0,0 +1,120 @@
+"""
+Bayer GMP Reporter - DNS解析缓存
+
+requests/urllib3每建立一条新连接都会调用socket.getaddrinfo，连接池未命中（插件刚启动、
+并发超过池大小、空闲连接被服务端关闭）时，发往Dify和Spring的请求都要重新解析域名。
+这里为getaddrinfo加一层按TTL过期的进程内缓存：
+- GMP_DNS_CACHE_TTL：缓存有效期（秒，默认60），0表示不缓存
+- 只缓存成功的解析结果，解析失败时原样抛出异常
+- 命中/未命中次数导出为 gmp_dns_cache_total{result}
+
+缓存通过替换socket.getaddrinfo生效，作用于整个插件进程。gevent的monkey.patch_all会替换
+socket.getaddrinfo，因此由http_client在创建Session时安装，而不是在导入时安装。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 解析结果的缓存时间(秒)，0表示不缓存
+DNS_CACHE_TTL = float(os.getenv("GMP_DNS_CACHE_TTL", "60"))
+# 缓存的最大条目数，超过时先清理过期条目，仍超过则清空
+DNS_CACHE_SIZE = 256
+
+DNS_CACHE = "gmp_dns_cache_total"
+
+metrics.registry.describe(DNS_CACHE, "DNS lookups served from the in-process cache (hit) or resolved (miss)")
+
+
+class DNSCache:
+    """getaddrinfo的TTL缓存
+
+    Args:
+        resolver: 实际执行解析的函数（安装前的socket.getaddrinfo）
+        ttl: 缓存有效期(秒)
+    """
+
+    def __init__(self, resolver, ttl: float = DNS_CACHE_TTL):
+        self._resolver = resolver
+        self.ttl = ttl
+        self._entries: Dict[Tuple, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """与socket.getaddrinfo签名一致的带缓存版本"""
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                metrics.registry.inc(DNS_CACHE, result="hit")
+                return list(entry[1])
+
+        result = self._resolver(host, port, family, type, proto, flags)
+        with self._lock:
+            self.misses += 1
+            if len(self._entries) >= DNS_CACHE_SIZE:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= DNS_CACHE_SIZE:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, tuple(result))
+        metrics.registry.inc(DNS_CACHE, result="miss")
+        return result
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计快照"""
+        with self._lock:
+            return {"ttl": self.ttl, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_install_lock = threading.Lock()
+
+
+def install(ttl: float = None) -> bool:
+    """用带缓存的版本替换socket.getaddrinfo（重复调用无副作用）
+
+    Args:
+        ttl: 缓存有效期(秒)，默认取GMP_DNS_CACHE_TTL，0或负数表示不安装
+
+    Returns:
+        缓存是否已安装
+    """
+    global _cache
+    if ttl is None:
+        ttl = DNS_CACHE_TTL
+    with _install_lock:
+        if _cache is not None:
+            return True
+        if ttl <= 0:
+            return False
+        _cache = DNSCache(socket.getaddrinfo, ttl)
+        socket.getaddrinfo = _cache.getaddrinfo
+    logger.info(f"DNS cache installed, ttl={ttl:g}s")
+    return True
+
+
+def get_stats() -> Dict[str, Any]:
+    """返回缓存统计，未安装时为空字典"""
+    return _cache.stats() if _cache is not None else {}
+
+
+def clear() -> None:
+    """清空缓存（不卸载）"""
+    if _cache is not None:
+        _cache.clear()
@@ -0,0 +1,44 @@
+"""
+Bayer GMP Reporter - Prometheus指标端点
+"""
+from collections.abc import Mapping
+import hmac
+import logging
+import sys
+import os
+
+from werkzeug import Request, Response
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dify_plugin import Endpoint
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+import metrics
+
+
+class GMPMetricsEndpoint(Endpoint):
+    """以Prometheus文本格式导出各阶段耗时直方图和计数器"""
+
+    def _invoke(self, r: Request, values: Mapping, settings: Mapping) -> Response:
+        """处理 GET /metrics 请求
+
+        Args:
+            r: 请求对象
+            values: 路径参数
+            settings: 端点配置，可包含metrics_token
+
+        Returns:
+            Prometheus文本格式的响应
+        """
+        token = settings.get("metrics_token")
+        if token:
+            authorization = r.headers.get("Authorization", "")
+            if not hmac.compare_digest(authorization, f"Bearer {token}"):
+                logger.warning("Rejected /metrics request with invalid token")
+                return Response("Unauthorized\n", status=401, content_type="text/plain; charset=utf-8")
+
+        return Response(metrics.render_prometheus(), status=200, content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Bayer GMP Reporter - 离线回填命令行入口
+
+从导出的对话JSONL文件批量重建报告（数据提取和规范化 -> 报告JSON -> PDF），不调用Dify的/messages接口。
+以进程池并发处理，每完成一个对话写入检查点；中断后用相同参数再次运行，跳过已完成的对话。
+
+示例：
+    python gmp_backfill.py --input exports/ --out_dir backfill_output --workers 8
+    python gmp_backfill.py --input exports/part1.jsonl --out_dir backfill_output --no_pdf
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from logging_setup import setup_logging
+
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gmp_backfill.log')
+
+logger = logging.getLogger("bayer_gmp")
+
+# 导入离线回填模块
+from code_execution.backfill import run_backfill
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='Bayer GMP Reporter离线回填')
+
+    # 必需参数
+    parser.add_argument('--input', nargs='+', required=True,
+                        help='导出的对话JSONL文件或包含JSONL文件的目录，每行一个对话（conversation_id、messages）')
+
+    # 可选参数
+    parser.add_argument('--out_dir', default='backfill_output', help='输出目录，报告JSON写入json/，PDF写入pdf/（默认: backfill_output）')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数（默认: CPU核数）')
+    parser.add_argument('--checkpoint', default=None, help='检查点文件（默认: <out_dir>/checkpoint.jsonl）')
+    parser.add_argument('--restart', action='store_true', help='忽略已有的检查点，全部重新处理')
+    parser.add_argument('--renderer', choices=['spring', 'local', 'auto'], default='local',
+                        help='PDF渲染方式（默认: local）')
+    parser.add_argument('--no_pdf', action='store_true', help='只写报告JSON，不生成PDF')
+    parser.add_argument('--api_key', default=None,
+                        help='Dify API密钥，对话中没有报告数据表格时用于调用模型提取；'
+                             '不提供时不调用任何模型，这样的对话记为失败')
+    parser.add_argument('--api_base', default='http://dify.xscha.com', help='Dify API基础URL（默认: http://dify.xscha.com）')
+    parser.add_argument('--user_id', default='plugin-user', help='用户ID（默认: plugin-user）')
+
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    try:
+        # 解析命令行参数
+        args = parse_args()
+
+        # 配置日志（在main中配置，工作进程以spawn方式启动时会重新导入本模块）
+        setup_logging(LOG_FILE, console="stdout")
+
+        context = {"api_base": args.api_base, "user_id": args.user_id}
+        if args.api_key:
+            context["api_key"] = args.api_key
+
+        logger.info("=" * 50)
+        logger.info(f"开始离线回填: 输入 {', '.join(args.input)}，输出 {args.out_dir}")
+        logger.info("=" * 50)
+
+        summary = run_backfill(args.input, args.out_dir, workers=args.workers, checkpoint_path=args.checkpoint,
+                               restart=args.restart, renderer=None if args.no_pdf else args.renderer,
+                               log_file=LOG_FILE, **context)
+        logger.info(f"离线回填结束: {json.dumps(summary, ensure_ascii=False)}")
+
+        status = '⏸️' if summary['interrupted'] else ('✅' if summary['failed'] == 0 else '⚠️')
+        print(f"\n{status} 离线回填{'已中断' if summary['interrupted'] else '完成'}: "
+              f"成功 {summary['succeeded']}，失败 {summary['failed']}，"
+              f"跳过已完成 {summary['skipped']}，无法解析 {summary['invalid']}")
+        print(f"⏱️ 总耗时 {summary['wall_seconds']:.2f}秒，吞吐 {summary['throughput_per_s']:.2f}个/秒，"
+              f"单个耗时 p50 {summary['p50_ms']:.0f}ms / p95 {summary['p95_ms']:.0f}ms / 最大 {summary['max_ms']:.0f}ms")
+        print(f"📄 检查点: {summary['checkpoint']}")
+        if summary['interrupted']:
+            print("↩️ 使用相同参数再次运行即可从检查点继续")
+            return 130
+
+        return 0 if summary["failed"] == 0 else 1
+
+    except KeyboardInterrupt:
+        logger.info("用户中断了操作")
+        return 130
+    except Exception as e:
+        logger.error(f"执行中出现错误: {str(e)}", exc_info=True)
+        print(f"\n❌ 执行出错: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
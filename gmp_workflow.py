@@ -2,7 +2,13 @@
 """
 Bayer GMP Reporter - 命令行入口
 
-该脚本提供了一个命令行接口，用于直接调用GMP报告生成工作流。
+该脚本提供了一个命令行接口，用于直接调用GMP报告生成工作流（提取数据 ->（可选）优化 -> 生成PDF）。
+- 单个对话：--conversation_id，结果保存为JSON文件
+- 批量处理：--ids_file（每行一个对话ID），以线程池或进程池并发处理，结果逐行写入JSONL并输出吞吐汇总
+
+示例：
+    python gmp_workflow.py --conversation_id <ID> --api_key <KEY>
+    python gmp_workflow.py --ids_file ids.txt --api_key <KEY> --workers 8 --pool process --renderer local
 """
 import argparse
 import json
@@ -11,84 +17,138 @@ import os
 import sys
 import time
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gmp_workflow.log'))
-    ]
-)
+from logging_setup import setup_logging
+
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gmp_workflow.log')
 
 logger = logging.getLogger("bayer_gmp")
 
 # 导入工作流集成模块
-from code_execution.workflow_integration import integrate_workflow
+from code_execution.workflow_integration import POOL_TYPES, integrate_workflow, read_conversation_ids, run_batch
+
 
 def parse_args():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='Bayer GMP Reporter命令行工具')
     
     # 必需参数
-    parser.add_argument('--conversation_id', required=True, help='Dify对话ID')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--conversation_id', help='Dify对话ID')
+    source.add_argument('--ids_file', help='批量处理：对话ID文件，每行一个ID，#开头为注释')
     parser.add_argument('--api_key', required=True, help='Dify API密钥')
     
     # 可选参数
     parser.add_argument('--api_base', default='http://dify.xscha.com', help='Dify API基础URL（默认: http://dify.xscha.com）')
     parser.add_argument('--user_id', default='plugin-user', help='用户ID（默认: plugin-user）')
     parser.add_argument('--optimize', action='store_true', help='是否优化报告数据')
+    parser.add_argument('--renderer', choices=['spring', 'local', 'auto'], default=None,
+                        help='PDF渲染方式（默认取GMP_PDF_RENDERER）')
+    parser.add_argument('--spring_app_url', default=None, help='Spring服务URL（默认取SPRING_APP_URL）')
+    parser.add_argument('--spring_app_api_key', default=None, help='Spring服务API密钥（默认取SPRING_APP_API_KEY）')
+    parser.add_argument('--pdf_dir', default=None, help='本地渲染的PDF保存目录（默认不保存）')
     parser.add_argument('--output', default='gmp_report_result.json', help='输出结果的JSON文件路径（默认: gmp_report_result.json）')
     
+    # 批量处理参数
+    parser.add_argument('--workers', type=int, default=4, help='批量处理的并发数（默认: 4）')
+    parser.add_argument('--pool', choices=POOL_TYPES, default='thread',
+                        help='批量处理的并发方式：thread（等待后端为主）或process（本地渲染等CPU密集场景）（默认: thread）')
+    parser.add_argument('--results', default='gmp_report_results.jsonl',
+                        help='批量处理的JSONL结果文件，每完成一个对话写入一行（默认: gmp_report_results.jsonl）')
+
     return parser.parse_args()
 
+
+def _workflow_kwargs(args) -> dict:
+    """integrate_workflow的公共参数"""
+    return {
+        "api_base": args.api_base,
+        "api_key": args.api_key,
+        "user_id": args.user_id,
+        "optimize_data": args.optimize,
+        "spring_app_url": args.spring_app_url,
+        "spring_app_api_key": args.spring_app_api_key,
+        "renderer": args.renderer,
+        "pdf_dir": args.pdf_dir,
+    }
+
+
+def run_single(args) -> int:
+    """处理单个对话"""
+    logger.info("=" * 50)
+    logger.info("开始Bayer GMP报告生成工作流")
+    logger.info(f"对话ID: {args.conversation_id}")
+    logger.info(f"API基础URL: {args.api_base}")
+    logger.info(f"用户ID: {args.user_id}")
+    logger.info(f"是否优化: {args.optimize}")
+    logger.info("=" * 50)
+
+    # 记录开始时间
+    start_time = time.time()
+
+    # 调用集成工作流
+    result = integrate_workflow(args.conversation_id, **_workflow_kwargs(args))
+
+    # 计算执行时间
+    elapsed_time = time.time() - start_time
+    logger.info(f"工作流执行完成，耗时: {elapsed_time:.2f}秒")
+
+    # 保存结果到文件
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"结果已保存到: {args.output}")
+
+    # 打印简要结果信息
+    if result["success"]:
+        print("\n✅ GMP报告生成成功！")
+        print(f"📄 结果已保存到: {args.output}")
+        if "download_url" in result:
+            print("📎 PDF下载链接已包含在结果文件中")
+        if "pdf_path" in result:
+            print(f"📎 PDF已保存到: {result['pdf_path']}")
+    else:
+        print(f"\n❌ GMP报告生成失败: {result['message']}")
+        print(f"📄 详细错误信息已保存到: {args.output}")
+
+    return 0 if result["success"] else 1
+
+
+def run_ids_file(args) -> int:
+    """批量处理对话ID文件"""
+    conversation_ids = read_conversation_ids(args.ids_file)
+    if not conversation_ids:
+        print(f"\n❌ 对话ID文件中没有可处理的ID: {args.ids_file}")
+        return 1
+
+    logger.info("=" * 50)
+    logger.info(f"开始批量生成GMP报告: {len(conversation_ids)}个对话，{args.pool}池，并发{args.workers}")
+    logger.info("=" * 50)
+
+    summary = run_batch(conversation_ids, args.results, workers=args.workers, pool=args.pool,
+                        log_file=LOG_FILE, **_workflow_kwargs(args))
+    logger.info(f"批量处理完成: {json.dumps(summary, ensure_ascii=False)}")
+
+    print(f"\n{'✅' if summary['failed'] == 0 else '⚠️'} 批量处理完成: "
+          f"成功 {summary['succeeded']}，失败 {summary['failed']}，共 {summary['total']}")
+    print(f"⏱️ 总耗时 {summary['wall_seconds']:.2f}秒，吞吐 {summary['throughput_per_s']:.2f}个/秒，"
+          f"单个耗时 p50 {summary['p50_ms']:.0f}ms / p95 {summary['p95_ms']:.0f}ms / 最大 {summary['max_ms']:.0f}ms")
+    print(f"📄 结果已逐行保存到: {args.results}")
+
+    return 0 if summary["failed"] == 0 else 1
+
+
 def main():
     """主函数"""
     try:
         # 解析命令行参数
         args = parse_args()
         
-        logger.info("=" * 50)
-        logger.info("开始Bayer GMP报告生成工作流")
-        logger.info(f"对话ID: {args.conversation_id}")
-        logger.info(f"API基础URL: {args.api_base}")
-        logger.info(f"用户ID: {args.user_id}")
-        logger.info(f"是否优化: {args.optimize}")
-        logger.info("=" * 50)
-        
-        # 记录开始时间
-        start_time = time.time()
-        
-        # 调用集成工作流
-        result = integrate_workflow(
-            conversation_id=args.conversation_id,
-            api_base=args.api_base,
-            api_key=args.api_key,
-            user_id=args.user_id,
-            optimize_data=args.optimize
-        )
-        
-        # 计算执行时间
-        elapsed_time = time.time() - start_time
-        logger.info(f"工作流执行完成，耗时: {elapsed_time:.2f}秒")
-        
-        # 保存结果到文件
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"结果已保存到: {args.output}")
-        
-        # 打印简要结果信息
-        if result["success"]:
-            print(f"\n✅ GMP报告生成成功！")
-            print(f"📄 结果已保存到: {args.output}")
-            if "download_link" in result:
-                print(f"📎 PDF下载链接已包含在结果文件中")
-        else:
-            print(f"\n❌ GMP报告生成失败: {result['message']}")
-            print(f"📄 详细错误信息已保存到: {args.output}")
+        # 配置日志（在main中配置，进程池以spawn方式启动工作进程时会重新导入本模块）
+        setup_logging(LOG_FILE, console="stdout")
         
-        return 0 if result["success"] else 1
+        if args.ids_file:
+            return run_ids_file(args)
+        return run_single(args)
     
     except KeyboardInterrupt:
         logger.info("用户中断了操作")
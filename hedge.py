@@ -0,0 +1,223 @@
+"""
+Bayer GMP Reporter - 对冲请求
+
+Dify模型调用的耗时长尾明显：少数调用比中位数慢好几倍。开启对冲后，一次调用超过近期耗时的
+指定百分位仍未返回时，再发送一个相同的请求，两者谁先成功返回就用谁的结果：
+- GMP_HEDGE：是否开启（默认false）
+- GMP_HEDGE_PERCENTILE：触发对冲的耗时百分位（默认95），按每条路由最近的成功调用计算
+- GMP_HEDGE_DELAY：样本不足时使用的对冲等待时间（秒，默认3）
+- GMP_HEDGE_BUDGET：对冲请求占调用数的最大比例（默认0.1），以令牌桶限制，避免后端变慢时请求量翻倍
+
+requests无法中途中止已发出的请求：输掉的请求在返回后立即关闭响应、释放连接，其结果被丢弃。
+结果导出为 gmp_hedge_total{outcome}：
+- primary_only：未触发对冲；throttled：应对冲但超出预算
+- primary_won / hedge_won：发出对冲后第一个请求 / 对冲请求先成功返回；both_failed：发出对冲后两者都失败
+对冲率 = 发出对冲的次数 / 总数，对冲胜率 = hedge_won / 发出对冲的次数。
+"""
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否开启对冲
+HEDGE_ENABLED = os.getenv("GMP_HEDGE", "false").strip().lower() in ("1", "true", "yes", "on")
+# 触发对冲的耗时百分位
+HEDGE_PERCENTILE = float(os.getenv("GMP_HEDGE_PERCENTILE", "95"))
+# 样本不足时的对冲等待时间(秒)
+HEDGE_DELAY = float(os.getenv("GMP_HEDGE_DELAY", "3"))
+# 对冲请求占调用数的最大比例
+HEDGE_BUDGET = float(os.getenv("GMP_HEDGE_BUDGET", "0.1"))
+# 计算百分位所用的最近样本数，以及开始使用百分位的最少样本数
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# 令牌桶容量：允许短时间内集中对冲的次数
+HEDGE_BURST = 5.0
+
+HEDGE_TOTAL = "gmp_hedge_total"
+
+metrics.registry.describe(HEDGE_TOTAL, "Hedgeable calls by outcome: primary_only, throttled (hedge over budget), "
+                                       "primary_won, hedge_won or both_failed (a hedge was sent)")
+
+
+class LatencyWindow:
+    """最近若干次成功调用的耗时"""
+
+    def __init__(self, size: int = HEDGE_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """最近秩百分位数；样本少于HEDGE_MIN_SAMPLES时返回None"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        rank = min(max(int(pct / 100.0 * len(ordered) + 0.5) - 1, 0), len(ordered) - 1)
+        return ordered[rank]
+
+
+class HedgeBudget:
+    """令牌桶：每次调用存入budget个令牌，每次对冲消耗1个"""
+
+    def __init__(self, budget: float = HEDGE_BUDGET, burst: float = HEDGE_BURST):
+        self.budget = budget
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget, self.burst)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Hedger:
+    """按路由记录耗时并执行可对冲的调用"""
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, default_delay: float = HEDGE_DELAY,
+                 budget: Optional[HedgeBudget] = None):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.budget = budget or HedgeBudget()
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self.counts = {"primary_only": 0, "throttled": 0, "primary_won": 0, "hedge_won": 0, "both_failed": 0}
+
+    def _window(self, key: str) -> LatencyWindow:
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = LatencyWindow()
+            return window
+
+    def delay(self, key: str) -> float:
+        """发出对冲前的等待时间(秒)"""
+        observed = self._window(key).percentile(self.percentile)
+        return observed if observed is not None else self.default_delay
+
+    def call(self, key: str, fn: Callable[[float], Any], timeout: float,
+             is_success: Callable[[Any], bool] = lambda result: True,
+             discard: Callable[[Any], None] = lambda result: None) -> Any:
+        """执行fn(timeout)，超过对冲等待时间仍未返回时再执行一次，返回先成功的结果
+
+        Args:
+            key: 耗时统计的分组，如"任务/路由"
+            fn: 实际的调用，参数为本次调用可用的超时时间(秒)
+            timeout: 总的超时时间(秒)
+            is_success: 判断结果是否成功；不成功的结果在另一个请求仍在进行时不会被采用
+            discard: 处理被丢弃的结果（如关闭HTTP响应）
+
+        Returns:
+            先成功的结果；都不成功时返回最后一个结果，或抛出最后一个异常
+        """
+        self.budget.deposit()
+        start = time.monotonic()
+        results: queue.Queue = queue.Queue()
+        state = {"winner": None}
+        state_lock = threading.Lock()
+        window = self._window(key)
+
+        def attempt(index: int, attempt_timeout: float) -> None:
+            attempt_start = time.monotonic()
+            try:
+                result = fn(attempt_timeout)
+            except Exception as e:
+                results.put((index, False, e))
+                return
+            success = is_success(result)
+            if success:
+                window.add(time.monotonic() - attempt_start)
+            with state_lock:
+                settled = state["winner"] is not None
+                if success and not settled:
+                    state["winner"] = index
+            if settled:
+                # 另一个请求已经先成功返回，丢弃本次结果
+                discard(result)
+                return
+            results.put((index, success, result))
+
+        def launch(index: int, attempt_timeout: float) -> None:
+            # 在新线程中沿用本次调用的关联ID等上下文
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(attempt, index, attempt_timeout),
+                             name=f"gmp-hedge-{key}-{index}", daemon=True).start()
+
+        launch(0, timeout)
+        delay = self.delay(key)
+        # primary_only：未到对冲时间；throttled：应对冲但超出预算；hedged：已发出对冲请求
+        status = "primary_only"
+        pending = 1
+        last = None
+        while pending:
+            wait = None if status != "primary_only" or delay >= timeout else \
+                max(delay - (time.monotonic() - start), 0.0)
+            try:
+                index, success, result = results.get(timeout=wait)
+            except queue.Empty:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0 or not self.budget.withdraw():
+                    status = "throttled"
+                    continue
+                logger.info(f"Hedging {key} call after {delay:.2f}s")
+                status = "hedged"
+                launch(1, remaining)
+                pending += 1
+                continue
+
+            pending -= 1
+            last = (success, result)
+            if success:
+                # 另一个请求若仍在进行，它返回后由attempt丢弃
+                self._count(("hedge_won" if index == 1 else "primary_won") if status == "hedged" else status)
+                return result
+            if pending and not isinstance(result, Exception):
+                discard(result)
+
+        self._count("both_failed" if status == "hedged" else status)
+        result = last[1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _count(self, outcome: str) -> None:
+        metrics.registry.inc(HEDGE_TOTAL, outcome=outcome)
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """各结果次数、对冲率和对冲胜率"""
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        hedged = counts["primary_won"] + counts["hedge_won"] + counts["both_failed"]
+        counts["hedge_rate"] = round(hedged / total, 3) if total else 0.0
+        counts["hedge_win_rate"] = round(counts["hedge_won"] / hedged, 3) if hedged else 0.0
+        return counts
+
+
+hedger = Hedger()
+
+
+def get_stats() -> Dict[str, Any]:
+    """对冲的各结果次数、对冲率和对冲胜率"""
+    return hedger.stats()
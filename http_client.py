@@ -0,0 +1,484 @@
+"""
+Bayer GMP Reporter - 公共HTTP请求层
+
+所有访问Dify和Spring的请求都通过这里发出：
+- 复用同一个requests.Session以保持连接
+- 始终声明Accept-Encoding，允许服务端压缩响应
+- 对开启压缩的后端，超过阈值的JSON请求体使用gzip/deflate压缩发送；
+  服务端以415（或响应表明是编码问题的400）拒绝压缩请求体时自动以未压缩方式重试，
+  并在GMP_COMPRESS_RETRY_INTERVAL秒内不再对该端点压缩
+- 按端点统计请求/响应压缩节省的字节数
+- stream_json=True时请求体边序列化边以chunked方式发送，不在内存中保留完整的序列化结果
+- 建立新连接时的域名解析经过dns_cache的TTL缓存
+- 工具调用期间的请求携带 X-Request-ID 请求头，便于在Dify/Spring日志中关联同一次调用
+- 按后端限制进程内同时进行的请求数（所有工具实例共享），超出的请求排队等待，
+  排队超时立即失败，而不是让后端过载后整体超时；排队耗时通过 /metrics 导出
+- 工具调用期间，请求的超时和排队时间不超过本次调用的剩余时间（见deadline），剩余时间用完时不再发送
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+import deadline
+import dns_cache
+import metrics
+from correlation import REQUEST_ID_HEADER, current_request_id
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 需要压缩请求体的后端，逗号分隔，例如 "spring" 或 "spring,dify"；默认不压缩
+COMPRESS_BACKENDS = {b.strip().lower() for b in os.getenv("GMP_COMPRESS_REQUESTS", "").split(",") if b.strip()}
+# 请求体压缩算法: gzip 或 deflate
+COMPRESS_ENCODING = os.getenv("GMP_COMPRESS_ENCODING", "gzip").strip().lower()
+# 请求体达到该字节数才压缩
+COMPRESS_MIN_BYTES = int(os.getenv("GMP_COMPRESS_MIN_BYTES", "1024"))
+# 端点拒绝压缩请求体后，间隔多久(秒)再尝试压缩（服务端可能只是临时不接受，如部署切换期间）
+COMPRESS_RETRY_INTERVAL = float(os.getenv("GMP_COMPRESS_RETRY_INTERVAL", "600"))
+# 400响应体中表明是请求体编码问题的关键词（只检查开头部分）
+_ENCODING_ERROR_HINTS = ("content-encoding", "encoding", "gzip", "deflate", "compress", "decompress")
+_ENCODING_ERROR_SCAN_BYTES = 4096
+ACCEPT_ENCODING = "gzip, deflate"
+# 每个后端同时进行的最大请求数，0表示不限制
+BACKEND_MAX_CONCURRENCY = {
+    "spring": int(os.getenv("GMP_SPRING_MAX_CONCURRENCY", "8")),
+    "dify": int(os.getenv("GMP_DIFY_MAX_CONCURRENCY", "16")),
+}
+# 请求排队等待的最长时间(秒)
+BACKEND_QUEUE_TIMEOUT = float(os.getenv("GMP_BACKEND_QUEUE_TIMEOUT", "10"))
+# 流式发送时每个chunk的目标字节数
+STREAM_CHUNK_BYTES = 64 * 1024
+# 流式发送时列表每批序列化的项数
+STREAM_LIST_BATCH = 256
+
+_session = None
+_session_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+# 拒绝过压缩请求体的端点 -> 恢复压缩的时间(time.monotonic)
+_uncompressible_endpoints: Dict[str, float] = {}
+
+
+QUEUE_WAIT = "gmp_backend_queue_wait_seconds"
+QUEUE_TIMEOUTS = "gmp_backend_queue_timeouts_total"
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+metrics.registry.describe(QUEUE_WAIT, "Time requests waited for a backend concurrency slot in seconds",
+                          buckets=QUEUE_WAIT_BUCKETS)
+metrics.registry.describe(QUEUE_TIMEOUTS, "Requests rejected because no backend slot freed up in time")
+
+
+class BackendBusyError(requests.exceptions.RequestException):
+    """后端并发已满且排队超时"""
+
+
+class BackendLimiter:
+    """单个后端的并发限制：同时进行的请求数超过上限时排队等待
+
+    Args:
+        backend: 后端名称
+        limit: 最大并发请求数，0表示不限制
+        queue_timeout: 默认的最长排队时间(秒)
+    """
+
+    def __init__(self, backend: str, limit: int, queue_timeout: float = BACKEND_QUEUE_TIMEOUT):
+        self.backend = backend
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @contextmanager
+    def slot(self, queue_timeout: Optional[float] = None):
+        """占用一个并发名额，排队超时抛出BackendBusyError"""
+        if self._semaphore is None:
+            yield
+            return
+
+        timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        start = time.perf_counter()
+        acquired = self._semaphore.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.waiting += 1
+            try:
+                acquired = self._semaphore.acquire(timeout=timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        waited = time.perf_counter() - start
+        metrics.registry.observe(QUEUE_WAIT, waited, backend=self.backend)
+        with self._lock:
+            if waited >= 0.001:
+                self.queued += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            if acquired:
+                self.acquired += 1
+            else:
+                self.timeouts += 1
+        if not acquired:
+            metrics.registry.inc(QUEUE_TIMEOUTS, backend=self.backend)
+            logger.warning(f"{self.backend} backend busy: {self.limit} requests in flight, "
+                           f"gave up after waiting {waited:.2f}s")
+            raise BackendBusyError(f"{self.backend}服务繁忙（并发上限{self.limit}），排队{waited:.1f}秒后仍未轮到")
+
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """排队统计快照"""
+        with self._lock:
+            attempts = self.acquired + self.timeouts
+            return {
+                "backend": self.backend,
+                "limit": self.limit,
+                "requests": attempts,
+                "queued": self.queued,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+_limiters: Dict[str, BackendLimiter] = {
+    backend: BackendLimiter(backend, limit) for backend, limit in BACKEND_MAX_CONCURRENCY.items()
+}
+_UNLIMITED = BackendLimiter("unlimited", 0)
+
+
+def configure_limits(backend: str, limit: int, queue_timeout: Optional[float] = None) -> BackendLimiter:
+    """替换某个后端的并发限制（用于基准测试或运行时调整）
+
+    已在排队或进行中的请求仍按原限制完成。
+    """
+    limiter = BackendLimiter(backend, limit, BACKEND_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout)
+    _limiters[backend] = limiter
+    return limiter
+
+
+def get_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """返回各后端的排队统计"""
+    return {backend: limiter.stats() for backend, limiter in _limiters.items()}
+
+
+def get_session() -> requests.Session:
+    """返回进程内共享的requests.Session（首次调用时安装DNS缓存）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                dns_cache.install()
+                _session = requests.Session()
+    return _session
+
+
+def _endpoint_label(backend: str, url: str) -> str:
+    """统计用的端点标签，如 "spring:/api/pdf/generate" """
+    path = urlparse(url).path or "/"
+    if backend == "dify":
+        # Dify的api_base可能带有/v1等前缀，只保留最后一段
+        path = "/" + path.rstrip("/").rsplit("/", 1)[-1]
+    return f"{backend}:{path}"
+
+
+def _record(endpoint: str, **counters: int) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            "requests": 0,
+            "requests_compressed": 0,
+            "request_bytes_raw": 0,
+            "request_bytes_sent": 0,
+            "response_bytes_wire": 0,
+            "response_bytes_decoded": 0,
+        })
+        for key, value in counters.items():
+            stats[key] += value
+
+
+def get_compression_stats() -> Dict[str, Dict[str, int]]:
+    """返回每个端点的压缩统计，含请求/响应分别节省的字节数"""
+    with _stats_lock:
+        result = {}
+        for endpoint, stats in _stats.items():
+            result[endpoint] = dict(stats)
+            result[endpoint]["request_bytes_saved"] = stats["request_bytes_raw"] - stats["request_bytes_sent"]
+            result[endpoint]["response_bytes_saved"] = stats["response_bytes_decoded"] - stats["response_bytes_wire"]
+        return result
+
+
+def reset_compression_stats() -> None:
+    """清空压缩统计"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def compress_body(body: bytes, encoding: str = COMPRESS_ENCODING) -> bytes:
+    """按指定算法压缩请求体"""
+    if encoding == "deflate":
+        return zlib.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _compression_suspended(endpoint: str) -> bool:
+    """端点近期拒绝过压缩请求体；超过COMPRESS_RETRY_INTERVAL后恢复压缩"""
+    until = _uncompressible_endpoints.get(endpoint)
+    if until is None:
+        return False
+    if time.monotonic() < until:
+        return True
+    _uncompressible_endpoints.pop(endpoint, None)
+    return False
+
+
+def _rejects_compression(response: requests.Response) -> bool:
+    """服务端是否因请求体压缩而拒绝请求
+
+    415始终视为不支持该编码；400只有在响应声明了可接受的编码（Accept-Encoding，RFC 7694），
+    或响应体提到编码/压缩时才算，其他400（如报告数据校验失败）原样返回，不重试。
+    """
+    if response.status_code == 415:
+        return True
+    if response.status_code != 400:
+        return False
+    accepted = response.headers.get("Accept-Encoding")
+    if accepted is not None and COMPRESS_ENCODING not in accepted.lower():
+        return True
+    try:
+        text = response.content[:_ENCODING_ERROR_SCAN_BYTES].decode("utf-8", errors="ignore").lower()
+    except Exception:
+        return False
+    return any(hint in text for hint in _ENCODING_ERROR_HINTS)
+
+
+def _should_compress(backend: str, endpoint: str, size: int) -> bool:
+    return backend in COMPRESS_BACKENDS and size >= COMPRESS_MIN_BYTES and not _compression_suspended(endpoint)
+
+
+def _iter_json(value: Any, top: bool = True):
+    """逐段产出JSON文本
+
+    顶层字典逐个键展开，列表按STREAM_LIST_BATCH项一批用json.dumps（C实现）序列化，
+    既不生成完整的JSON字符串，也避免逐项调用的开销。
+    """
+    if top and isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield ("," if i else "") + json.dumps({key: None}, ensure_ascii=False, separators=(",", ":"))[1:-5]
+            yield from _iter_json(item, top=False)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        for start in range(0, len(value), STREAM_LIST_BATCH):
+            batch = json.dumps(value[start:start + STREAM_LIST_BATCH], ensure_ascii=False)
+            yield ("," if start else "") + batch[1:-1]
+        yield "]"
+    else:
+        yield json.dumps(value, ensure_ascii=False)
+
+
+def _stream_json_body(json_body: Any, compress: bool, counter: Dict[str, int]):
+    """逐段序列化JSON并按需压缩，产出约STREAM_CHUNK_BYTES大小的chunk
+
+    Args:
+        json_body: 要发送的对象
+        compress: 是否按COMPRESS_ENCODING压缩
+        counter: 累计原始字节数(raw)和实际发送字节数(sent)
+    """
+    compressor = None
+    if compress:
+        wbits = 31 if COMPRESS_ENCODING == "gzip" else 15
+        compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+    def emit(data: bytes) -> bytes:
+        counter["raw"] += len(data)
+        if compressor is not None:
+            data = compressor.compress(data)
+        counter["sent"] += len(data)
+        return data
+
+    pending = []
+    pending_size = 0
+    for piece in _iter_json(json_body):
+        data = piece.encode("utf-8")
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= STREAM_CHUNK_BYTES:
+            chunk = emit(b"".join(pending))
+            pending, pending_size = [], 0
+            if chunk:
+                yield chunk
+    chunk = emit(b"".join(pending)) if pending else b""
+    if compressor is not None:
+        tail = compressor.flush()
+        counter["sent"] += len(tail)
+        chunk += tail
+    if chunk:
+        yield chunk
+
+
+def _wire_length(response: requests.Response) -> int:
+    """响应在网络上传输的字节数（压缩后）"""
+    try:
+        consumed = response.raw.tell() if response.raw is not None else 0
+        if consumed:
+            return consumed
+    except Exception:
+        pass
+    content_length = response.headers.get("Content-Length")
+    return int(content_length) if content_length and content_length.isdigit() else len(response.content)
+
+
+def request(method: str, url: str, backend: str, headers: Optional[Dict[str, str]] = None,
+            json_body: Any = None, timeout: Optional[float] = None, stream_json: bool = False,
+            queue_timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    """发送HTTP请求
+
+    Args:
+        method: HTTP方法
+        url: 完整URL
+        backend: 后端名称，"dify" 或 "spring"，用于压缩配置和统计
+        headers: 请求头
+        json_body: 要以JSON发送的请求体，会按配置压缩
+        timeout: 超时时间(秒)，工具调用期间不超过本次调用的剩余时间
+        stream_json: 以chunked方式边序列化边发送json_body，用于大报告
+        queue_timeout: 后端并发已满时的最长排队时间(秒)，默认GMP_BACKEND_QUEUE_TIMEOUT
+        **kwargs: 其他传递给requests的参数（如files、params）
+
+    Returns:
+        requests.Response
+
+    Raises:
+        BackendBusyError: 排队超时
+        deadline.DeadlineExceeded: 本次工具调用的剩余时间已用完
+    """
+    endpoint = _endpoint_label(backend, url)
+    limiter = _limiters.get(backend, _UNLIMITED)
+    timeout = deadline.timeout(timeout, stage=endpoint)
+    if deadline.current() is not None:
+        # 排队等待也计入本次调用的时间
+        queue_timeout = min(limiter.queue_timeout if queue_timeout is None else queue_timeout, timeout)
+    headers = dict(headers or {})
+    headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+    request_id = current_request_id()
+    if request_id:
+        headers.setdefault(REQUEST_ID_HEADER, request_id)
+
+    streaming = stream_json and json_body is not None
+    counter = {"raw": 0, "sent": 0}
+    raw_body = None
+    body = None
+    if streaming:
+        # 流式请求体大小未知，只要后端开启了压缩就压缩
+        headers.setdefault("Content-Type", "application/json")
+        compressed = backend in COMPRESS_BACKENDS and not _compression_suspended(endpoint)
+        body = _stream_json_body(json_body, compressed, counter)
+    else:
+        if json_body is not None:
+            raw_body = json.dumps(json_body, ensure_ascii=False).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+            body = raw_body
+        compressed = raw_body is not None and _should_compress(backend, endpoint, len(raw_body))
+        if compressed:
+            body = compress_body(raw_body)
+    if compressed:
+        headers["Content-Encoding"] = COMPRESS_ENCODING
+
+    # 按后端限制同时进行的请求数，超过时排队等待，等待超时抛出BackendBusyError
+    with limiter.slot(queue_timeout):
+        session = get_session()
+        timeout = deadline.timeout(timeout, stage=endpoint)
+        response = session.request(method, url, headers=headers, data=body, timeout=timeout, **kwargs)
+
+        if compressed and _rejects_compression(response):
+            # 服务端不接受压缩请求体，一段时间内不再对该端点压缩，并以未压缩方式重试
+            logger.warning(f"{endpoint} rejected compressed request body ({response.status_code}), retrying uncompressed; "
+                           f"compression suspended for {COMPRESS_RETRY_INTERVAL:.0f}s")
+            _uncompressible_endpoints[endpoint] = time.monotonic() + COMPRESS_RETRY_INTERVAL
+            response.close()
+            headers.pop("Content-Encoding", None)
+            compressed = False
+            if streaming:
+                counter = {"raw": 0, "sent": 0}
+                body = _stream_json_body(json_body, False, counter)
+            else:
+                body = raw_body
+            timeout = deadline.timeout(timeout, stage=endpoint)
+            response = session.request(method, url, headers=headers, data=body, timeout=timeout, **kwargs)
+
+        decoded_length = len(response.content)
+    if streaming:
+        bytes_raw, bytes_sent = counter["raw"], counter["sent"]
+    else:
+        bytes_raw = len(raw_body) if raw_body is not None else 0
+        bytes_sent = len(body) if body is not None else 0
+    _record(endpoint,
+            requests=1,
+            requests_compressed=1 if compressed else 0,
+            request_bytes_raw=bytes_raw,
+            request_bytes_sent=bytes_sent,
+            response_bytes_wire=_wire_length(response),
+            response_bytes_decoded=decoded_length)
+    return response
+
+
+def get(url: str, backend: str, **kwargs) -> requests.Response:
+    """发送GET请求"""
+    return request("GET", url, backend, **kwargs)
+
+
+def post(url: str, backend: str, **kwargs) -> requests.Response:
+    """发送POST请求"""
+    return request("POST", url, backend, **kwargs)
+
+
+def _compression_collector():
+    """导出压缩统计到 /metrics"""
+    stats = get_compression_stats()
+    for field, help_text in (
+        ("requests", "HTTP requests sent to Dify/Spring"),
+        ("requests_compressed", "HTTP requests sent with a compressed body"),
+        ("request_bytes_saved", "Request body bytes saved by compression"),
+        ("response_bytes_saved", "Response body bytes saved by compression"),
+    ):
+        yield (f"gmp_http_{field}_total", "counter", help_text,
+               [({"endpoint": endpoint}, values[field]) for endpoint, values in stats.items()])
+
+
+metrics.registry.register_collector(_compression_collector)
+
+
+def _limiter_collector():
+    """导出各后端的并发限制、进行中和排队中的请求数"""
+    limiters = sorted(_limiters.values(), key=lambda limiter: limiter.backend)
+    yield ("gmp_backend_concurrency_limit", "gauge", "Maximum concurrent requests per backend (0 = unlimited)",
+           [({"backend": limiter.backend}, limiter.limit) for limiter in limiters])
+    yield ("gmp_backend_in_flight", "gauge", "Requests currently in flight per backend",
+           [({"backend": limiter.backend}, limiter.in_flight) for limiter in limiters])
+    yield ("gmp_backend_queued", "gauge", "Requests currently waiting for a backend slot",
+           [({"backend": limiter.backend}, limiter.waiting) for limiter in limiters])
+
+
+metrics.registry.register_collector(_limiter_collector)
@@ -0,0 +1,278 @@
+"""
+Bayer GMP Reporter - 异步日志配置
+
+工具在请求路径上只把日志记录放入内存队列，由后台线程写入按大小轮转的日志文件和控制台：
+- 队列有上限（GMP_LOG_QUEUE_SIZE）。队列满时丢弃INFO及以下级别的记录，
+  WARNING及以上级别的记录始终入队，保证错误不丢失
+- 被丢弃的条数按级别计数，在下一条成功入队的记录前写入一条汇总警告，并通过 /metrics 导出
+- 插件进程由gevent打补丁时，写入线程使用原生线程，磁盘I/O不会阻塞事件循环
+- 每条记录在入队前带上当前工具调用的关联ID（correlation.RequestIdFilter）
+- 请求路径上只解析消息参数（getMessage），时间、格式和异常堆栈的格式化都在写入线程中进行
+"""
+import atexit
+import logging
+import os
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Empty
+from typing import Dict, List, Optional
+
+import metrics
+from correlation import RequestIdFilter
+
+try:
+    from gevent import monkey as _gevent_monkey
+    _start_native_thread = _gevent_monkey.get_original("_thread", "start_new_thread")
+    _allocate_native_lock = _gevent_monkey.get_original("_thread", "allocate_lock")
+    _NativeQueue = _gevent_monkey.get_original("queue", "SimpleQueue")
+    _NativeRLock = _gevent_monkey.get_original("threading", "RLock")
+except ImportError:
+    import _thread
+    import queue as _queue
+    _start_native_thread = _thread.start_new_thread
+    _allocate_native_lock = _thread.allocate_lock
+    _NativeQueue = _queue.SimpleQueue
+    _NativeRLock = threading.RLock
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# 日志配置
+LOG_LEVEL = os.getenv("GMP_LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("GMP_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("GMP_LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("GMP_LOG_QUEUE_SIZE", "10000"))
+# 是否关闭日志记录中调用位置、线程和进程信息的采集（logging模块的全局开关，默认不修改）
+LOG_LEAN_RECORDS = os.getenv("GMP_LOG_LEAN_RECORDS", "false").strip().lower() in ("1", "true", "yes", "on")
+# LOG_LEAN_RECORDS修改的logging模块全局变量
+_RECORD_FLAGS = ("_srcfile", "logThreads", "logProcesses", "logMultiprocessing")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["BoundedQueueHandler"] = None
+# 关闭记录字段采集前logging模块全局变量的原值，shutdown_logging时恢复
+_saved_record_flags: Optional[Dict[str, object]] = None
+
+
+class BoundedQueueHandler(QueueHandler):
+    """写入有界队列的日志处理器，队列满时按级别丢弃记录"""
+
+    def __init__(self, log_queue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped: Dict[str, int] = {}
+        self._unreported = 0
+        self._drop_lock = threading.Lock()
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # 入队本身是线程安全的，省去Handler.handle中每条记录的加锁（gevent补丁后的锁开销较大）
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在调用方线程解析消息参数（参数可能在入队后被修改），不做格式化；
+        # 队列在进程内，异常信息原样交给写入线程格式化。用浅拷贝__dict__代替copy.copy
+        prepared = logging.LogRecord.__new__(type(record))
+        prepared.__dict__.update(record.__dict__)
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        return prepared
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            # 先判断是否丢弃，被丢弃的记录不做格式化
+            if record.levelno < logging.WARNING and self.queue.qsize() >= self.max_size:
+                with self._drop_lock:
+                    self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+                    self._unreported += 1
+                return
+
+            if self._unreported:
+                with self._drop_lock:
+                    unreported, self._unreported = self._unreported, 0
+                if unreported:
+                    notice = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                               f"Log queue full, dropped {unreported} records", None, None)
+                    notice.request_id = getattr(record, "request_id", "-")
+                    self.queue.put_nowait(self.prepare(notice))
+            self.queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def dropped_total(self) -> int:
+        """累计丢弃的记录数"""
+        with self._drop_lock:
+            return sum(self.dropped.values())
+
+
+class _BatchWriteMixin:
+    """在写入线程中格式化一批记录（包括异常堆栈），一次写入并只flush一次，减少写入线程的系统调用"""
+
+    def handle_batch(self, records: List[logging.LogRecord]) -> None:
+        records = [record for record in records if record.levelno >= self.level and self.filter(record)]
+        if not records:
+            return
+        try:
+            text = "".join(self.format(record) + self.terminator for record in records)
+            with self.lock:
+                self._write_batch(text)
+        except Exception:
+            self.handleError(records[-1])
+
+    def _write_batch(self, text: str) -> None:
+        self.stream.write(text)
+        self.flush()
+
+
+class BatchStreamHandler(_BatchWriteMixin, logging.StreamHandler):
+    """支持批量写入的控制台处理器"""
+
+
+class BatchRotatingFileHandler(_BatchWriteMixin, RotatingFileHandler):
+    """支持批量写入的轮转文件处理器，每批只检查一次是否需要轮转"""
+
+    def _write_batch(self, text: str) -> None:
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.stream.tell() + len(text.encode(self.encoding or 'utf-8')) >= self.maxBytes:
+            self.doRollover()
+        self.stream.write(text)
+        self.flush()
+
+
+class _NativeQueueListener(QueueListener):
+    """在原生线程中运行的QueueListener，每次取出队列中已有的全部记录批量写入"""
+
+    # 单批最多处理的记录数
+    batch_size = 512
+
+    def start(self) -> None:
+        # threading.Thread在gevent补丁后仍以协程运行，这里直接启动原生线程
+        self._finished = _allocate_native_lock()
+        self._finished.acquire()
+
+        def run():
+            try:
+                self._monitor()
+            finally:
+                self._finished.release()
+
+        _start_native_thread(run, ())
+        self._thread = True
+
+    def stop(self) -> None:
+        if self._thread:
+            self.enqueue_sentinel()
+            self._finished.acquire()
+            self._thread = None
+
+    def _monitor(self) -> None:
+        log_queue = self.queue
+        while True:
+            batch = [log_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except Empty:
+                    break
+            stopping = batch[-1] is self._sentinel
+            records = [record for record in batch if record is not self._sentinel]
+            if records:
+                for handler in self.handlers:
+                    handler.handle_batch(records)
+            if stopping:
+                break
+
+
+def _build_handlers(log_file: Optional[str], console, max_bytes: int, backup_count: int) -> List[logging.Handler]:
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: List[logging.Handler] = []
+    if console:
+        handlers.append(BatchStreamHandler(sys.stdout if console == "stdout" else sys.stderr))
+    if log_file:
+        handlers.append(BatchRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                 encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        # 处理器只在写入线程中使用，改用原生锁
+        handler.lock = _NativeRLock()
+    return handlers
+
+
+def setup_logging(log_file: Optional[str] = "bayer_gmp_plugin.log", level: str = LOG_LEVEL,
+                  console="stderr", max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT,
+                  queue_size: int = LOG_QUEUE_SIZE, lean_records: bool = LOG_LEAN_RECORDS) -> BoundedQueueHandler:
+    """配置根日志记录器使用队列异步写日志
+
+    Args:
+        log_file: 日志文件路径，为None时只输出到控制台
+        level: 日志级别
+        console: 控制台输出目标，"stderr"、"stdout"或False
+        max_bytes: 单个日志文件的最大字节数，超过后轮转
+        backup_count: 保留的轮转文件个数
+        queue_size: 队列上限，超过后丢弃INFO及以下级别的记录
+        lean_records: 关闭调用位置、线程和进程信息的采集，降低每条记录的开销；
+            这些是logging模块的全局开关，会影响进程内所有日志处理器，shutdown_logging时恢复原值
+
+    Returns:
+        安装到根日志记录器的队列处理器
+    """
+    global _listener, _queue_handler, _saved_record_flags
+    shutdown_logging()
+
+    if lean_records:
+        # 日志格式不包含调用位置、线程和进程信息，关闭这些字段的采集以降低每条记录的开销
+        _saved_record_flags = {name: getattr(logging, name) for name in _RECORD_FLAGS}
+        logging._srcfile = None
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+
+    log_queue = _NativeQueue()
+    queue_handler = BoundedQueueHandler(log_queue, max_size=queue_size)
+    # 关联ID保存在请求上下文中，必须在调用方线程入队前写入记录
+    queue_handler.addFilter(RequestIdFilter())
+    handlers = _build_handlers(log_file, console, max_bytes, backup_count)
+    _listener = _NativeQueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    _queue_handler = queue_handler
+    return queue_handler
+
+
+def shutdown_logging() -> None:
+    """停止写入线程并刷新队列中剩余的日志，恢复lean_records修改的logging全局变量"""
+    global _listener, _queue_handler, _saved_record_flags
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    if _saved_record_flags is not None:
+        for name, value in _saved_record_flags.items():
+            setattr(logging, name, value)
+        _saved_record_flags = None
+
+
+def _logging_collector():
+    """导出日志队列统计到 /metrics"""
+    handler = _queue_handler
+    if handler is None:
+        return
+    yield ("gmp_log_records_dropped_total", "counter", "Log records dropped because the log queue was full",
+           [({"level": name}, count) for name, count in sorted(handler.dropped.items())])
+    yield ("gmp_log_queue_depth", "gauge", "Log records waiting to be written",
+           [({}, handler.queue.qsize())])
+
+
+metrics.registry.register_collector(_logging_collector)
+atexit.register(shutdown_logging)
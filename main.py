@@ -1,22 +1,22 @@
 """
 Bayer GMP Reporter Plugin - 主入口文件
 """
-import logging
+# 最先加载.env，使各模块导入时读取的配置包含其中的值
+import config
 
 from dify_plugin import Plugin, DifyPluginEnv
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("bayer_gmp_plugin.log")
-    ]
-)
+from logging_setup import setup_logging
+from warmup import start_warmup
+
+# 配置日志：记录先进入有界队列，由后台线程写入轮转日志文件
+setup_logging("bayer_gmp_plugin.log")
+
+# GMP_WARMUP开启时在后台预先解析并连接后端，减少第一份报告的连接建立耗时
+start_warmup()
 
 # 创建插件实例
-plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
+plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=config.MAX_REQUEST_TIMEOUT))
 
 if __name__ == '__main__':
     plugin.run() 
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Bayer GMP Reporter - 内存预算与高水位跟踪
+
+manifest.yaml 为插件声明的内存有限，而一次调用会同时持有原始报告字符串、解析后的字典、
+规范化后的副本和PDF内容。这里提供：
+- 输入大小检查：报告数据超过GMP_MAX_REPORT_BYTES时在解析前直接拒绝，给出明确的错误信息；
+  超过GMP_STREAM_REPORT_BYTES时由调用方切换到精简（流式）处理路径
+- 阶段内存高水位：GMP_MEMORY_TRACKING开启后，借助tracemalloc记录每个阶段（metrics.span）
+  内相对进入时新增的内存峰值，导出为直方图gmp_stage_memory_peak_bytes；tool.*阶段即单次调用的峰值
+
+tracemalloc本身有明显的CPU和内存开销，默认关闭。它统计的是整个进程的分配，
+gevent下并发请求的分配也会计入当前阶段；开启cpu/memory剖析时也会干扰峰值统计。
+"""
+import logging
+import os
+import threading
+import tracemalloc
+from typing import Any, Dict, Optional
+
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否开启阶段内存高水位跟踪
+MEMORY_TRACKING = os.getenv("GMP_MEMORY_TRACKING", "false").strip().lower() in ("1", "true", "yes", "on")
+# 报告数据的最大字节数，超过则拒绝
+MAX_REPORT_BYTES = int(os.getenv("GMP_MAX_REPORT_BYTES", str(16 * 1024 * 1024)))
+# 报告数据超过该字节数时使用精简处理路径（跳过LLM优化、流式发送请求体）
+STREAM_REPORT_BYTES = int(os.getenv("GMP_STREAM_REPORT_BYTES", str(1024 * 1024)))
+# 单次调用（tool.*阶段）峰值超过该字节数时输出警告，0表示不警告
+MEMORY_WARN_BYTES = int(os.getenv("GMP_MEMORY_WARN_BYTES", str(64 * 1024 * 1024)))
+
+STAGE_MEMORY_PEAK = "gmp_stage_memory_peak_bytes"
+MEMORY_BUCKETS = tuple(float(1 << shift) for shift in range(16, 31, 2))  # 64KiB - 1GiB
+
+metrics.registry.describe(STAGE_MEMORY_PEAK, "Peak memory allocated within each processing stage in bytes",
+                          buckets=MEMORY_BUCKETS)
+
+
+class ReportTooLargeError(ValueError):
+    """报告数据超过允许的大小"""
+
+
+def payload_size(value: Any) -> Optional[int]:
+    """字符串参数的UTF-8字节数；非字符串返回None
+
+    纯ASCII字符串直接取长度；其他字符串分段编码计数，避免为计算大小再复制一份完整内容。
+    """
+    if not isinstance(value, str):
+        return None
+    if value.isascii():
+        return len(value)
+    step = 64 * 1024
+    return sum(len(value[i:i + step].encode("utf-8", errors="surrogatepass")) for i in range(0, len(value), step))
+
+
+def check_report_size(value: Any, limit: Optional[int] = None) -> int:
+    """检查报告数据大小，超过限制时抛出ReportTooLargeError
+
+    Args:
+        value: 工具收到的报告数据参数
+        limit: 最大字节数，默认取GMP_MAX_REPORT_BYTES，0或负数表示不限制
+
+    Returns:
+        报告数据的字节数，非字符串参数返回0
+    """
+    if limit is None:
+        limit = MAX_REPORT_BYTES
+    size = payload_size(value) or 0
+    if limit > 0 and size > limit:
+        raise ReportTooLargeError(
+            f"报告数据过大（{size / 1024 / 1024:.1f} MB），超过允许的 {limit / 1024 / 1024:.1f} MB，"
+            f"请精简报告内容或拆分后再生成"
+        )
+    return size
+
+
+def use_streaming(size: int) -> bool:
+    """报告数据是否需要走精简（流式）处理路径"""
+    return STREAM_REPORT_BYTES > 0 and size > STREAM_REPORT_BYTES
+
+
+class _StageMemoryTracker:
+    """metrics.span的监听器，记录每个阶段的内存高水位
+
+    tracemalloc只有一个全局峰值，嵌套阶段进入和离开时都会重置峰值，
+    因此在重置前把当前峰值折算进所有外层阶段的max_seen。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._peaks: Dict[str, int] = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, stage: str) -> Optional[Dict[str, int]]:
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        stack = self._stack()
+        for frame in stack:
+            frame["max_seen"] = max(frame["max_seen"], peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "max_seen": current}
+        stack.append(frame)
+        return frame
+
+    def exit(self, stage: str, frame: Optional[Dict[str, int]]) -> None:
+        if frame is None or not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        stack = self._stack()
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is frame:
+                del stack[i]
+                break
+        frame["max_seen"] = max(frame["max_seen"], peak)
+        for outer in stack:
+            outer["max_seen"] = max(outer["max_seen"], frame["max_seen"])
+        tracemalloc.reset_peak()
+
+        stage_peak = max(frame["max_seen"] - frame["start"], 0)
+        metrics.registry.observe(STAGE_MEMORY_PEAK, stage_peak, stage=stage)
+        with self._lock:
+            self._peaks[stage] = max(self._peaks.get(stage, 0), stage_peak)
+        if stage.startswith("tool.") and 0 < MEMORY_WARN_BYTES < stage_peak:
+            logger.warning(f"{stage} peak memory {stage_peak / 1024 / 1024:.1f} MB exceeds "
+                           f"{MEMORY_WARN_BYTES / 1024 / 1024:.1f} MB")
+
+    def peaks(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._peaks)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._peaks.clear()
+
+
+_tracker = _StageMemoryTracker()
+_tracking_enabled = False
+
+
+def enable_tracking(frames: int = 1) -> None:
+    """开启阶段内存高水位跟踪（重复调用无副作用）
+
+    Args:
+        frames: tracemalloc保存的调用栈深度，只统计大小时1即可
+    """
+    global _tracking_enabled
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    if not _tracking_enabled:
+        metrics.add_span_listener(_tracker)
+        _tracking_enabled = True
+        logger.info("Stage memory tracking enabled")
+
+
+def get_stage_peaks() -> Dict[str, int]:
+    """各阶段观测到的最大内存峰值(字节)"""
+    return _tracker.peaks()
+
+
+def reset_stage_peaks() -> None:
+    """清空各阶段的峰值记录"""
+    _tracker.reset()
+
+
+if MEMORY_TRACKING:
+    enable_tracking()
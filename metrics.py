@@ -0,0 +1,253 @@
+"""
+Bayer GMP Reporter - 阶段耗时与指标
+
+为各工具和公共函数提供轻量的阶段计时（直方图）和计数器，并以Prometheus文本格式导出，
+供插件的 /metrics 端点使用。所有数据保存在进程内存中，插件重启后清零。
+
+用法：
+    @timed("dify.llm")
+    def call_dify_model(...): ...
+
+    with span("spring.render"):
+        response = http_client.post(...)
+"""
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 直方图分桶上限(秒)，覆盖从本地处理到LLM/Spring渲染的耗时范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_DURATION = "gmp_stage_duration_seconds"
+STAGE_ERRORS = "gmp_stage_errors_total"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """单个标签组合的直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """进程内指标注册表：计数器、直方图以及外部统计的采集函数"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {
+            STAGE_DURATION: "Duration of each processing stage in seconds",
+            STAGE_ERRORS: "Number of stage executions that raised an exception",
+        }
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, Any]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def describe(self, name: str, help_text: str, buckets: Tuple[float, ...] = None) -> None:
+        """设置指标的HELP说明，直方图可指定自己的分桶"""
+        self._help[name] = help_text
+        if buckets:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器加值"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次直方图观测值"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, self.buckets))
+            histogram.observe(value)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]) -> None:
+        """注册外部统计的采集函数
+
+        采集函数返回 (指标名, 类型, 说明, [(标签字典, 值), ...]) 的序列，在导出时调用。
+        """
+        self._collectors.append(collector)
+
+    def reset(self) -> None:
+        """清空计数器和直方图"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回各阶段耗时的汇总，便于日志或基准脚本使用"""
+        with self._lock:
+            stages = {}
+            for key, histogram in self._histograms.get(STAGE_DURATION, {}).items():
+                labels = dict(key)
+                stages[labels.get("stage", "")] = {
+                    "count": histogram.total,
+                    "sum_seconds": round(histogram.sum, 6),
+                    "avg_ms": round(histogram.sum / histogram.total * 1000, 3) if histogram.total else 0.0,
+                }
+            return {"stages": stages}
+
+    def render_prometheus(self) -> str:
+        """以Prometheus文本格式导出全部指标"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for upper, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(upper)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.total}")
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for collector in self._collectors:
+            try:
+                for name, metric_type, help_text, samples in collector():
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for labels, value in samples:
+                        lines.append(f"{name}{_format_labels(self._key(labels))} {_format_value(value)}")
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, metric_type: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = []
+    for name, value in key:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 进程内唯一的注册表
+registry = MetricsRegistry()
+
+# 阶段监听器：进入阶段时调用enter(stage)得到令牌，离开时调用exit(stage, token)
+_span_listeners: List[Any] = []
+
+
+def add_span_listener(listener: Any) -> None:
+    """注册阶段监听器（如内存高水位跟踪），监听器需提供enter和exit方法"""
+    _span_listeners.append(listener)
+
+
+@contextmanager
+def span(stage: str):
+    """记录一个阶段的耗时；阶段内抛出异常时同时累加错误计数
+
+    Args:
+        stage: 阶段名，如 "dify.llm"、"spring.render"
+    """
+    tokens = [(listener, listener.enter(stage)) for listener in _span_listeners] if _span_listeners else ()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            registry.inc(STAGE_ERRORS, stage=stage)
+        raise
+    finally:
+        registry.observe(STAGE_DURATION, time.perf_counter() - start, stage=stage)
+        for listener, token in reversed(tokens):
+            listener.exit(stage, token)
+
+
+def timed(stage: str):
+    """为函数或生成器函数添加阶段计时的装饰器
+
+    生成器函数的耗时从开始迭代计算到迭代结束，因此工具的 _invoke 也可以直接使用。
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with span(stage):
+                    return (yield from func(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    """计数器加值"""
+    registry.inc(name, value, **labels)
+
+
+def render_prometheus() -> str:
+    """以Prometheus文本格式导出全部指标"""
+    return registry.render_prometheus()
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """计算百分位数（最近秩法），批量处理的汇总和基准脚本共用
+
+    Args:
+        values: 样本值
+        pct: 百分位，0-100
+
+    Returns:
+        百分位数值，样本为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
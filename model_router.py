@@ -0,0 +1,184 @@
+"""
+Bayer GMP Reporter - 按任务选择Dify模型
+
+结构化数据提取（extract）和报告润色（optimize）对模型的要求不同，可以分别配置不同的Dify应用
+（每个应用的API密钥对应其中配置的模型）：
+- GMP_MODEL_EXTRACT_API_KEY / GMP_MODEL_OPTIMIZE_API_KEY：该任务使用的Dify应用
+- GMP_MODEL_FAST_API_KEY：配置较快模型的Dify应用，作为各任务的后备
+- GMP_MODEL_EXTRACT_API_BASE / GMP_MODEL_OPTIMIZE_API_BASE / GMP_MODEL_FAST_API_BASE：各应用的API地址，
+  默认取GMP_MODEL_API_BASE，再默认与调用方的api_base相同
+- 调用方上下文中的api_key始终作为default路由参与选择；未配置任何路由时行为与原来相同
+
+每条路由在每种任务下的耗时和失败率以指数加权平均记录在进程内的记分板上（同一应用做提取和润色的耗时差别很大，
+按 (任务, 路由) 分别记录），按预期耗时（失败率越高惩罚越大）选择路由；
+按记分板估计的耗时会超出本次调用剩余的MAX_REQUEST_TIMEOUT预算时改用较快的路由，
+路由调用失败时在剩余预算内依次尝试下一条路由。路由选择和结果导出为
+gmp_model_route_total{task, route, result} 和 gmp_model_fallback_total{task, reason}。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import deadline
+from config import MAX_REQUEST_TIMEOUT
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 路由所用Dify应用的默认API地址，为空时使用调用方上下文中的api_base
+MODEL_API_BASE = os.getenv("GMP_MODEL_API_BASE", "").strip()
+# 各路由的 (API密钥, API地址)：extract、optimize为对应任务专用，fast为较快模型，作为各任务的后备
+ROUTE_CONFIG = {
+    name: (os.getenv(f"GMP_MODEL_{name.upper()}_API_KEY", "").strip(),
+           os.getenv(f"GMP_MODEL_{name.upper()}_API_BASE", "").strip() or MODEL_API_BASE)
+    for name in ("extract", "optimize", "fast")
+}
+# 预估耗时乘以该系数后仍在剩余预算内才选择该路由
+BUDGET_SAFETY_FACTOR = 1.5
+# 失败率超过该值的路由视为不可用，超过恢复间隔(秒)后放行一次用于探测
+UNHEALTHY_ERROR_RATE = 0.5
+RECOVERY_INTERVAL = 30.0
+
+MODEL_ROUTE = "gmp_model_route_total"
+MODEL_FALLBACK = "gmp_model_fallback_total"
+
+metrics.registry.describe(MODEL_ROUTE, "Dify model calls by task, route and result (success or error)")
+metrics.registry.describe(MODEL_FALLBACK, "Dify model calls moved to another route, by reason "
+                                          "(budget: expected latency exceeded the remaining budget, error)")
+
+
+class Route:
+    """一个Dify应用：名称、API地址和密钥"""
+
+    __slots__ = ("name", "api_base", "api_key")
+
+    def __init__(self, name: str, api_base: str, api_key: str):
+        self.name = name
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+
+    def __repr__(self) -> str:
+        return f"Route({self.name})"
+
+
+class RouteScoreboard:
+    """按 (任务, 路由) 记录近期的耗时和失败率"""
+
+    def __init__(self, alpha: float = 0.3, recovery_interval: float = RECOVERY_INTERVAL):
+        self.alpha = alpha
+        self.recovery_interval = recovery_interval
+        self._routes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, task: str, route: str, success: bool, latency: float) -> None:
+        """记录一次调用的结果和耗时(秒)；失败的调用也计入耗时，超时的路由会显得更慢"""
+        with self._lock:
+            entry = self._routes.get((task, route))
+            if entry is None:
+                self._routes[(task, route)] = {"latency": latency, "error_rate": 0.0 if success else 1.0,
+                                       "calls": 1, "errors": 0 if success else 1, "last_call": time.monotonic()}
+                return
+            entry["latency"] = self.alpha * latency + (1 - self.alpha) * entry["latency"]
+            entry["error_rate"] = self.alpha * (0.0 if success else 1.0) + (1 - self.alpha) * entry["error_rate"]
+            entry["calls"] += 1
+            entry["errors"] += 0 if success else 1
+            entry["last_call"] = time.monotonic()
+
+    def expected_latency(self, task: str, route: str) -> Optional[float]:
+        """预估耗时(秒)，没有记录时返回None"""
+        with self._lock:
+            entry = self._routes.get((task, route))
+            return entry["latency"] if entry else None
+
+    def score(self, task: str, route: str) -> float:
+        """越小越好：预估耗时按失败率加权；没有记录的路由为0，优先尝试以获得记录"""
+        with self._lock:
+            entry = self._routes.get((task, route))
+            if entry is None:
+                return 0.0
+            return entry["latency"] * (1 + 4 * entry["error_rate"])
+
+    def healthy(self, task: str, route: str) -> bool:
+        """失败率未超过阈值，或已超过恢复间隔可以再试一次"""
+        with self._lock:
+            entry = self._routes.get((task, route))
+            if entry is None or entry["error_rate"] <= UNHEALTHY_ERROR_RATE:
+                return True
+            return time.monotonic() - entry["last_call"] >= self.recovery_interval
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {f"{task}/{route}": {"latency_ms": round(entry["latency"] * 1000, 1),
+                            "error_rate": round(entry["error_rate"], 3),
+                            "calls": entry["calls"], "errors": entry["errors"]}
+                    for (task, route), entry in self._routes.items()}
+
+
+scoreboard = RouteScoreboard()
+
+
+def remaining_budget() -> float:
+    """本次工具调用剩余的时间预算(秒)；不在工具调用中时为完整的MAX_REQUEST_TIMEOUT"""
+    remaining = deadline.remaining()
+    return MAX_REQUEST_TIMEOUT if remaining is None else remaining
+
+
+def plan_routes(task: str, context: Dict[str, Any], remaining: Optional[float] = None) -> List[Route]:
+    """按任务和记分板确定路由的尝试顺序
+
+    Args:
+        task: 任务类型，extract或optimize，其他值只使用default路由（及后备路由）
+        context: 调用方上下文，包含api_base和api_key
+        remaining: 剩余预算(秒)，默认按当前工具调用计算
+
+    Returns:
+        路由列表，依次尝试；较快的后备路由排在最后，预算不足时提前
+    """
+    api_base = context.get("api_base", "")
+    candidates = []
+    if task in ("extract", "optimize") and ROUTE_CONFIG[task][0]:
+        api_key, route_base = ROUTE_CONFIG[task]
+        candidates.append(Route(task, route_base or api_base, api_key))
+    if context.get("api_key"):
+        candidates.append(Route("default", api_base, context["api_key"]))
+    fast_key, fast_base = ROUTE_CONFIG["fast"]
+    fast = Route("fast", fast_base or api_base, fast_key) if fast_key else None
+    if not candidates and fast is None:
+        return []
+
+    # 可用的路由按分数排序（同分时保持配置顺序：任务专用在前），不可用的排在后面
+    candidates.sort(key=lambda route: (not scoreboard.healthy(task, route.name), scoreboard.score(task, route.name)))
+    if fast is None:
+        return candidates
+
+    routes = candidates + [fast]
+    remaining = remaining_budget() if remaining is None else remaining
+    expected = scoreboard.expected_latency(task, routes[0].name)
+    fast_expected = scoreboard.expected_latency(task, "fast")
+    if expected is not None and expected * BUDGET_SAFETY_FACTOR > remaining and \
+            (fast_expected is None or fast_expected < expected):
+        logger.warning(f"Model route {routes[0].name} for {task} is expected to take {expected:.1f}s, "
+                       f"only {remaining:.1f}s of the request budget left; using the fast route")
+        metrics.registry.inc(MODEL_FALLBACK, task=task, reason="budget")
+        routes = [fast] + candidates
+    return routes
+
+
+def record_call(task: str, route: Route, success: bool, latency: float) -> None:
+    """记录一次路由调用的结果"""
+    scoreboard.record(task, route.name, success, latency)
+    metrics.registry.inc(MODEL_ROUTE, task=task, route=route.name, result="success" if success else "error")
+
+
+def record_fallback(task: str, route: Route) -> None:
+    """记录调用失败后改用下一条路由"""
+    logger.warning(f"Model route {route.name} failed for {task}, trying the next route")
+    metrics.registry.inc(MODEL_FALLBACK, task=task, reason="error")
+
+
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    """各任务下各路由的预估耗时、失败率和调用次数，键为"任务/路由"（如extract/default）"""
+    return scoreboard.stats()
@@ -0,0 +1,128 @@
+"""
+Bayer GMP Reporter - 报告数据等大对象的日志输出
+
+大报告只为写日志就要序列化多次，即使INFO日志关闭也一样。这里的辅助函数：
+- 延迟渲染：只有日志记录真正输出时才序列化对象
+- 字节预算：每条记录的载荷部分按UTF-8字节截断（GMP_LOG_PAYLOAD_BYTES），
+  大对象只序列化到预算为止，不为截断而生成完整的JSON
+- 采样：按请求采样是否输出载荷（GMP_LOG_PAYLOAD_SAMPLE_RATE），同一请求内要么全部输出要么全部跳过
+- 请求级调试：在payload_scope(debug=True)中执行的请求总是输出载荷，并使用更大的预算（GMP_LOG_PAYLOAD_DEBUG_BYTES）
+
+请求的采样和调试状态只在payload_scope内有效，离开时恢复之前的状态，不会带到同一上下文中之后的工作。
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+from contextlib import contextmanager
+from typing import Any, Optional
+
+# 每条日志中载荷部分的字节预算
+PAYLOAD_LOG_BYTES = int(os.getenv("GMP_LOG_PAYLOAD_BYTES", "1000"))
+# 调试请求的字节预算
+PAYLOAD_LOG_DEBUG_BYTES = int(os.getenv("GMP_LOG_PAYLOAD_DEBUG_BYTES", "65536"))
+# 输出载荷的请求比例，0-1
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("GMP_LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+# 当前请求的 (是否采样, 是否调试)
+_request_state: contextvars.ContextVar = contextvars.ContextVar("gmp_payload_logging", default=None)
+
+
+class LazyPayload:
+    """在被格式化为字符串时才序列化的日志参数
+
+    Args:
+        value: 要输出的对象，字符串原样输出，其他对象序列化为JSON
+        budget: 字节预算，超出部分截断；None表示使用当前请求的预算
+        indent: JSON缩进
+    """
+
+    __slots__ = ("value", "budget", "indent")
+
+    def __init__(self, value: Any, budget: Optional[int] = None, indent: Optional[int] = None):
+        self.value = value
+        self.budget = budget
+        self.indent = indent
+
+    def __str__(self) -> str:
+        budget = self.budget if self.budget is not None else current_budget()
+        if isinstance(self.value, str):
+            return truncate_bytes(self.value, budget)
+        try:
+            if budget <= 0:
+                return json.dumps(self.value, ensure_ascii=False, indent=self.indent, default=str)
+            # 逐段序列化，超过预算即停止
+            pieces, size = [], 0
+            encoder = json.JSONEncoder(ensure_ascii=False, indent=self.indent, default=str)
+            for piece in encoder.iterencode(self.value):
+                pieces.append(piece)
+                size += len(piece)
+                if size > budget:
+                    text = "".join(pieces)
+                    return text.encode("utf-8")[:budget].decode("utf-8", errors="ignore") + "...(已截断)"
+            return truncate_bytes("".join(pieces), budget)
+        except Exception:
+            return truncate_bytes(str(self.value), budget)
+
+    __repr__ = __str__
+
+
+def truncate_bytes(text: str, budget: int) -> str:
+    """按UTF-8字节数截断文本，并注明原始长度
+
+    只编码预算范围内的前缀（每个字符至少1字节），长文本不会被整体复制。
+    """
+    if budget <= 0:
+        return text
+    encoded = text[:budget].encode("utf-8", errors="replace")
+    if len(text) <= budget and len(encoded) <= budget:
+        return text
+    return encoded[:budget].decode("utf-8", errors="ignore") + f"...(已截断，共{len(text)}字符)"
+
+
+@contextmanager
+def payload_scope(debug: bool = False):
+    """在其中执行的工具调用使用同一个载荷日志策略（采样、调试预算），离开时恢复之前的策略
+
+    Args:
+        debug: 是否为调试请求，调试请求总是输出载荷
+    """
+    sampled = debug or PAYLOAD_LOG_SAMPLE_RATE >= 1 or random.random() < PAYLOAD_LOG_SAMPLE_RATE
+    token = _request_state.set((sampled, debug))
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+def payload_enabled() -> bool:
+    """当前请求是否输出载荷"""
+    state = _request_state.get()
+    return state[0] if state else PAYLOAD_LOG_SAMPLE_RATE > 0
+
+
+def current_budget() -> int:
+    """当前请求的载荷字节预算"""
+    state = _request_state.get()
+    return PAYLOAD_LOG_DEBUG_BYTES if state and state[1] else PAYLOAD_LOG_BYTES
+
+
+def log_payload(logger: logging.Logger, label: str, value: Any, level: int = logging.INFO,
+                budget: Optional[int] = None, indent: Optional[int] = None) -> None:
+    """输出一条带载荷的日志；级别未开启或本次请求未被采样时不做任何序列化
+
+    Args:
+        logger: 日志记录器
+        label: 载荷说明
+        value: 载荷对象
+        level: 日志级别
+        budget: 字节预算，默认使用当前请求的预算；调试请求不小于调试预算
+        indent: JSON缩进
+    """
+    if not logger.isEnabledFor(level) or not payload_enabled():
+        return
+    state = _request_state.get()
+    if budget is not None and state and state[1]:
+        budget = max(budget, PAYLOAD_LOG_DEBUG_BYTES)
+    logger.log(level, "%s: %s", label, LazyPayload(value, budget, indent))
@@ -0,0 +1,320 @@
+"""
+Bayer GMP Reporter - 本地PDF渲染
+
+不依赖Spring服务，直接在插件进程内根据规范化后的报告数据生成GMP调查报告PDF。
+版式与Spring模板保持一致：报告头、事件、根本原因与影响评估、CAPA措施、审核人。
+
+中文使用PDF预定义的STSong-Light CID字体（UniGB-UCS2-H编码），无需嵌入字体文件，
+常见PDF阅读器均可正常显示。
+"""
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# A4页面尺寸(pt)与版心
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN_X = 50
+MARGIN_TOP = 60
+MARGIN_BOTTOM = 60
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN_X
+
+TITLE_SIZE = 18
+HEADING_SIZE = 13
+BODY_SIZE = 10.5
+BODY_LEADING = 16
+
+# 报告头表格的字段
+HEADER_FIELDS = [
+    ("参考SOP编号", "refSop"),
+    ("文档ID", "docId"),
+    ("版本号", "version"),
+    ("调查ID", "investigationId"),
+    ("准备人员", "preparedBy"),
+    ("准备日期", "preparedDate"),
+]
+
+# 按顺序输出的正文段落
+TEXT_SECTIONS = [
+    ("一、概述", "summary"),
+    ("三、调查过程", "investigation"),
+    ("四、根本原因", "rootCause"),
+    ("五、影响评估", "impactAssessment"),
+    ("六、处理措施", "handling"),
+]
+
+
+def _char_width(char: str, size: float) -> float:
+    """估算单个字符宽度：ASCII为半角，其余为全角"""
+    return size * (0.5 if ord(char) < 128 else 1.0)
+
+
+def _encode_text(text: str) -> str:
+    """将文本编码为UniGB-UCS2-H使用的UTF-16BE十六进制串"""
+    encoded = []
+    for char in text:
+        code = ord(char)
+        if code > 0xFFFF or char in "\r\n\t":
+            code = ord("?") if code > 0xFFFF else ord(" ")
+        encoded.append(f"{code:04X}")
+    return "<" + "".join(encoded) + ">"
+
+
+def wrap_text(text: str, size: float, width: float) -> List[str]:
+    """按可用宽度对文本进行折行，保留原有换行
+
+    Args:
+        text: 原始文本
+        size: 字号
+        width: 可用宽度(pt)
+
+    Returns:
+        折行后的行列表
+    """
+    lines = []
+    for paragraph in str(text).split("\n"):
+        current = []
+        current_width = 0.0
+        for char in paragraph:
+            w = _char_width(char, size)
+            if current and current_width + w > width:
+                lines.append("".join(current))
+                current, current_width = [], 0.0
+            current.append(char)
+            current_width += w
+        lines.append("".join(current))
+    return lines
+
+
+class _PDFPages:
+    """以页为单位收集绘图指令，并负责纵向排版与分页"""
+
+    def __init__(self):
+        self.pages: List[List[str]] = []
+        self.y = 0.0
+        self.new_page()
+
+    def new_page(self) -> None:
+        self.pages.append([])
+        self.y = PAGE_HEIGHT - MARGIN_TOP
+
+    def ensure_space(self, height: float) -> None:
+        """剩余空间不足时换页"""
+        if self.y - height < MARGIN_BOTTOM:
+            self.new_page()
+
+    def text(self, x: float, y: float, text: str, size: float = BODY_SIZE) -> None:
+        self.pages[-1].append(f"BT /F1 {size} Tf {x:.2f} {y:.2f} Td {_encode_text(text)} Tj ET")
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, width: float = 0.5) -> None:
+        self.pages[-1].append(f"{width} w {x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S")
+
+    def shade(self, x: float, y: float, w: float, h: float, gray: float = 0.92) -> None:
+        self.pages[-1].append(f"{gray} g {x:.2f} {y:.2f} {w:.2f} {h:.2f} re f 0 g")
+
+    def paragraph(self, text: str, size: float = BODY_SIZE, indent: float = 0.0) -> None:
+        """输出自动折行的段落"""
+        for line in wrap_text(text, size, CONTENT_WIDTH - indent):
+            self.ensure_space(BODY_LEADING)
+            self.y -= BODY_LEADING
+            self.text(MARGIN_X + indent, self.y, line, size)
+
+    def heading(self, text: str) -> None:
+        self.ensure_space(HEADING_SIZE * 3)
+        self.y -= HEADING_SIZE * 1.8
+        self.text(MARGIN_X, self.y, text, HEADING_SIZE)
+        self.line(MARGIN_X, self.y - 4, MARGIN_X + CONTENT_WIDTH, self.y - 4)
+        self.y -= 4
+
+    def table(self, rows: List[Tuple[str, str]], first_col_width: float, shade_first: bool = True) -> None:
+        """输出两列表格，第二列自动折行
+
+        整行放不下时换页；比一整页还高的行在当前页放满后拆到下一页继续，标签只在第一段输出。
+        """
+        padding = 4
+        full_page = PAGE_HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+        for label, value in rows:
+            value_lines = wrap_text(value, BODY_SIZE, CONTENT_WIDTH - first_col_width - 2 * padding) or [""]
+            row_height = len(value_lines) * BODY_LEADING + padding
+            if row_height <= full_page:
+                self.ensure_space(row_height)
+            while value_lines:
+                fit = int((self.y - MARGIN_BOTTOM - padding) // BODY_LEADING)
+                if fit < 1:
+                    self.new_page()
+                    continue
+                segment, value_lines = value_lines[:fit], value_lines[fit:]
+                self._table_row(label, segment, first_col_width, shade_first, padding)
+                label = ""
+                if value_lines:
+                    self.new_page()
+
+    def _table_row(self, label: str, value_lines: List[str], first_col_width: float, shade_first: bool,
+                   padding: float) -> None:
+        """在当前位置输出表格的一行（或拆分后的一段）"""
+        row_height = len(value_lines) * BODY_LEADING + padding
+        top = self.y
+        bottom = top - row_height
+        if shade_first:
+            self.shade(MARGIN_X, bottom, first_col_width, row_height)
+        self.line(MARGIN_X, top, MARGIN_X + CONTENT_WIDTH, top)
+        self.line(MARGIN_X, bottom, MARGIN_X + CONTENT_WIDTH, bottom)
+        self.line(MARGIN_X, top, MARGIN_X, bottom)
+        self.line(MARGIN_X + first_col_width, top, MARGIN_X + first_col_width, bottom)
+        self.line(MARGIN_X + CONTENT_WIDTH, top, MARGIN_X + CONTENT_WIDTH, bottom)
+        baseline = top - BODY_LEADING + padding / 2
+        if label:
+            self.text(MARGIN_X + padding, baseline, label)
+        for line in value_lines:
+            self.text(MARGIN_X + first_col_width + padding, baseline, line)
+            baseline -= BODY_LEADING
+        self.y = bottom
+
+
+def _as_text(value: Any) -> str:
+    """None输出为空字符串，其他值转为字符串"""
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+
+def _numbered(items: Optional[List[Any]], formatted: Optional[List[Any]]) -> List[str]:
+    """优先使用已编号的措施列表，否则自动编号"""
+    if formatted:
+        return [_as_text(item) for item in formatted]
+    return [f"{i}. {_as_text(item)}" for i, item in enumerate(items or [], 1)]
+
+
+def _layout_report(report: Dict[str, Any]) -> _PDFPages:
+    """按GMP调查报告版式排版"""
+    pages = _PDFPages()
+
+    # 报告标题
+    title = _as_text(report.get("title")) or "GMP调查报告"
+    title_width = sum(_char_width(c, TITLE_SIZE) for c in title)
+    pages.y -= TITLE_SIZE
+    pages.text(max(MARGIN_X, (PAGE_WIDTH - title_width) / 2), pages.y, title, TITLE_SIZE)
+    pages.y -= TITLE_SIZE
+
+    # 报告头
+    pages.table([(label, _as_text(report.get(key))) for label, key in HEADER_FIELDS], first_col_width=110)
+
+    # 概述
+    pages.heading(TEXT_SECTIONS[0][0])
+    pages.paragraph(_as_text(report.get("summary")))
+
+    # 事件
+    pages.heading("二、事件描述")
+    events = report.get("events") or []
+    if events:
+        rows = []
+        for event in events:
+            if isinstance(event, dict):
+                rows.append((_as_text(event.get("date")), _as_text(event.get("description"))))
+            else:
+                rows.append(("", _as_text(event)))
+        pages.y -= 6
+        pages.table(rows, first_col_width=90, shade_first=False)
+    else:
+        pages.paragraph("无")
+
+    for heading, key in TEXT_SECTIONS[1:]:
+        pages.heading(heading)
+        pages.paragraph(_as_text(report.get(key)) or "无")
+
+    # CAPA措施
+    pages.heading("七、纠正与预防措施（CAPA）")
+    corrective = _numbered(report.get("correctiveActions"), report.get("formattedCorrectiveActions"))
+    preventive = _numbered(report.get("preventiveActions"), report.get("formattedPreventiveActions"))
+    if not corrective and not preventive:
+        actions = [_as_text(action) for action in report.get("actions") or [] if _as_text(action)]
+        for action in actions or ["无"]:
+            pages.paragraph(action, indent=12)
+    else:
+        pages.paragraph("纠正措施:")
+        for action in corrective or ["无"]:
+            pages.paragraph(action, indent=12)
+        pages.paragraph("预防措施:")
+        for action in preventive or ["无"]:
+            pages.paragraph(action, indent=12)
+
+    # 结论
+    pages.heading("八、结论")
+    pages.paragraph(_as_text(report.get("eventSummary")) or "无")
+
+    # 审核人
+    pages.heading("九、审核")
+    reviewers = report.get("reviewers") or []
+    rows = []
+    for reviewer in reviewers:
+        if isinstance(reviewer, dict):
+            rows.append((_as_text(reviewer.get("name")), _as_text(reviewer.get("date"))))
+        else:
+            rows.append((_as_text(reviewer), ""))
+    pages.y -= 6
+    pages.table([("审核人", "日期")] + rows, first_col_width=CONTENT_WIDTH / 2)
+
+    return pages
+
+
+def _build_pdf(page_streams: List[bytes]) -> bytes:
+    """组装PDF对象、交叉引用表和尾部"""
+    objects: List[bytes] = []
+    page_count = len(page_streams)
+    # 对象编号: 1目录 2页树 3字体 4CID字体 5字体描述, 之后每页两个对象(页面+内容流)
+    page_ids = [6 + 2 * i for i in range(page_count)]
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode("ascii"))
+    objects.append(b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light "
+                   b"/Encoding /UniGB-UCS2-H /DescendantFonts [4 0 R] >>")
+    objects.append(b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+                   b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> "
+                   b"/FontDescriptor 5 0 R /DW 1000 /W [1 95 500] >>")
+    objects.append(b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 "
+                   b"/FontBBox [-25 -254 1000 880] /ItalicAngle 0 /Ascent 880 /Descent -120 "
+                   b"/CapHeight 880 /StemV 93 >>")
+
+    for i, stream in enumerate(page_streams):
+        content_id = page_ids[i] + 1
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode("ascii"))
+        compressed = zlib.compress(stream)
+        objects.append(f"<< /Length {len(compressed)} /Filter /FlateDecode >>\nstream\n".encode("ascii")
+                       + compressed + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("ascii")
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref_offset}\n%%EOF\n").encode("ascii")
+    return bytes(output)
+
+
+def render_report_pdf(report: Dict[str, Any]) -> bytes:
+    """将规范化后的报告数据渲染为PDF
+
+    Args:
+        report: 规范化后的报告数据（包含correctiveActions/preventiveActions等分组字段）
+
+    Returns:
+        PDF文件的二进制内容
+    """
+    pages = _layout_report(report)
+
+    # 页脚：文档ID与页码
+    doc_id = _as_text(report.get("docId"))
+    total = len(pages.pages)
+    for number, ops in enumerate(pages.pages, 1):
+        footer = f"{doc_id}    第 {number} 页 / 共 {total} 页" if doc_id else f"第 {number} 页 / 共 {total} 页"
+        ops.append(f"BT /F1 9 Tf {MARGIN_X} {MARGIN_BOTTOM / 2:.2f} Td {_encode_text(footer)} Tj ET")
+
+    streams = ["\n".join(ops).encode("ascii") for ops in pages.pages]
+    return _build_pdf(streams)
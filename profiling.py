@@ -0,0 +1,205 @@
+"""
+Bayer GMP Reporter - 单次调用的性能剖析
+
+通过环境变量GMP_PROFILE或工具参数profile开启，对一次工具调用做cProfile（cpu）、
+tracemalloc（memory）或两者（all）的剖析，生成精简的文本报告（按累计耗时排序的函数、
+内存分配最多的代码行和峰值内存）：
+- GMP_PROFILE_SINK=local（默认）：写入GMP_PROFILE_DIR目录，同时保存可用pstats加载的.prof文件
+- GMP_PROFILE_SINK=storage：写入插件持久化存储（只保存文本报告，受manifest中存储配额限制）
+两种方式都只保留最近GMP_PROFILE_MAX_KEEP份。
+
+cProfile和tracemalloc都是进程级的，同一时间只剖析一次调用；gevent下同一线程内其他请求的
+耗时也会计入报告。cProfile、pstats和tracemalloc只在真正开始剖析时才导入，不影响插件冷启动。
+"""
+import functools
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+PROFILE_MODES = ("off", "cpu", "memory", "all")
+
+# 剖析配置
+PROFILE_MODE = os.getenv("GMP_PROFILE", "off").strip().lower()
+PROFILE_SINK = os.getenv("GMP_PROFILE_SINK", "local").strip().lower()
+PROFILE_DIR = os.getenv("GMP_PROFILE_DIR", "profiles")
+PROFILE_MAX_KEEP = int(os.getenv("GMP_PROFILE_MAX_KEEP", "20"))
+PROFILE_TOP = int(os.getenv("GMP_PROFILE_TOP", "30"))
+
+STORAGE_INDEX_KEY = "gmp_profiles/index"
+
+# 同一时间只允许一个剖析会话
+_profile_lock = threading.Lock()
+
+
+def resolve_mode(requested: Optional[str] = None) -> str:
+    """确定本次调用的剖析模式，工具参数优先于环境变量"""
+    mode = (requested or PROFILE_MODE or "off").strip().lower()
+    if mode not in PROFILE_MODES:
+        logger.warning(f"Unknown profile mode '{mode}', profiling disabled")
+        return "off"
+    return mode
+
+
+class ProfileSession:
+    """一次调用的剖析会话
+
+    Args:
+        name: 剖析对象名称，如工具名
+        mode: cpu、memory或all
+        top: 报告中列出的函数/代码行数
+    """
+
+    def __init__(self, name: str, mode: str, top: int = PROFILE_TOP):
+        self.name = name
+        self.mode = mode
+        self.top = top
+        self.profiler = None
+        self.started_tracemalloc = False
+        self.start_time = 0.0
+        self.elapsed = 0.0
+        self.memory_snapshot = None
+        self.memory_peak = 0
+
+    def start(self) -> None:
+        import cProfile
+        import tracemalloc
+        if self.mode in ("memory", "all"):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self.started_tracemalloc = True
+            tracemalloc.reset_peak()
+        if self.mode in ("cpu", "all"):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self) -> None:
+        import tracemalloc
+        self.elapsed = time.perf_counter() - self.start_time
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.mode in ("memory", "all") and tracemalloc.is_tracing():
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            _, self.memory_peak = tracemalloc.get_traced_memory()
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+
+    def render(self) -> str:
+        """生成文本报告"""
+        import pstats
+        import tracemalloc
+        out = io.StringIO()
+        out.write(f"profile: {self.name}\n")
+        out.write(f"mode: {self.mode}\n")
+        out.write(f"time: {datetime.now().isoformat(timespec='seconds')}\n")
+        out.write(f"elapsed_ms: {self.elapsed * 1000:.3f}\n")
+
+        if self.profiler is not None:
+            out.write(f"\n== CPU: top {self.top} by cumulative time ==\n")
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(self.top)
+
+        if self.memory_snapshot is not None:
+            out.write(f"\n== Memory: peak {self.memory_peak / 1024:.1f} KiB, "
+                      f"top {self.top} allocation sites alive at end of call ==\n")
+            snapshot = self.memory_snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, __file__),
+            ))
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                out.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+        return out.getvalue()
+
+    def artifact_name(self) -> str:
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{self.name}-{self.mode}"
+
+
+def _save_local(session: ProfileSession, directory: str, max_keep: int) -> str:
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, session.artifact_name())
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(session.render())
+    if session.profiler is not None:
+        session.profiler.dump_stats(base + ".prof")
+
+    # 只保留最近max_keep份（文件名以时间戳开头，按名称排序即按时间排序）
+    reports = sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".txt"))
+    for old in reports[:-max_keep] if max_keep > 0 else []:
+        for suffix in (".txt", ".prof"):
+            path = os.path.join(directory, old + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    return base + ".txt"
+
+
+def _save_storage(session: ProfileSession, storage: Any, max_keep: int) -> str:
+    key = f"gmp_profiles/{session.artifact_name()}.txt"
+    storage.set(key, session.render().encode("utf-8"))
+
+    # 持久化存储不支持列举，用索引键记录已保存的报告
+    try:
+        index: List[str] = json.loads(storage.get(STORAGE_INDEX_KEY).decode("utf-8"))
+    except Exception:
+        index = []
+    index.append(key)
+    while max_keep > 0 and len(index) > max_keep:
+        old = index.pop(0)
+        try:
+            storage.delete(old)
+        except Exception as e:
+            logger.warning(f"Failed to delete old profile {old}: {str(e)}")
+    storage.set(STORAGE_INDEX_KEY, json.dumps(index).encode("utf-8"))
+    return key
+
+
+def save_profile(session: ProfileSession, storage: Any = None) -> Optional[str]:
+    """保存剖析报告，返回文件路径或存储键"""
+    try:
+        if PROFILE_SINK == "storage" and storage is not None:
+            return _save_storage(session, storage, PROFILE_MAX_KEEP)
+        return _save_local(session, PROFILE_DIR, PROFILE_MAX_KEEP)
+    except Exception as e:
+        logger.warning(f"Failed to save profile for {session.name}: {str(e)}")
+        return None
+
+
+def profiled(name: str):
+    """为工具的 _invoke 生成器添加可选剖析的装饰器
+
+    剖析模式取自工具参数profile，未提供时取环境变量GMP_PROFILE；为off时不做任何额外工作。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, tool_parameters: Dict[str, Any], *args, **kwargs):
+            mode = resolve_mode(tool_parameters.get("profile"))
+            if mode == "off":
+                return (yield from func(self, tool_parameters, *args, **kwargs))
+            if not _profile_lock.acquire(blocking=False):
+                logger.warning(f"Another invocation is being profiled, skipping profile for {name}")
+                return (yield from func(self, tool_parameters, *args, **kwargs))
+
+            session = ProfileSession(name, mode)
+            try:
+                session.start()
+                try:
+                    return (yield from func(self, tool_parameters, *args, **kwargs))
+                finally:
+                    session.stop()
+                    storage = getattr(getattr(self, "session", None), "storage", None)
+                    location = save_profile(session, storage)
+                    if location:
+                        logger.info(f"Profile for {name} saved to {location} ({session.elapsed * 1000:.1f} ms)")
+            finally:
+                _profile_lock.release()
+        return wrapper
+    return decorator
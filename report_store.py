@@ -0,0 +1,309 @@
+"""
+Bayer GMP Reporter - 本地报告存储
+
+PDF生成工具成功返回后，把规范化后的报告数据和生成结果（渲染方式、文件名、下载链接、大小）写入插件本地的
+SQLite数据库；之后按调查编号、文档编号、编制日期或对话ID查找，直接返回已保存的下载链接，不再调用Spring重新生成：
+- GMP_REPORT_STORE：是否保存（默认true）
+- GMP_REPORT_STORE_PATH：数据库文件路径（默认插件目录下的bayer_gmp_reports.db）
+
+报告数据按规范化哈希去重（内容相同的报告只保存一份），每次生成记录一条生成结果。
+报告数据逐段序列化，边计算哈希边压缩保存，大报告不会在内存中同时保留完整的JSON字符串。
+每条生成结果记录调用方凭据（Spring API密钥）的哈希，查找时只返回同一凭据下生成的报告，
+报告数据（include_data）也只能通过这些记录取回；没有凭据的生成结果不保存。
+四个查找字段都有索引，编制日期支持前缀查找（如"2025-04"查找该月）。数据库以WAL模式打开，
+多个进程（如离线回填的工作进程）可以同时写入；首次使用时才打开，不影响冷启动。
+写入失败只记录日志，不影响工具结果。存储操作导出为 gmp_report_store_total{op, result}。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from metrics import timed
+from utils import canonical_json_chunks, credential_hash
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否保存生成的报告
+REPORT_STORE_ENABLED = os.getenv("GMP_REPORT_STORE", "true").strip().lower() in ("1", "true", "yes", "on")
+# 数据库文件路径
+REPORT_STORE_PATH = os.getenv("GMP_REPORT_STORE_PATH", "").strip() or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "bayer_gmp_reports.db")
+# 单次查找最多返回的记录数
+MAX_LOOKUP_LIMIT = 100
+
+REPORT_STORE_TOTAL = "gmp_report_store_total"
+
+metrics.registry.describe(REPORT_STORE_TOTAL, "Local report store operations by op (save, lookup) and result")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    investigation_id TEXT,
+    doc_id TEXT,
+    prepared_date TEXT,
+    title TEXT,
+    report_json TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_id TEXT NOT NULL REFERENCES reports(report_id),
+    owner TEXT,
+    conversation_id TEXT,
+    request_id TEXT,
+    renderer TEXT,
+    filename TEXT,
+    download_url TEXT,
+    size INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_investigation_id ON reports(investigation_id);
+CREATE INDEX IF NOT EXISTS idx_reports_doc_id ON reports(doc_id);
+CREATE INDEX IF NOT EXISTS idx_reports_prepared_date ON reports(prepared_date);
+-- 归属字段放在对话ID之后：它只是过滤条件，不能抢走其他查找字段的索引
+CREATE INDEX IF NOT EXISTS idx_artifacts_conversation_id ON artifacts(conversation_id, owner);
+CREATE INDEX IF NOT EXISTS idx_artifacts_report_id ON artifacts(report_id, created_at);
+"""
+
+
+def conversation_key(conversation_id: Any) -> Optional[str]:
+    """工具参数中的对话ID可能内嵌报告JSON（"<ID> json: {...}"），只取前面的真实ID"""
+    if not isinstance(conversation_id, str):
+        return None
+    value = conversation_id.split("{", 1)[0].strip()
+    return value.split()[0] if value else None
+
+
+def owner_key(api_key: Any) -> Optional[str]:
+    """调用方凭据的哈希，作为生成结果的归属；没有凭据时返回None"""
+    if not isinstance(api_key, str):
+        return None
+    return credential_hash(api_key) or None
+
+
+def _pack(report_data: Dict[str, Any]) -> Tuple[str, bytes]:
+    """逐段序列化报告数据，返回 (报告ID, 压缩后的规范化JSON)
+
+    报告ID即规范化JSON的SHA-256，与utils.canonical_json_hash相同。
+    """
+    digest = hashlib.sha256()
+    compressor = zlib.compressobj()
+    parts = []
+    for chunk in canonical_json_chunks(report_data):
+        data = chunk.encode("utf-8")
+        digest.update(data)
+        parts.append(compressor.compress(data))
+    parts.append(compressor.flush())
+    return digest.hexdigest(), b"".join(parts)
+
+
+def _unpack(value: Any) -> Any:
+    """读取保存的报告数据；早期版本保存的是未压缩的JSON文本"""
+    if isinstance(value, bytes):
+        value = zlib.decompress(value).decode("utf-8")
+    return json.loads(value)
+
+
+def _text(value: Any) -> Optional[str]:
+    """索引字段统一保存为去掉首尾空白的字符串"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+class ReportStore:
+    """SQLite中的报告数据和生成结果（线程安全，首次使用时打开）"""
+
+    def __init__(self, path: str = REPORT_STORE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """调用方须持有self._lock"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(artifacts)")}
+            if columns and "owner" not in columns:
+                # 早期版本的数据库没有归属字段，已有记录的归属为空，不会被任何调用方查到
+                conn.execute("ALTER TABLE artifacts ADD COLUMN owner TEXT")
+                conn.execute("DROP INDEX IF EXISTS idx_artifacts_conversation_id")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @timed("store.save")
+    def save(self, report_data: Dict[str, Any], artifact: Dict[str, Any], owner: str,
+             conversation_id: Optional[str] = None, request_id: Optional[str] = None) -> str:
+        """保存报告数据和一次生成结果
+
+        Args:
+            report_data: 规范化后的报告数据
+            artifact: 生成结果，可包含renderer、filename、download_url、size
+            owner: 调用方凭据的哈希（见owner_key）
+            conversation_id: 对话ID
+            request_id: 生成时的关联ID
+
+        Returns:
+            报告ID（报告数据的规范化哈希）
+        """
+        report_id, report_json = _pack(report_data)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO reports (report_id, investigation_id, doc_id, prepared_date, title, "
+                    "report_json, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (report_id, _text(report_data.get("investigationId")), _text(report_data.get("docId")),
+                     _text(report_data.get("preparedDate")), _text(report_data.get("title")),
+                     report_json, now))
+                conn.execute(
+                    "INSERT INTO artifacts (report_id, owner, conversation_id, request_id, renderer, filename, "
+                    "download_url, size, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (report_id, owner, conversation_id, request_id, artifact.get("renderer"),
+                     artifact.get("filename"), artifact.get("download_url"), artifact.get("size"), now))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return report_id
+
+    @timed("store.lookup")
+    def lookup(self, owner: str, investigation_id: Optional[str] = None, doc_id: Optional[str] = None,
+               prepared_date: Optional[str] = None, conversation_id: Optional[str] = None,
+               report_id: Optional[str] = None, limit: int = 10,
+               include_data: bool = False) -> List[Dict[str, Any]]:
+        """按索引字段查找已保存的生成结果，最新的在前；按编制日期查找时编制日期最近的在前
+
+        只返回owner名下的生成结果，报告数据也只随这些结果返回。
+
+        Args:
+            owner: 调用方凭据的哈希（见owner_key）
+            investigation_id: 调查编号
+            doc_id: 文档编号
+            prepared_date: 编制日期或其前缀（如"2025-04"）
+            conversation_id: 对话ID
+            report_id: 报告ID
+            limit: 最多返回的记录数
+            include_data: 是否附带报告数据
+
+        Returns:
+            生成结果列表，每项包含report_id、investigationId、docId、preparedDate、title、conversation_id、
+            renderer、filename、download_url、size、created_at，include_data时还有report_data
+
+        Raises:
+            ValueError: 没有owner或没有任何查找条件
+        """
+        if not owner:
+            raise ValueError("缺少调用方凭据，无法查找报告")
+        conditions, params = [], []
+        for column, value in (("r.report_id", report_id), ("r.investigation_id", _text(investigation_id)),
+                              ("r.doc_id", _text(doc_id)), ("a.conversation_id", _text(conversation_id))):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        order = "a.created_at DESC, a.id DESC"
+        prepared_date = _text(prepared_date)
+        if prepared_date:
+            # 前缀查找写成范围条件，才能使用编制日期的索引；按编制日期倒序排列时沿索引逆序扫描，
+            # 取够limit条即停止，整月、整年的查找不必对所有匹配的记录排序
+            conditions.append("r.prepared_date >= ? AND r.prepared_date < ?")
+            params.extend([prepared_date, prepared_date + "\uffff"])
+            order = "r.prepared_date DESC, " + order
+        if not conditions:
+            raise ValueError("至少需要一个查找条件")
+        # 归属条件对所有查找（包括按报告ID查找和include_data）都生效
+        conditions.append("a.owner = ?")
+        params.append(owner)
+
+        columns = "r.report_id, r.investigation_id, r.doc_id, r.prepared_date, r.title, a.conversation_id, " \
+                  "a.renderer, a.filename, a.download_url, a.size, a.created_at"
+        if include_data:
+            columns += ", r.report_json"
+        sql = (f"SELECT {columns} FROM reports r JOIN artifacts a ON a.report_id = r.report_id "
+               f"WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT ?")
+        params.append(max(1, min(int(limit), MAX_LOOKUP_LIMIT)))
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            entry = {
+                "report_id": row["report_id"],
+                "investigationId": row["investigation_id"],
+                "docId": row["doc_id"],
+                "preparedDate": row["prepared_date"],
+                "title": row["title"],
+                "conversation_id": row["conversation_id"],
+                "renderer": row["renderer"],
+                "filename": row["filename"],
+                "download_url": row["download_url"],
+                "size": row["size"],
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["created_at"])),
+            }
+            if include_data:
+                entry["report_data"] = _unpack(row["report_json"])
+            results.append(entry)
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+store = ReportStore()
+
+
+def save_report(report_data: Dict[str, Any], artifact: Dict[str, Any], api_key: Optional[str],
+                conversation_id: Optional[str] = None, request_id: Optional[str] = None) -> Optional[str]:
+    """保存报告数据和生成结果，归属于api_key对应的调用方
+
+    未开启、没有凭据或写入失败时返回None，不影响调用方。
+    """
+    if not REPORT_STORE_ENABLED or not isinstance(report_data, dict):
+        return None
+    owner = owner_key(api_key)
+    if owner is None:
+        logger.info("No caller credential for the generated report, not saving it to the local store")
+        metrics.registry.inc(REPORT_STORE_TOTAL, op="save", result="skipped")
+        return None
+    try:
+        report_id = store.save(report_data, artifact, owner, conversation_key(conversation_id), request_id)
+    except Exception as e:
+        logger.error(f"Failed to save report to the local store: {str(e)}")
+        metrics.registry.inc(REPORT_STORE_TOTAL, op="save", result="error")
+        return None
+    metrics.registry.inc(REPORT_STORE_TOTAL, op="save", result="success")
+    return report_id
+
+
+def find_reports(api_key: Optional[str], **criteria) -> List[Dict[str, Any]]:
+    """按条件查找api_key对应的调用方保存的报告，其余参数同ReportStore.lookup
+
+    Raises:
+        ValueError: 没有凭据或没有任何查找条件
+    """
+    if criteria.get("conversation_id"):
+        criteria["conversation_id"] = conversation_key(criteria["conversation_id"])
+    results = store.lookup(owner_key(api_key), **criteria)
+    metrics.registry.inc(REPORT_STORE_TOTAL, op="lookup", result="hit" if results else "miss")
+    return results
@@ -0,0 +1,145 @@
+"""
+Bayer GMP Reporter - 相同请求合并（single-flight）
+
+用户重复点击或工作流节点重试时，同一对话、相同参数的数据提取或PDF生成请求可能同时在处理，
+每个都要单独调用LLM和Spring。这里按键（对话ID + 参数哈希）合并进程内同时进行的相同请求：
+第一个请求（leader）实际执行，之后到达的相同请求（follower）等待并复用它的结果。
+- GMP_SINGLEFLIGHT：是否合并（默认true）
+- GMP_SINGLEFLIGHT_TIMEOUT：follower最长等待时间（秒，默认120），超时后自行执行；
+  在工具调用中时同时受本次调用的截止时间限制，截止时间先到时抛出DeadlineExceeded，不再自行执行
+- 合并情况导出为 gmp_singleflight_total{group, role}，role为leader、follower或timeout
+
+只合并同时进行的请求，leader完成后到达的请求会重新执行，不缓存结果。
+leader抛出的异常会原样抛给等待中的follower。
+"""
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import deadline
+import metrics
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否合并同时进行的相同请求
+SINGLEFLIGHT_ENABLED = os.getenv("GMP_SINGLEFLIGHT", "true").strip().lower() in ("1", "true", "yes", "on")
+# follower等待leader结果的最长时间(秒)
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("GMP_SINGLEFLIGHT_TIMEOUT", "120"))
+
+SINGLEFLIGHT = "gmp_singleflight_total"
+
+metrics.registry.describe(SINGLEFLIGHT, "Calls that executed (leader), reused an identical in-flight call (follower) "
+                                        "or gave up waiting for it (timeout)")
+
+
+class _Call:
+    """一次正在进行的调用"""
+
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """按键合并同时进行的相同调用
+
+    Args:
+        group: 名称，用作指标的group标签
+        timeout: follower的默认最长等待时间(秒)
+    """
+
+    def __init__(self, group: str, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.group = group
+        self.timeout = timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.counts = {"leader": 0, "follower": 0, "timeout": 0}
+        _groups[group] = self
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """执行fn，或等待键相同的进行中调用并复用其结果
+
+        Args:
+            key: 合并键，键相同的调用视为相同请求
+            fn: 实际执行的无参函数
+            timeout: follower的最长等待时间(秒)，默认取构造时的timeout
+
+        Returns:
+            tuple: (结果, 是否复用了其他调用的结果)；复用的结果与leader是同一个对象，调用方修改前应先复制
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if not leader:
+            return self._wait(call, fn, self.timeout if timeout is None else timeout)
+
+        self._count("leader")
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+            if call.followers:
+                logger.info(f"{self.group}: {call.followers} identical call(s) coalesced into one")
+
+    def _wait(self, call: _Call, fn: Callable[[], Any], timeout: float) -> Tuple[Any, bool]:
+        """follower等待leader完成；超时后自行执行，截止时间先到时抛出DeadlineExceeded
+
+        Raises:
+            DeadlineExceeded: 本次调用的截止时间已过或在等待中用完
+        """
+        stage = f"singleflight.{self.group}"
+        wait = deadline.timeout(timeout, stage=stage)
+        if not call.done.wait(wait):
+            self._count("timeout")
+            if wait < timeout:
+                # 剩余时间已用完，再执行一次也来不及返回
+                metrics.registry.inc(deadline.DEADLINE_EXCEEDED, stage=stage)
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded while waiting for an identical "
+                                                f"in-flight call in {self.group}")
+            logger.warning(f"{self.group}: waited {timeout:g}s for an identical in-flight call, running it again")
+            return fn(), False
+
+        self._count("follower")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def _count(self, role: str) -> None:
+        metrics.registry.inc(SINGLEFLIGHT, group=self.group, role=role)
+        with self._lock:
+            self.counts[role] += 1
+
+    def in_flight(self) -> int:
+        """当前进行中的不同调用数"""
+        with self._lock:
+            return len(self._calls)
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """各合并组的leader/follower/timeout次数"""
+    return {group: dict(flight.counts) for group, flight in _groups.items()}
@@ -3,15 +3,21 @@ Bayer GMP Reporter - 数据提取工具
 """
 from collections.abc import Generator
 from typing import Any, Dict, List
+import copy
 import json
 import logging
 from datetime import datetime
 import sys
 import os
 import re
+import ast
 
-# 添加项目根目录到Python路径
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import config  # noqa: F401  加载.env
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
@@ -20,7 +26,16 @@ from dify_plugin.entities.tool import ToolInvokeMessage
 logger = logging.getLogger("bayer_gmp")
 
 # 导入公共工具函数
-from utils import get_conversation_history, call_dify_model, extract_json_from_text
+import compaction
+from utils import get_conversation_history, call_dify_model, extract_json_from_text, canonical_json_hash
+from metrics import timed
+from profiling import profiled
+from correlation import correlated
+from singleflight import SingleFlight
+
+# 合并同一对话的并发提取；Dify上下文中的这些字段不同时视为不同请求
+FLIGHT_CONTEXT_KEYS = ("api_base", "api_key", "user_id", "app_id")
+_extract_flight = SingleFlight("extract")
 
 
 class GMPExtractDataTool(Tool):
@@ -35,7 +50,12 @@ class GMPExtractDataTool(Tool):
         """
         super().__init__(runtime, session)
         self.context = {}
+        # 最近一次_extract_gmp_report_data的数据来源：table、model或fallback（默认内容）
+        self.extraction_source = None
     
+    @correlated("gmp_extract_data")
+    @timed("tool.extract")
+    @profiled("gmp_extract_data")
     def _invoke(self, tool_parameters: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """执行工具调用逻辑
         
@@ -46,24 +66,10 @@ class GMPExtractDataTool(Tool):
             ToolInvokeMessage: 工具调用消息
         """
         try:
-            # 获取对话ID
-            conversation_id = tool_parameters.get("conversation_id")
-            if not conversation_id:
-                logger.error("Missing required parameter: conversation_id")
-                yield self.create_json_message({
-                    "success": False,
-                    "message": "缺少必要参数：对话ID",
-                    "report_data": {}
-                })
-                return
-            
             # 确保context有值
             if not hasattr(self, 'context') or not self.context:
                 self.context = {}
             
-            # 提取可能嵌入在conversation_id中的JSON数据
-            conversation_id, embedded_json = self._extract_json_from_conversation_id(conversation_id)
-            
             # 从请求中获取credentials
             # 1. 参数中直接传递的credentials
             if 'credentials' in tool_parameters:
@@ -92,6 +98,50 @@ class GMPExtractDataTool(Tool):
                         'api_base': 'http://localhost:5001',
                         'api_key': 'test_api_key'
                     })
+        except Exception as e:
+            logger.error(f"Error in GMP data extraction: {str(e)}")
+            yield self.create_json_message({
+                "success": False,
+                "message": f"报告数据提取失败: {str(e)}",
+                "report_data": {}
+            })
+            return
+        
+        yield self.create_json_message(self.extract(tool_parameters.get("conversation_id")))
+    
+    def extract(self, conversation_id: str) -> Dict[str, Any]:
+        """从对话中提取报告数据，使用self.context中的Dify上下文
+        
+        同一对话、相同Dify上下文的并发提取只执行一次，其余调用复用其结果（带coalesced标记）。
+        
+        Args:
+            conversation_id: 对话ID，可能内嵌JSON格式的报告数据
+            
+        Returns:
+            结果字典，包含success、message和report_data
+        """
+        scope = {key: self.context.get(key) for key in FLIGHT_CONTEXT_KEYS}
+        flight_key = f"{conversation_id}|{canonical_json_hash(scope)}"
+        result, shared = _extract_flight.do(flight_key, lambda: self._extract(conversation_id))
+        if shared:
+            result = copy.deepcopy(result)
+            result["coalesced"] = True
+        return result
+    
+    def _extract(self, conversation_id: str) -> Dict[str, Any]:
+        """extract的实际实现"""
+        try:
+            # 获取对话ID
+            if not conversation_id:
+                logger.error("Missing required parameter: conversation_id")
+                return {
+                    "success": False,
+                    "message": "缺少必要参数：对话ID",
+                    "report_data": {}
+                }
+            
+            # 提取可能嵌入在conversation_id中的JSON数据
+            conversation_id, embedded_json = self._extract_json_from_conversation_id(conversation_id)
             
             # 如果从conversation_id中提取到了JSON，直接使用这些数据
             if embedded_json and isinstance(embedded_json, dict):
@@ -192,12 +242,11 @@ class GMPExtractDataTool(Tool):
                 processed_data = self._process_extracted_data(report_data)
                 
                 # 返回结果
-                yield self.create_json_message({
+                return {
                     "success": True,
                     "message": "成功从JSON数据提取报告数据",
                     "report_data": processed_data
-                })
-                return
+                }
                 
             # 如果没有嵌入JSON或提取失败，继续常规流程
             # 获取对话历史
@@ -205,49 +254,72 @@ class GMPExtractDataTool(Tool):
             conversation_history = get_conversation_history(conversation_id, self.context)
             if not conversation_history:
                 logger.error("Failed to retrieve conversation history or history is empty")
-                yield self.create_json_message({
+                return {
                     "success": False,
                     "message": "无法获取对话历史或对话历史为空",
                     "report_data": {}
-                })
-                return
+                }
             
+            return self.extract_from_history(conversation_history)
+                
+        except Exception as e:
+            logger.error(f"Error in GMP data extraction: {str(e)}")
+            return {
+                "success": False,
+                "message": f"报告数据提取失败: {str(e)}",
+                "report_data": {}
+            }
+    
+    def extract_from_history(self, conversation_history: List[Dict[str, Any]],
+                             use_model: bool = True) -> Dict[str, Any]:
+        """从已有的对话历史中提取报告数据，不再通过Dify API获取对话
+        
+        Args:
+            conversation_history: 对话消息列表，字段与Dify /messages接口一致
+            use_model: 对话中没有报告数据表格时是否调用模型提取
+            
+        Returns:
+            结果字典，包含success、message、report_data、source（table、model或fallback）和fallback；
+            fallback为True时报告数据是默认内容，不是从对话中提取的
+        """
+        try:
             # 提取报告数据
             logger.info(f"Extracting GMP report data from {len(conversation_history)} messages")
-            report_data = self._extract_gmp_report_data(conversation_history)
+            report_data = self._extract_gmp_report_data(conversation_history, use_model=use_model)
+            fallback = self.extraction_source == "fallback"
             
             # 返回结果
-            yield self.create_json_message({
+            return {
                 "success": True,
-                "message": "成功提取报告数据",
-                "report_data": report_data
-            })
+                "message": "未能从对话中提取报告数据，使用默认内容" if fallback else "成功提取报告数据",
+                "report_data": report_data,
+                "source": self.extraction_source,
+                "fallback": fallback
+            }
                 
         except Exception as e:
             logger.error(f"Error in GMP data extraction: {str(e)}")
-            yield self.create_json_message({
+            return {
                 "success": False,
                 "message": f"报告数据提取失败: {str(e)}",
                 "report_data": {}
-            })
+            }
     
-    def _extract_gmp_report_data(self, conversation_history: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """从对话历史中提取GMP报告所需的关键信息"""
+    @timed("extract.llm_extract")
+    def _extract_gmp_report_data(self, conversation_history: List[Dict[str, Any]],
+                                 use_model: bool = True) -> Dict[str, Any]:
+        """从对话历史中提取GMP报告所需的关键信息，数据来源记录在self.extraction_source中
+        
+        Args:
+            conversation_history: 对话消息列表
+            use_model: 没有报告数据表格时是否调用模型；为False时直接使用默认内容
+        """
+        self.extraction_source = "fallback"
         try:
-            # 创建临时数据结构
-            messages = []
-            last_assistant_message = None
-            
-            for msg in conversation_history:
-                if "role" in msg and "content" in msg:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-                    
-                    # 保存最后一个助手消息，可能包含Markdown表格
-                    if msg["role"] == "assistant":
-                        last_assistant_message = msg["content"]
+            # 最后一个助手消息，可能包含Markdown表格
+            last_assistant_message = next(
+                (msg["content"] for msg in reversed(conversation_history)
+                 if msg.get("role") == "assistant" and "content" in msg), None)
             
             # 检查最后的助手回复中是否已经提取了数据
             extracted_data = {}
@@ -259,10 +331,12 @@ class GMPExtractDataTool(Tool):
                 
                 if extracted_data:
                     logger.info(f"从Markdown表格成功提取数据：{len(extracted_data.keys())}个字段")
+                    self.extraction_source = "table"
                     return extracted_data
             
             # 如果无法从表格提取，构建提示词，要求模型提取GMP报告数据
-            conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+            # 拼接对话内容前压缩：去掉问候、追问和重复内容，只保留用户的事实和助手最后的总结
+            conversation_text = compaction.conversation_text(conversation_history)
             prompt = f"""
 请从以下对话内容中提取GMP报告所需的关键信息，并以JSON格式返回。必须包含以下字段：
 refSop, docId, version, title, investigationId, preparedBy, preparedDate, summary, rootCause, impactAssessment, investigation, handling, eventSummary
@@ -278,12 +352,15 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
 """
             
             # 1. 首先尝试使用Dify平台配置的模型
-            model_response = call_dify_model(prompt, self.context)
+            model_response = call_dify_model(prompt, self.context, task="extract") if use_model else ""
             extracted_data = extract_json_from_text(model_response) if model_response else {}
+            if extracted_data:
+                self.extraction_source = "model"
             
             # 2. 如果Dify模型调用失败，使用本地配置的方式生成数据
             if not extracted_data:
-                logger.info("Dify model call failed or returned invalid data, using fallback extraction method")
+                logger.info("Dify model call failed or returned invalid data, using fallback extraction method"
+                            if use_model else "Model extraction disabled, using fallback extraction method")
                 # 使用默认结构和处理逻辑
                 extracted_data = {
                     "refSop": "GMP-SOP-001",
@@ -305,11 +382,12 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
                 }
                 
                 # 扫描对话内容尝试提取一些事件信息
-                for msg in messages:
-                    if msg["role"] == "user" and "故障" in msg["content"]:
+                for msg in conversation_history:
+                    content = str(msg.get("content") or "")
+                    if msg.get("role") == "user" and "故障" in content:
                         extracted_data["events"].append({
                             "date": datetime.now().strftime("%Y-%m-%d"),
-                            "description": f"用户报告故障: {msg['content'][:50]}..."
+                            "description": f"用户报告故障: {content[:50]}..."
                         })
             
             # 处理提取的数据
@@ -322,6 +400,7 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
             # 返回默认数据
             return self._add_default_required_fields({})
     
+    @timed("extract.normalize")
     def _process_extracted_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """处理和规范化提取的数据，确保其符合报告数据模型的要求"""
         # 添加必填字段的默认值，防止生成报告时出现空值错误
@@ -651,6 +730,7 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
         
         return data
     
+    @timed("extract.markdown_tables")
     def _extract_from_markdown_tables(self, markdown_text: str) -> Dict[str, Any]:
         """从Markdown表格中提取GMP报告数据
         
@@ -745,6 +825,7 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
             logger.error(f"Error extracting data from Markdown tables: {str(e)}")
             return {}
     
+    @timed("extract.parse_input")
     def _extract_json_from_conversation_id(self, conversation_id: str) -> tuple:
         """尝试从conversation_id参数中提取JSON数据
         
@@ -777,7 +858,6 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
                     logger.info("检测到单引号形式的JSON字符串")
                     try:
                         # 使用ast模块安全地将单引号JSON字符串转换为Python字典
-                        import ast
                         # 去掉可能的外层单引号
                         if conversation_id.startswith("'") and conversation_id.endswith("'"):
                             json_text = conversation_id[1:-1]
@@ -805,7 +885,6 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
             
             # 1. 尝试使用ast.literal_eval解析单引号JSON
             try:
-                import ast
                 embedded_json = ast.literal_eval(json_text)
                 logger.info("通过ast.literal_eval成功解析单引号JSON")
             except Exception as e:
@@ -829,7 +908,6 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
                         
                         # 4. 使用正则表达式尝试提取最外层的JSON对象
                         try:
-                            import re
                             json_pattern = r'(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})'
                             matches = re.findall(json_pattern, json_text)
                             if matches:
@@ -933,6 +1011,7 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
             logger.warning(f"尝试从conversation_id提取JSON失败: {str(e)}")
             return conversation_id, None
             
+    @timed("extract.json_repair")
     def _fix_json_format(self, json_text: str) -> str:
         """尝试修复常见的JSON格式问题
         
@@ -971,4 +1050,41 @@ refSop, docId, version, title, investigationId, preparedBy, preparedDate, summar
         fixed_text = re.sub(r':\s*,', r': "",', fixed_text)
         fixed_text = re.sub(r':\s*}', r': ""}', fixed_text)
         
-        return fixed_text 
\ No newline at end of file
+        return fixed_text 
+
+@timed("extract.report")
+def extract_report(conversation_id: str, ctx: Dict[str, Any] = None) -> Dict[str, Any]:
+    """从对话中提取GMP报告数据的程序接口
+    
+    供PDF生成、报告预览工具和命令行流水线直接调用，不经过工具消息的封装和JSON往返。
+    
+    Args:
+        conversation_id: 对话ID，可能内嵌JSON格式的报告数据
+        ctx: Dify上下文，包含api_base、api_key、user_id，可包含credentials
+        
+    Returns:
+        结果字典，包含success、message和report_data
+    """
+    extractor = GMPExtractDataTool(None, None)
+    extractor.context = dict(ctx or {})
+    return extractor.extract(conversation_id)
+
+@timed("extract.report")
+def extract_report_from_history(conversation_history: List[Dict[str, Any]],
+                                ctx: Dict[str, Any] = None) -> Dict[str, Any]:
+    """从已导出的对话历史中提取GMP报告数据的程序接口
+    
+    供离线回填使用：对话已从Dify导出，不再调用/messages接口；对话中没有助手整理的报告数据表格时
+    用ctx中的Dify上下文调用模型提取。ctx中没有api_key时完全不调用模型（包括环境变量配置的后备路由），
+    没有表格的对话只能得到默认内容（结果中fallback为True）。
+    
+    Args:
+        conversation_history: 对话消息列表，字段与Dify /messages接口一致
+        ctx: Dify上下文，包含api_base、api_key、user_id，可为空
+        
+    Returns:
+        结果字典，包含success、message、report_data、source和fallback
+    """
+    extractor = GMPExtractDataTool(None, None)
+    extractor.context = dict(ctx or {})
+    return extractor.extract_from_history(conversation_history, use_model=bool(extractor.context.get("api_key")))
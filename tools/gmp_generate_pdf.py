@@ -3,21 +3,24 @@ Bayer GMP Reporter - PDF生成工具
 """
 from collections.abc import Generator
 from typing import Any, Dict, List
-import requests
-import base64
+import ast
+import contextvars
+import hashlib
 import json
 import logging
+import re
 import sys
 import os
-from datetime import datetime
-from dotenv import load_dotenv
+import threading
+import time
 
-# 加载环境变量
-env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
-load_dotenv(env_path)
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
 
-# 添加项目根目录到Python路径
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 加载环境变量（.env只在config中加载一次）
+import config
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
@@ -26,16 +29,170 @@ from dify_plugin.entities.tool import ToolInvokeMessage
 logger = logging.getLogger("bayer_gmp")
 
 # 导入公共工具函数
-from utils import call_dify_model, extract_json_from_text
+import http_client
+from utils import call_dify_model, extract_json_from_text, canonical_json_hash
+from pdf_renderer import render_report_pdf
+import deadline
+import metrics
+from metrics import span, timed
+from profiling import profiled
+from correlation import correlated, current_request_id
+import report_store
+from payload_logging import log_payload, payload_scope
+from memory_guard import ReportTooLargeError, check_report_size, use_streaming
+from singleflight import SingleFlight
 
 # 全局配置
-DEFAULT_SPRING_APP_URL = os.getenv("SPRING_APP_URL", "http://localhost:8080")
-DEFAULT_SPRING_APP_API_KEY = os.getenv("SPRING_APP_API_KEY", "test_key")
+DEFAULT_SPRING_APP_URL = config.SPRING_APP_URL
+DEFAULT_SPRING_APP_API_KEY = config.SPRING_APP_API_KEY
 API_ENDPOINTS = {
     "generate_pdf": "/api/pdf/generate",
     "preview_report": "/api/reports/preview-from-data"
 }
 
+# PDF渲染方式: spring(默认)、local(插件内渲染)、auto(根据Spring健康状况自动选择)
+PDF_RENDERERS = ("spring", "local", "auto")
+DEFAULT_PDF_RENDERER = os.getenv("GMP_PDF_RENDERER", "spring")
+# 自动模式下判定Spring"过慢"的平均响应时间(秒)和"不可用"的连续失败次数
+SPRING_SLOW_THRESHOLD = float(os.getenv("GMP_SPRING_SLOW_THRESHOLD", "10"))
+SPRING_FAILURE_THRESHOLD = int(os.getenv("GMP_SPRING_FAILURE_THRESHOLD", "3"))
+# 切换到本地渲染后，间隔多久(秒)再次尝试Spring
+SPRING_RECOVERY_INTERVAL = float(os.getenv("GMP_SPRING_RECOVERY_INTERVAL", "60"))
+
+
+class SpringHealthTracker:
+    """记录Spring PDF服务的近期响应情况，供自动渲染模式判断是否绕过Spring"""
+    
+    def __init__(self, slow_threshold: float = SPRING_SLOW_THRESHOLD,
+                 failure_threshold: int = SPRING_FAILURE_THRESHOLD,
+                 recovery_interval: float = SPRING_RECOVERY_INTERVAL,
+                 alpha: float = 0.3):
+        self.slow_threshold = slow_threshold
+        self.failure_threshold = failure_threshold
+        self.recovery_interval = recovery_interval
+        self.alpha = alpha
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.last_attempt = 0.0
+        self._lock = threading.Lock()
+    
+    def record_result(self, success: bool, latency: float) -> None:
+        """记录一次Spring调用的结果和耗时(秒)"""
+        with self._lock:
+            self.last_attempt = time.monotonic()
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = self.alpha * latency + (1 - self.alpha) * self.latency_ewma
+            self.consecutive_failures = 0 if success else self.consecutive_failures + 1
+    
+    def record_failure(self) -> None:
+        """记录一次连接失败或超时"""
+        with self._lock:
+            self.last_attempt = time.monotonic()
+            self.consecutive_failures += 1
+    
+    def prefer_local(self) -> bool:
+        """Spring近期不可用或过慢时返回True；超过恢复间隔后放行一次Spring请求用于探测"""
+        with self._lock:
+            unhealthy = self.consecutive_failures >= self.failure_threshold or \
+                (self.latency_ewma is not None and self.latency_ewma > self.slow_threshold)
+            if not unhealthy:
+                return False
+            if time.monotonic() - self.last_attempt >= self.recovery_interval:
+                # 标记本次探测，避免并发调用同时涌向Spring
+                self.last_attempt = time.monotonic()
+                return False
+            return True
+
+
+_spring_health = SpringHealthTracker()
+
+# 推测渲染：optimize_data=true时，优化报告数据的同时渲染原始数据
+SPECULATIVE_RENDER = os.getenv("GMP_SPECULATIVE_RENDER", "false").strip().lower() in ("1", "true", "yes", "on")
+# 从开始优化起等待优化结果的最长时间(秒)，超过后返回推测渲染的PDF
+SPECULATIVE_DEADLINE = float(os.getenv("GMP_SPECULATIVE_DEADLINE", "30"))
+
+SPECULATIVE_RENDER_TOTAL = "gmp_speculative_render_total"
+metrics.registry.describe(SPECULATIVE_RENDER_TOTAL,
+                          "Speculative renders by outcome: optimized (speculative PDF wasted), deadline, "
+                          "unchanged or render_failed (speculative PDF returned)")
+
+
+# 报告优化方式：patch只发送叙述性字段并按字段应用补丁，full由模型改写整份报告
+OPTIMIZE_MODE = os.getenv("GMP_OPTIMIZE_MODE", "patch").strip().lower()
+# patch模式发送给模型的叙述性字段
+PATCH_FIELDS = ("summary", "rootCause", "impactAssessment", "investigation", "handling", "eventSummary")
+# 优化后文本长度的允许范围：不短于原文的30%，不长于原文的3倍加100字，超出视为模型截断或扩写过度
+PATCH_MIN_RATIO = 0.3
+PATCH_MAX_RATIO = 3.0
+PATCH_MAX_EXTRA_CHARS = 100
+
+OPTIMIZE_PATCH_FIELDS = "gmp_optimize_patch_fields_total"
+metrics.registry.describe(OPTIMIZE_PATCH_FIELDS,
+                          "Fields returned in report optimization patches by result: applied, unchanged, "
+                          "not_text, empty or length (rejected)")
+
+
+def _check_patch_field(original: str, value: Any) -> str:
+    """校验补丁中的单个字段
+    
+    Returns:
+        applied（可应用）、unchanged（与原文相同），或拒绝原因not_text、empty、length
+    """
+    if not isinstance(value, str):
+        return "not_text"
+    value = value.strip()
+    if not value:
+        return "empty"
+    if value == original.strip():
+        return "unchanged"
+    length = len(original.strip())
+    if not length * PATCH_MIN_RATIO <= len(value) <= length * PATCH_MAX_RATIO + PATCH_MAX_EXTRA_CHARS:
+        return "length"
+    return "applied"
+
+
+def _succeeded(messages: List[ToolInvokeMessage]) -> bool:
+    """渲染结果消息中是否有成功的结果JSON"""
+    return any(isinstance(getattr(message.message, "json_object", None), dict)
+               and message.message.json_object.get("success") for message in messages)
+
+
+# 合并同一对话、相同参数的并发PDF生成
+_generate_flight = SingleFlight("generate")
+
+
+def _flight_key(tool_parameters: Dict[str, Any]) -> str:
+    """合并键：对话ID、报告数据原文的摘要和其余参数的规范化哈希
+
+    报告数据可能很大，直接分段对原文取摘要，不为计算键再做一次JSON序列化；调用前须已通过check_report_size。
+    """
+    report_data = tool_parameters.get("report_data")
+    if isinstance(report_data, (str, bytes)):
+        digest = hashlib.blake2b(digest_size=16)
+        step = 64 * 1024
+        for i in range(0, len(report_data), step):
+            chunk = report_data[i:i + step]
+            digest.update(chunk.encode("utf-8", errors="surrogatepass") if isinstance(chunk, str) else chunk)
+        report_digest = digest.hexdigest()
+        others = {key: value for key, value in tool_parameters.items() if key != "report_data"}
+    else:
+        report_digest = "-"
+        others = tool_parameters
+    return f"{tool_parameters.get('conversation_id') or '-'}|{report_digest}|{canonical_json_hash(others)}"
+
+
+def _coalesced_copy(message: ToolInvokeMessage) -> ToolInvokeMessage:
+    """复制合并调用的结果消息：去掉leader的关联ID（由本次调用重新填写），并标记为合并结果"""
+    copied = message.model_copy(deep=True)
+    json_object = getattr(copied.message, "json_object", None)
+    if isinstance(json_object, dict):
+        json_object.pop("request_id", None)
+        json_object["coalesced"] = True
+    return copied
+
+
 class GMPGeneratePDFTool(Tool):
     """生成GMP报告PDF的工具"""
     
@@ -49,15 +206,39 @@ class GMPGeneratePDFTool(Tool):
         super().__init__(runtime, session)
         self.context = {}
     
+    @correlated("gmp_generate_pdf")
+    @timed("tool.generate")
+    @profiled("gmp_generate_pdf")
     def _invoke(self, tool_parameters: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """执行工具调用逻辑
         
+        同一对话、相同参数的并发调用只生成一次PDF，其余调用复用其结果（带coalesced标记）。
+        过大的报告数据在计算合并键之前就被拒绝。
+        
         Args:
             tool_parameters: 工具参数，包含report_data或conversation_id
             
         Yields:
             ToolInvokeMessage: 工具调用消息
         """
+        try:
+            check_report_size(tool_parameters.get("report_data"))
+        except ReportTooLargeError as e:
+            logger.error(str(e))
+            yield self.create_json_message({
+                "success": False,
+                "message": str(e)
+            })
+            return
+        flight_key = _flight_key(tool_parameters)
+        # 确定本次请求的载荷日志策略（采样、调试预算），生成结束后恢复
+        with payload_scope(debug=bool(tool_parameters.get("debug_logging"))):
+            messages, shared = _generate_flight.do(flight_key, lambda: list(self._generate(tool_parameters)))
+        for message in messages:
+            yield _coalesced_copy(message) if shared else message
+    
+    def _generate(self, tool_parameters: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """_invoke的实际实现"""
         try:
             # 在最开始处详细打印所有tool_parameters信息
             logger.info("="*80)
@@ -73,11 +254,12 @@ class GMPGeneratePDFTool(Tool):
                 value = tool_parameters.get(key)
                 if key == 'report_data':
                     if isinstance(value, str):
-                        logger.info(f"report_data (字符串): 长度={len(value)}, 预览={value[:200]}...")
+                        logger.info("report_data (字符串): 长度=%d", len(value))
                     elif isinstance(value, dict):
-                        logger.info(f"report_data (字典): 键={list(value.keys())}, 预览={str(value)[:200]}...")
+                        logger.info("report_data (字典): 键=%s", list(value.keys()))
                     else:
-                        logger.info(f"report_data: 类型={type(value)}, 值={str(value)[:200]}...")
+                        logger.info("report_data: 类型=%s", type(value))
+                    log_payload(logger, "report_data 预览", value, budget=200)
                 elif key == 'context':
                     if isinstance(value, dict):
                         logger.info(f"context: 键={list(value.keys())}")
@@ -94,7 +276,7 @@ class GMPGeneratePDFTool(Tool):
                         logger.info(f"credentials: 类型={type(value)}")
                 else:
                     # 其他参数
-                    logger.info(f"{key}: 类型={type(value)}, 值={str(value)[:100]}")
+                    log_payload(logger, f"{key} ({type(value).__name__})", value, budget=100)
             
             logger.info("="*80)
             
@@ -124,6 +306,11 @@ class GMPGeneratePDFTool(Tool):
             elif self.session and hasattr(self.session, 'credentials') and self.session.credentials:
                 credentials = self.session.credentials  
                 logger.info(f"Got credentials from session: {list(credentials.keys())}")
+            
+            # 5. 从插件运行时获取供应商凭据
+            elif self.runtime is not None and getattr(self.runtime, 'credentials', None):
+                credentials = self.runtime.credentials
+                logger.info(f"Got credentials from runtime: {list(credentials.keys())}")
                 
             # 更新context
             self.context['credentials'] = credentials
@@ -188,9 +375,23 @@ class GMPGeneratePDFTool(Tool):
             report_data_str = tool_parameters.get("report_data")
             conversation_id = tool_parameters.get("conversation_id")
             
+            # 在解析前检查报告数据大小，过大的输入直接拒绝；较大的输入走精简处理路径
+            try:
+                report_size = check_report_size(report_data_str)
+            except ReportTooLargeError as e:
+                logger.error(str(e))
+                yield self.create_json_message({
+                    "success": False,
+                    "message": str(e)
+                })
+                return
+            lean_mode = use_streaming(report_size)
+            if lean_mode:
+                logger.warning(f"报告数据较大（{report_size}字节），将跳过数据优化并以流式方式发送请求体")
+            
             # 日志输出完整工具参数，帮助调试
             logger.info("="*50)
-            logger.info("完整工具参数: %s", json.dumps(tool_parameters, ensure_ascii=False)[:500])
+            log_payload(logger, "完整工具参数", tool_parameters, budget=500)
             logger.info("="*50)
             
             # 详细记录接收到的报告数据原始内容
@@ -204,10 +405,10 @@ class GMPGeneratePDFTool(Tool):
             if report_data_str:
                 if isinstance(report_data_str, str):
                     logger.info("报告数据字符串长度: %d", len(report_data_str))
-                    logger.info("报告数据字符串内容: %s", report_data_str[:1000] + "..." if len(report_data_str) > 1000 else report_data_str)
+                    log_payload(logger, "报告数据字符串内容", report_data_str)
                 else:
                     logger.info("报告数据对象键: %s", list(report_data_str.keys()) if isinstance(report_data_str, dict) else "不是字典对象")
-                    logger.info("报告数据对象内容: %s", json.dumps(report_data_str, ensure_ascii=False, indent=2)[:1000] + "..." if len(json.dumps(report_data_str, ensure_ascii=False)) > 1000 else json.dumps(report_data_str, ensure_ascii=False, indent=2))
+                    log_payload(logger, "报告数据对象内容", report_data_str, indent=2)
             else:
                 logger.warning("报告数据为空值")
             logger.info("对话ID: %s", conversation_id)
@@ -229,7 +430,6 @@ class GMPGeneratePDFTool(Tool):
                         # 首先尝试处理单引号JSON格式（新格式支持）
                         if report_data_str.startswith("{'") and "'" in report_data_str:
                             # 将单引号JSON转换为标准JSON
-                            import ast
                             try:
                                 # 尝试使用ast.literal_eval解析单引号JSON
                                 parsed_data = ast.literal_eval(report_data_str)
@@ -241,7 +441,6 @@ class GMPGeneratePDFTool(Tool):
                                 # 尝试转换为标准JSON格式再解析
                                 try:
                                     # 使用正则表达式替换单引号为双引号，但保留字符串内的单引号
-                                    import re
                                     json_str = re.sub(r"(?<!\\)'([^']*)'(?=:)", r'"\1"', report_data_str)
                                     json_str = re.sub(r":\s*'([^']*)'", r': "\1"', json_str)
                                     logger.info(f"转换后的JSON字符串: {json_str[:200]}..." if len(json_str) > 200 else json_str)
@@ -316,7 +515,6 @@ class GMPGeneratePDFTool(Tool):
                                 logger.warning(f"JSON解析失败，尝试其他方法: {str(e)}")
                                 # 尝试使用正则表达式查找嵌入的JSON
                                 try:
-                                    import re
                                     json_pattern = r'(\{.*\})'
                                     matches = re.search(json_pattern, report_data_str)
                                     if matches:
@@ -377,49 +575,40 @@ class GMPGeneratePDFTool(Tool):
                     report_data = report_data_str
                     logger.info("处理报告数据时出错，尝试直接使用原始值")
             
+            # 解析完成后释放原始字符串，避免与解析结果同时占用内存
+            report_data_str = None
+            
+            # 报告数据是提取失败时的默认内容（由调用方标记，或下面从对话提取时得到）时不保存到本地报告存储
+            fallback_data = bool(tool_parameters.get("report_fallback"))
+            
             # 如果从report_data_str没有成功提取到数据且有conversation_id，尝试从对话ID提取
             if (not report_data or (isinstance(report_data, dict) and not report_data)) and conversation_id:
                 logger.info("报告数据提取失败或为空，尝试从conversation_id获取数据")
-                from .gmp_extract_data import GMPExtractDataTool
-                extract_tool = GMPExtractDataTool(self.runtime, self.session)
+                from .gmp_extract_data import extract_report
                 
-                # 确保extract_tool有正确的上下文和凭据
-                extract_tool.context = self.context
-                if hasattr(self, 'credentials'):
-                    extract_tool.credentials = self.credentials
+                # 提取使用当前的Dify上下文和凭据
+                extract_context = dict(self.context)
+                if 'credentials' in tool_parameters:
+                    extract_context['credentials'] = tool_parameters.get('credentials')
                 
-                # 尝试使用提取工具获取数据
                 try:
-                    logger.info(f"调用数据提取工具，对话ID: {conversation_id}")
-                    extract_params = {
-                        "conversation_id": conversation_id, 
-                        "context": self.context
-                    }
-                    if 'credentials' in tool_parameters:
-                        extract_params["credentials"] = tool_parameters.get('credentials')
-                        
-                    extract_responses = list(extract_tool._invoke(extract_params))
-                    
-                    for response in extract_responses:
-                        if hasattr(response, 'json_data'):
-                            result = json.loads(response.json_data)
-                            logger.info(f"数据提取工具响应结果: {result.get('success')}")
-                            logger.info(f"数据提取工具响应键: {list(result.keys())}")
-                            if result.get("success"):
-                                report_data = result.get("report_data", {})
-                                if report_data:
-                                    logger.info(f"成功从对话中提取报告数据，字段: {', '.join(report_data.keys())}")
-                                    # 记录提取到的数据
-                                    logger.info(f"提取到的报告数据内容: {json.dumps(report_data, ensure_ascii=False)[:500]}")
-                                    # 成功提取数据后，直接继续处理流程
-                                    break
-                                else:
-                                    logger.error(f"提取的report_data为空或缺失")
-                            else:
-                                logger.error(f"数据提取工具返回失败: {result.get('message', '未知错误')}")
+                    logger.info(f"调用数据提取，对话ID: {conversation_id}")
+                    result = extract_report(conversation_id, extract_context)
+                    logger.info(f"数据提取结果: {result.get('success')}")
+                    if result.get("success"):
+                        report_data = result.get("report_data", {})
+                        fallback_data = bool(result.get("fallback"))
+                        if report_data:
+                            logger.info(f"成功从对话中提取报告数据，字段: {', '.join(report_data.keys())}")
+                            # 记录提取到的数据
+                            log_payload(logger, "提取到的报告数据内容", report_data, budget=500)
+                        else:
+                            logger.error("提取的report_data为空或缺失")
+                    else:
+                        logger.error(f"数据提取返回失败: {result.get('message', '未知错误')}")
                     
                 except Exception as e:
-                    logger.error(f"调用数据提取工具时出错: {str(e)}")
+                    logger.error(f"调用数据提取时出错: {str(e)}")
                     yield self.create_json_message({
                         "success": False,
                         "message": f"无法从对话中提取报告数据: {str(e)}"
@@ -439,7 +628,7 @@ class GMPGeneratePDFTool(Tool):
                             if field == "events" and isinstance(report_data[field], list):
                                 logger.info("events字段包含%d个事件", len(report_data[field]))
                                 for i, event in enumerate(report_data[field][:3]):  # 只显示前3个事件
-                                    logger.info("事件%d: %s", i+1, json.dumps(event, ensure_ascii=False))
+                                    log_payload(logger, f"事件{i+1}", event)
                                 if len(report_data[field]) > 3:
                                     logger.info("... 更多事件未显示 ...")
                             else:
@@ -460,7 +649,7 @@ class GMPGeneratePDFTool(Tool):
                     if missing_fields:
                         logger.warning("报告数据缺少关键字段: %s", ", ".join(missing_fields))
                 else:
-                    logger.warning("处理后的报告数据不是字典对象: %s", str(report_data)[:200])
+                    log_payload(logger, "处理后的报告数据不是字典对象", report_data, level=logging.WARNING, budget=200)
             else:
                 logger.error("处理后的报告数据为空")
             
@@ -498,239 +687,524 @@ class GMPGeneratePDFTool(Tool):
                 if missing_fields:
                     logger.warning("报告数据缺少关键字段: %s", ", ".join(missing_fields))
             else:
-                logger.warning("处理后的报告数据不是字典对象: %s", str(report_data)[:200])
+                log_payload(logger, "处理后的报告数据不是字典对象", report_data, level=logging.WARNING, budget=200)
             
             # 优化报告数据（可选）
-            if tool_parameters.get("optimize_data", False):
-                report_data = self._optimize_report_data(report_data)
+            optimize = bool(tool_parameters.get("optimize_data", False))
+            if optimize and lean_mode:
+                logger.warning("报告数据较大，跳过数据优化")
+                optimize = False
+            # 数据优化是可选步骤，本次调用剩余时间不足时跳过，优先保证返回PDF
+            if optimize and not deadline.allows("optimize", deadline.DEADLINE_OPTIMIZE_MIN):
+                optimize = False
             
-            # 调用Spring服务生成PDF
-            try:
-                logger.info(f"Generating PDF report with Spring App URL: {base_url}")
-                
-                # 确保使用有效的API密钥
-                if not api_key:
-                    logger.warning("Spring API密钥为空，将使用环境变量中的值")
-                    api_key = DEFAULT_SPRING_APP_API_KEY
-                
-                # 确保API密钥不为空
-                if not api_key:
-                    logger.error("严重错误：Spring API密钥在所有可能的来源中均为空")
-                    yield self.create_json_message({
-                        "success": False,
-                        "message": "无法生成PDF：未提供Spring服务API密钥。请检查.env文件或工具配置。"
-                    })
-                    return
-                
-                # 详细记录请求信息，便于调试
-                logger.info(f"使用的API密钥(前5位): {api_key[:5]}..." if len(api_key) > 5 else "API密钥为空")
-                logger.info(f"请求URL: {base_url}{API_ENDPOINTS['generate_pdf']}")
-                logger.info(f"报告数据字段: {list(report_data.keys()) if isinstance(report_data, dict) else '非字典对象'}")
+            # 选择PDF渲染方式
+            renderer = self._select_renderer(tool_parameters.get("renderer"))
+            logger.info(f"使用PDF渲染方式: {renderer}")
+            
+            # 推测渲染：优化与原始数据的渲染同时进行
+            if optimize and SPECULATIVE_RENDER:
+                messages, report_data = self._speculative_render(report_data, renderer, base_url, api_key)
+            else:
+                if optimize:
+                    report_data = self._optimize_report_data(report_data)
+                messages = self._render_messages(report_data, renderer, base_url, api_key, stream=lean_mode)
+            
+            if fallback_data:
+                logger.warning("报告数据为提取失败时的默认内容，不保存到本地报告存储")
+                for message in messages:
+                    json_object = getattr(message.message, "json_object", None)
+                    if isinstance(json_object, dict):
+                        json_object["fallback"] = True
+            else:
+                self._store_report(report_data, messages, api_key, conversation_id)
+            yield from messages
                 
-                headers = {
-                    "Content-Type": "application/json",
-                    "X-API-KEY": api_key  # 使用X-API-KEY头而不是Authorization
+        except Exception as e:
+            logger.error(f"Error in GMP PDF generation: {str(e)}")
+            yield self.create_json_message({
+                "success": False,
+                "message": f"PDF生成失败: {str(e)}"
+            })
+    
+    def _render_messages(self, report_data: Dict[str, Any], renderer: str, base_url: str, api_key: str,
+                         stream: bool = False) -> List[ToolInvokeMessage]:
+        """按渲染方式生成PDF，返回工具消息（auto模式下Spring失败时改用本地渲染）"""
+        if renderer == "local":
+            return list(self._local_render_messages(report_data))
+        
+        # 调用Spring服务生成PDF
+        result = self._render_with_spring(report_data, base_url, api_key, stream=stream)
+        if not result.get("success") and renderer == "auto":
+            logger.warning(f"Spring渲染失败，自动切换到本地渲染: {result.get('message')}")
+            return list(self._local_render_messages(report_data))
+        
+        if result.get("success"):
+            result["renderer"] = "spring"
+        return [self.create_json_message(result)]
+    
+    def _speculative_render(self, report_data: Dict[str, Any], renderer: str, base_url: str,
+                            api_key: str) -> tuple:
+        """推测渲染：后台优化报告数据的同时渲染原始数据
+        
+        优化结果在GMP_SPECULATIVE_DEADLINE内返回且与原始数据不同时，渲染并返回优化后的PDF
+        （推测渲染的PDF作废）；否则直接返回推测渲染的PDF。超过期限的优化仍会在后台完成，但结果被丢弃。
+        本次调用剩余的时间不够重新渲染时同样返回推测渲染的PDF。
+        
+        Returns:
+            tuple: (工具消息, 所返回PDF对应的报告数据)，结果JSON中的speculative字段记录本次的结果
+        """
+        start = time.monotonic()
+        optimized: Dict[str, Any] = {}
+        done = threading.Event()
+        # 在后台线程中沿用本次调用的关联ID和阶段统计
+        context = contextvars.copy_context()
+        
+        def optimize():
+            try:
+                optimized["data"] = context.run(self._optimize_report_data, report_data)
+            finally:
+                done.set()
+        
+        threading.Thread(target=optimize, name="gmp-speculative-optimize", daemon=True).start()
+        with span("generate.speculative_render"):
+            messages = self._render_messages(report_data, renderer, base_url, api_key)
+        
+        remaining = SPECULATIVE_DEADLINE - (time.monotonic() - start)
+        request_remaining = deadline.remaining()
+        if request_remaining is not None:
+            # 等待优化结果后还要留出重新渲染的时间
+            remaining = min(remaining, request_remaining - deadline.DEADLINE_RETRY_MIN)
+        if not done.wait(max(remaining, 0.0)):
+            outcome = "deadline"
+            logger.info("优化未在期限内完成，返回推测渲染的PDF")
+        elif not optimized.get("data") or optimized["data"] == report_data:
+            outcome = "unchanged"
+            logger.info("优化未改变报告数据，返回推测渲染的PDF")
+        elif not deadline.allows("speculative_rerender", deadline.DEADLINE_RETRY_MIN):
+            outcome = "deadline"
+        else:
+            final_messages = self._render_messages(optimized["data"], renderer, base_url, api_key)
+            if _succeeded(final_messages) or not _succeeded(messages):
+                outcome = "optimized"
+                messages = final_messages
+                report_data = optimized["data"]
+                logger.info(f"使用优化后的数据重新渲染，推测渲染的PDF作废，"
+                            f"共耗时{time.monotonic() - start:.2f}秒")
+            else:
+                outcome = "render_failed"
+                logger.warning("优化后的数据渲染失败，返回推测渲染的PDF")
+        
+        metrics.registry.inc(SPECULATIVE_RENDER_TOTAL, outcome=outcome)
+        for message in messages:
+            json_object = getattr(message.message, "json_object", None)
+            if isinstance(json_object, dict):
+                json_object["speculative"] = outcome
+        return messages, report_data
+    
+    def _store_report(self, report_data: Dict[str, Any], messages: List[ToolInvokeMessage], api_key: str,
+                      conversation_id: Any = None) -> None:
+        """生成成功时把报告数据和生成结果写入本地报告存储，结果JSON中附带report_id供之后查找
+        
+        生成结果归属于Spring API密钥对应的调用方，报告查找工具只返回同一密钥下生成的报告。
+        """
+        if not _succeeded(messages):
+            return
+        artifact: Dict[str, Any] = {}
+        result = None
+        for message in messages:
+            json_object = getattr(message.message, "json_object", None)
+            if isinstance(json_object, dict):
+                result = json_object
+                artifact.update({key: json_object.get(key) for key in ("renderer", "filename", "download_url")})
+            blob = getattr(message.message, "blob", None)
+            if blob is not None:
+                artifact["size"] = len(blob)
+        report_id = report_store.save_report(report_data, artifact, api_key, conversation_id, current_request_id())
+        if report_id and result is not None:
+            result["report_id"] = report_id
+    
+    def _render_with_spring(self, report_data: Dict[str, Any], base_url: str, api_key: str,
+                            stream: bool = False) -> Dict[str, Any]:
+        """调用Spring服务生成PDF，二进制响应会上传到MinIO以获取下载链接
+        
+        Args:
+            report_data: 报告数据
+            base_url: Spring服务基础URL
+            api_key: Spring服务API密钥
+            stream: 是否以流式方式发送请求体（大报告）
+            
+        Returns:
+            工具返回给用户的结果字典
+        """
+        try:
+            logger.info(f"Generating PDF report with Spring App URL: {base_url}")
+            
+            # 确保使用有效的API密钥
+            if not api_key:
+                logger.warning("Spring API密钥为空，将使用环境变量中的值")
+                api_key = DEFAULT_SPRING_APP_API_KEY
+            
+            # 确保API密钥不为空
+            if not api_key:
+                logger.error("严重错误：Spring API密钥在所有可能的来源中均为空")
+                return {
+                    "success": False,
+                    "message": "无法生成PDF：未提供Spring服务API密钥。请检查.env文件或工具配置。"
                 }
-                
-                # 记录完整的headers信息
-                logger.info(f"请求Headers: {headers}")
-                
-                # 设置请求超时(秒)
-                timeout = 30  # 增加超时时间到30秒
-                
-                response = requests.post(
+            
+            # 详细记录请求信息，便于调试
+            logger.info(f"使用的API密钥(前5位): {api_key[:5]}..." if len(api_key) > 5 else "API密钥为空")
+            logger.info(f"请求URL: {base_url}{API_ENDPOINTS['generate_pdf']}")
+            logger.info(f"报告数据字段: {list(report_data.keys()) if isinstance(report_data, dict) else '非字典对象'}")
+            
+            headers = {
+                "Content-Type": "application/json",
+                "X-API-KEY": api_key  # 使用X-API-KEY头而不是Authorization
+            }
+            
+            # 记录完整的headers信息
+            logger.info(f"请求Headers: {headers}")
+            
+            # 设置请求超时(秒)，http_client会进一步限制在本次调用的剩余时间内
+            timeout = 30  # 增加超时时间到30秒
+            
+            request_start = time.perf_counter()
+            with span("spring.render"):
+                response = http_client.post(
                     f"{base_url}{API_ENDPOINTS['generate_pdf']}",
+                    "spring",
                     headers=headers,
-                    json=report_data,
-                    timeout=timeout
+                    json_body=report_data,
+                    timeout=timeout,
+                    stream_json=stream
                 )
+            _spring_health.record_result(response.status_code < 500, time.perf_counter() - request_start)
+            
+            if response.status_code == 200:
+                logger.info("Successfully generated PDF report")
+                # 检查内容类型
+                content_type = response.headers.get('Content-Type', '')
+                logger.info(f"Response Content-Type: {content_type}")
                 
-                if response.status_code == 200:
-                    logger.info("Successfully generated PDF report")
-                    # 检查内容类型
-                    content_type = response.headers.get('Content-Type', '')
-                    logger.info(f"Response Content-Type: {content_type}")
-                    
-                    # 处理JSON响应 - 先尝试获取Minio文件链接
-                    if 'application/json' in content_type:
-                        try:
-                            response_data = response.json()
-                            # 打印响应数据的所有键，便于调试
-                            logger.info(f"JSON response keys: {list(response_data.keys())}")
-                            logger.info(f"JSON response content: {str(response_data)[:200]}...")
+                # 处理JSON响应 - 先尝试获取Minio文件链接
+                if 'application/json' in content_type:
+                    try:
+                        response_data = response.json()
+                        # 打印响应数据的所有键，便于调试
+                        logger.info(f"JSON response keys: {list(response_data.keys())}")
+                        log_payload(logger, "JSON response content", response_data, budget=200)
+                        
+                        # 检查是否直接返回了Minio或下载链接
+                        if 'minio_url' in response_data and response_data['minio_url']:
+                            minio_url = response_data.get('minio_url')
+                            logger.info(f"获取到Minio文件下载链接: {minio_url}")
                             
-                            # 检查是否直接返回了Minio或下载链接
-                            if 'minio_url' in response_data and response_data['minio_url']:
-                                minio_url = response_data.get('minio_url')
-                                logger.info(f"获取到Minio文件下载链接: {minio_url}")
-                                
-                                # 构建有效的文件名
-                                filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
-                                if 'filename' in response_data:
-                                    filename = response_data.get('filename')
-                                
-                                # 构建Markdown格式的链接
-                                markdown_download_link = f"[下载PDF报告]({minio_url})"
-                                
-                                # 返回下载链接信息给用户
-                                yield self.create_json_message({
-                                    "success": True,
-                                    "message": "成功生成PDF报告",
-                                    "download_url": minio_url,
-                                    "markdown_download_link": markdown_download_link,
-                                    "filename": filename
-                                })
-                                return
-                            elif 'download_url' in response_data and response_data['download_url']:
-                                download_url = response_data.get('download_url')
-                                logger.info(f"获取到文件下载链接: {download_url}")
-                                
-                                # 构建有效的文件名
-                                filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
-                                if 'filename' in response_data:
-                                    filename = response_data.get('filename')
-                                
-                                # 构建Markdown格式的链接
-                                markdown_download_link = f"[下载PDF报告]({download_url})"
-                                
-                                # 返回下载链接信息给用户
-                                yield self.create_json_message({
-                                    "success": True,
-                                    "message": "成功生成PDF报告",
-                                    "download_url": download_url,
-                                    "markdown_download_link": markdown_download_link,
-                                    "filename": filename
-                                })
-                                return
-                            else:
-                                logger.error("JSON响应中不包含下载链接")
-                                yield self.create_json_message({
-                                    "success": False,
-                                    "message": "无法生成PDF：服务器响应中不包含下载链接"
-                                })
-                                return
-                        except Exception as e:
-                            logger.error(f"Error parsing JSON response: {str(e)}")
-                            yield self.create_json_message({
+                            # 构建有效的文件名
+                            filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
+                            if 'filename' in response_data:
+                                filename = response_data.get('filename')
+                            
+                            # 构建Markdown格式的链接
+                            markdown_download_link = f"[下载PDF报告]({minio_url})"
+                            
+                            # 返回下载链接信息给用户
+                            return {
+                                "success": True,
+                                "message": "成功生成PDF报告",
+                                "download_url": minio_url,
+                                "markdown_download_link": markdown_download_link,
+                                "filename": filename
+                            }
+                        elif 'download_url' in response_data and response_data['download_url']:
+                            download_url = response_data.get('download_url')
+                            logger.info(f"获取到文件下载链接: {download_url}")
+                            
+                            # 构建有效的文件名
+                            filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
+                            if 'filename' in response_data:
+                                filename = response_data.get('filename')
+                            
+                            # 构建Markdown格式的链接
+                            markdown_download_link = f"[下载PDF报告]({download_url})"
+                            
+                            # 返回下载链接信息给用户
+                            return {
+                                "success": True,
+                                "message": "成功生成PDF报告",
+                                "download_url": download_url,
+                                "markdown_download_link": markdown_download_link,
+                                "filename": filename
+                            }
+                        else:
+                            logger.error("JSON响应中不包含下载链接")
+                            return {
                                 "success": False,
-                                "message": f"解析JSON响应失败: {str(e)}"
-                            })
-                            return
-                    # 处理PDF二进制响应
-                    elif 'application/pdf' in content_type:
-                        # 直接获取PDF二进制数据
-                        pdf_content = response.content
-                        logger.info("Received binary PDF content")
+                                "message": "无法生成PDF：服务器响应中不包含下载链接"
+                            }
+                    except Exception as e:
+                        logger.error(f"Error parsing JSON response: {str(e)}")
+                        return {
+                            "success": False,
+                            "message": f"解析JSON响应失败: {str(e)}"
+                        }
+                # 处理PDF二进制响应
+                elif 'application/pdf' in content_type:
+                    # 直接获取PDF二进制数据
+                    pdf_content = response.content
+                    logger.info("Received binary PDF content")
+                    
+                    # 验证PDF文件是否有效 (至少检查PDF文件头)
+                    if pdf_content and pdf_content.startswith(b'%PDF-'):
+                        logger.info("PDF content appears to be valid (has correct header)")
                         
-                        # 验证PDF文件是否有效 (至少检查PDF文件头)
-                        if pdf_content and pdf_content.startswith(b'%PDF-'):
-                            logger.info("PDF content appears to be valid (has correct header)")
+                        # 额外检查PDF文件是否包含EOF标记
+                        if b'%%EOF' in pdf_content[-1024:]:
+                            logger.info("PDF content has EOF marker - likely complete")
+                        else:
+                            logger.warning("PDF content missing EOF marker - might be incomplete")
+                        
+                        # 上传二进制PDF到MinIO并获取链接
+                        try:
+                            # 生成文件名
+                            filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
                             
-                            # 额外检查PDF文件是否包含EOF标记
-                            if b'%%EOF' in pdf_content[-1024:]:
-                                logger.info("PDF content has EOF marker - likely complete")
-                            else:
-                                logger.warning("PDF content missing EOF marker - might be incomplete")
+                            # 将二进制PDF上传到MinIO
+                            upload_url = f"{base_url}/api/pdf/upload"
                             
-                            # 上传二进制PDF到MinIO并获取链接
-                            try:
-                                # 生成文件名
-                                filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
-                                
-                                # 将二进制PDF上传到MinIO
-                                upload_url = f"{base_url}/api/pdf/upload"
-                                
-                                logger.info(f"上传PDF到MinIO: {upload_url}")
-                                files = {"file": (filename, pdf_content, "application/pdf")}
-                                
-                                upload_response = requests.post(
+                            logger.info(f"上传PDF到MinIO: {upload_url}")
+                            files = {"file": (filename, pdf_content, "application/pdf")}
+                            
+                            with span("minio.upload"):
+                                upload_response = http_client.post(
                                     upload_url,
+                                    "spring",
                                     headers={"X-API-KEY": api_key},
                                     files=files,
                                     timeout=timeout
                                 )
+                            
+                            if upload_response.status_code == 200:
+                                upload_data = upload_response.json()
+                                minio_url = upload_data.get("minio_url")
                                 
-                                if upload_response.status_code == 200:
-                                    upload_data = upload_response.json()
-                                    minio_url = upload_data.get("minio_url")
+                                if minio_url:
+                                    # 构建Markdown格式的链接
+                                    markdown_download_link = f"[下载PDF报告]({minio_url})"
                                     
-                                    if minio_url:
-                                        # 构建Markdown格式的链接
-                                        markdown_download_link = f"[下载PDF报告]({minio_url})"
-                                        
-                                        # 返回下载链接信息给用户
-                                        yield self.create_json_message({
-                                            "success": True,
-                                            "message": "成功生成PDF报告",
-                                            "download_url": minio_url,
-                                            "markdown_download_link": markdown_download_link,
-                                            "filename": filename
-                                        })
-                                        return
-                                    else:
-                                        logger.error("MinIO上传成功但未返回URL")
+                                    # 返回下载链接信息给用户
+                                    return {
+                                        "success": True,
+                                        "message": "成功生成PDF报告",
+                                        "download_url": minio_url,
+                                        "markdown_download_link": markdown_download_link,
+                                        "filename": filename
+                                    }
                                 else:
-                                    logger.error(f"上传PDF到MinIO失败: {upload_response.status_code}, {upload_response.text}")
-                            except Exception as e:
-                                logger.error(f"处理PDF二进制数据时出错: {str(e)}")
-                            
-                            # 如果上传失败，返回错误信息
-                            yield self.create_json_message({
-                                "success": False,
-                                "message": "无法生成PDF下载链接，请稍后重试"
-                            })
-                            return
-                        else:
-                            logger.error(f"Invalid PDF content - missing PDF header")
-                            yield self.create_json_message({
-                                "success": False,
-                                "message": "Spring服务返回的内容不是有效的PDF格式"
-                            })
-                            return
+                                    logger.error("MinIO上传成功但未返回URL")
+                            else:
+                                logger.error(f"上传PDF到MinIO失败: {upload_response.status_code}, {upload_response.text}")
+                        except Exception as e:
+                            logger.error(f"处理PDF二进制数据时出错: {str(e)}")
+                        
+                        # 如果上传失败，返回错误信息
+                        return {
+                            "success": False,
+                            "message": "无法生成PDF下载链接，请稍后重试"
+                        }
                     else:
-                        logger.error(f"Invalid content type: {content_type}, expected application/pdf or application/json")
-                        # 检查是否返回了JSON格式的错误信息
-                        try:
-                            error_data = response.json()
-                            error_message = error_data.get("message", "未知错误")
-                            logger.error(f"服务器返回错误: {error_message}")
-                            
-                            yield self.create_json_message({
-                                "success": False,
-                                "message": f"无法生成PDF: {error_message}"
-                            })
-                            return
-                        except Exception:
-                            # 返回通用错误
-                            yield self.create_json_message({
-                                "success": False,
-                                "message": f"服务器返回了非PDF格式的内容，内容类型: {content_type}"
-                            })
-                            return
+                        logger.error("Invalid PDF content - missing PDF header")
+                        return {
+                            "success": False,
+                            "message": "Spring服务返回的内容不是有效的PDF格式"
+                        }
                 else:
-                    logger.error(f"Failed to generate PDF: {response.status_code}, {response.text}")
-                    yield self.create_json_message({
-                        "success": False,
-                        "message": f"生成PDF失败，服务返回错误: {response.status_code}，{response.text[:100]}"
-                    })
-                    return
-            except Exception as e:
-                logger.error(f"Error calling Spring service: {str(e)}")
-                yield self.create_json_message({
+                    logger.error(f"Invalid content type: {content_type}, expected application/pdf or application/json")
+                    # 检查是否返回了JSON格式的错误信息
+                    try:
+                        error_data = response.json()
+                        error_message = error_data.get("message", "未知错误")
+                        logger.error(f"服务器返回错误: {error_message}")
+                        
+                        return {
+                            "success": False,
+                            "message": f"无法生成PDF: {error_message}"
+                        }
+                    except Exception:
+                        # 返回通用错误
+                        return {
+                            "success": False,
+                            "message": f"服务器返回了非PDF格式的内容，内容类型: {content_type}"
+                        }
+            else:
+                logger.error(f"Failed to generate PDF: {response.status_code}, {response.text}")
+                return {
                     "success": False,
-                    "message": f"调用Spring服务失败: {str(e)}"
-                })
-                return
-                
+                    "message": f"生成PDF失败，服务返回错误: {response.status_code}，{response.text[:100]}"
+                }
+        except (http_client.BackendBusyError, deadline.DeadlineExceeded) as e:
+            # 本进程内排队超时或本次调用的时间已用完，Spring本身未必异常，不计入健康统计
+            logger.warning(f"Spring request not sent: {str(e)}")
+            return {
+                "success": False,
+                "message": f"调用Spring服务失败: {str(e)}"
+            }
         except Exception as e:
-            logger.error(f"Error in GMP PDF generation: {str(e)}")
+            logger.error(f"Error calling Spring service: {str(e)}")
+            _spring_health.record_failure()
+            return {
+                "success": False,
+                "message": f"调用Spring服务失败: {str(e)}"
+            }
+
+    def _select_renderer(self, requested: str = None) -> str:
+        """确定本次调用使用的PDF渲染方式
+        
+        Args:
+            requested: 调用参数中指定的渲染方式，为空时使用GMP_PDF_RENDERER环境变量
+            
+        Returns:
+            "spring"、"local"或"auto"（auto表示先调用Spring，失败时回退到本地渲染）
+        """
+        renderer = (requested or DEFAULT_PDF_RENDERER or "spring").strip().lower()
+        if renderer not in PDF_RENDERERS:
+            logger.warning(f"未知的PDF渲染方式: {renderer}，使用spring")
+            return "spring"
+        
+        # 自动模式下，Spring近期持续失败或响应过慢时直接使用本地渲染
+        if renderer == "auto" and _spring_health.prefer_local():
+            logger.info("Spring服务近期不可用或响应过慢，自动选择本地渲染")
+            return "local"
+        return renderer
+    
+    @timed("local.render")
+    def _render_locally(self, report_data: Dict[str, Any]) -> tuple:
+        """在插件进程内渲染PDF，不经过Spring服务
+        
+        Args:
+            report_data: 报告数据
+            
+        Returns:
+            tuple: (结果字典, PDF二进制内容)
+        """
+        prepared_data = self._prepare_report_payload(report_data)
+        pdf_content = render_report_pdf(prepared_data)
+        filename = f"GMP_{report_data.get('investigationId', 'report')}.pdf"
+        logger.info(f"本地渲染PDF完成: {filename}, {len(pdf_content)} 字节")
+        return {
+            "success": True,
+            "message": "成功生成PDF报告",
+            "filename": filename,
+            "renderer": "local"
+        }, pdf_content
+    
+    def _local_render_messages(self, report_data: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """本地渲染PDF并生成工具消息（结果JSON和PDF文件）"""
+        try:
+            result, pdf_content = self._render_locally(report_data)
+        except Exception as e:
+            logger.error(f"本地渲染PDF失败: {str(e)}")
             yield self.create_json_message({
                 "success": False,
-                "message": f"PDF生成失败: {str(e)}"
+                "message": f"本地渲染PDF失败: {str(e)}"
             })
-    
+            return
+        
+        yield self.create_json_message(result)
+        yield self.create_blob_message(pdf_content, meta={
+            "mime_type": "application/pdf",
+            "filename": result["filename"]
+        })
+
+    @timed("generate.optimize")
     def _optimize_report_data(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
-        """使用Dify模型优化报告数据
+        """使用Dify模型优化报告数据，按GMP_OPTIMIZE_MODE选择字段补丁或整份改写
+        
+        Args:
+            report_data: 原始报告数据
+            
+        Returns:
+            优化后的报告数据；未能优化时返回原始数据
+        """
+        # 模型调用不能用完本次调用的全部时间，要为之后的PDF渲染留出时间
+        with deadline.reserve(deadline.DEADLINE_RENDER_RESERVE):
+            if OPTIMIZE_MODE == "full":
+                return self._optimize_full(report_data)
+            return self._optimize_patch(report_data)
+    
+    def _optimize_patch(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
+        """只把叙述性字段以紧凑JSON发送给模型，按返回的补丁逐字段校验后在本地应用
+        
+        补丁中不合格的字段单独丢弃，其余字段照常应用；不修改传入的report_data。
+        
+        Args:
+            report_data: 原始报告数据
+            
+        Returns:
+            应用补丁后的报告数据；没有字段被修改时返回原始数据
+        """
+        try:
+            api_base = self.context.get("api_base", "")
+            api_key = self.context.get("api_key", "")
+            
+            if not all([api_base, api_key]):
+                logger.warning("Missing required parameters for report optimization, using original data")
+                return report_data
+            
+            fields = {field: report_data[field] for field in PATCH_FIELDS
+                      if isinstance(report_data.get(field), str) and report_data[field].strip()}
+            if not fields:
+                logger.info("No prose fields to optimize, using original data")
+                return report_data
+            
+            prompt = f"""
+请帮助优化以下GMP报告中的叙述性字段，使其更加专业、清晰和准确，不要编造原文中没有的事实。
+只返回需要修改的字段，格式为JSON对象：键为字段名，值为优化后的完整文本；不需要修改的字段不要返回。
+
+字段:
+{json.dumps(fields, ensure_ascii=False, separators=(",", ":"))}
+
+请返回JSON补丁:
+"""
+            
+            model_response = call_dify_model(prompt, self.context, task="optimize")
+            if not model_response:
+                logger.warning("Failed to get optimization from Dify model, using original data")
+                return report_data
+            
+            patch = extract_json_from_text(model_response)
+            if not isinstance(patch, dict) or not patch:
+                logger.warning("Could not extract a valid patch from model response, using original data")
+                return report_data
+            
+            optimized = None
+            applied = []
+            for field, original in fields.items():
+                if field not in patch:
+                    continue
+                result = _check_patch_field(original, patch[field])
+                metrics.registry.inc(OPTIMIZE_PATCH_FIELDS, result=result)
+                if result == "applied":
+                    if optimized is None:
+                        optimized = report_data.copy()
+                    optimized[field] = patch[field].strip()
+                    applied.append(field)
+                elif result != "unchanged":
+                    logger.warning(f"Rejected optimized field {field}: {result}")
+            
+            if optimized is None:
+                logger.info("Optimization patch changed no fields, using original data")
+                return report_data
+            
+            logger.info(f"Successfully optimized report fields using Dify model: {applied}")
+            return optimized
+            
+        except Exception as e:
+            logger.warning(f"Error optimizing report data: {str(e)}, using original data")
+            return report_data
+    
+    def _optimize_full(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
+        """使用Dify模型改写整份报告数据
         
         Args:
             report_data: 原始报告数据
@@ -759,7 +1233,7 @@ class GMPGeneratePDFTool(Tool):
 """
             
             # 调用Dify模型
-            model_response = call_dify_model(prompt, self.context)
+            model_response = call_dify_model(prompt, self.context, task="optimize")
             
             if not model_response:
                 logger.warning("Failed to get optimization from Dify model, using original data")
@@ -864,6 +1338,155 @@ class GMPGeneratePDFTool(Tool):
                 "message": f"生成PDF报告时发生错误: {str(e)}"
             }
 
+    @timed("generate.normalize")
+    def _prepare_report_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """规范化报告数据中的纠正/预防措施，生成发送给渲染端的数据
+        
+        Args:
+            data: 报告数据
+            
+        Returns:
+            包含correctiveActions、preventiveActions及编号格式化措施的新字典
+        """
+        prepared_data = data.copy()
+        
+        # 记录处理前数据
+        log_payload(logger, "预处理前correctiveActions", prepared_data.get('correctiveActions', '不存在'))
+        log_payload(logger, "预处理前preventiveActions", prepared_data.get('preventiveActions', '不存在'))
+        log_payload(logger, "预处理前actions", prepared_data.get('actions', '不存在'))
+        
+        # 重新规范化corrective和preventive字段
+        # 确保只存储纯措施文本，不带前缀
+        if "correctiveActions" in prepared_data:
+            if isinstance(prepared_data["correctiveActions"], list):
+                # 移除前缀标记
+                clean_list = []
+                for item in prepared_data["correctiveActions"]:
+                    if isinstance(item, str):
+                        if item.lower().startswith(("纠正措施:", "纠正措施：")):
+                            # 提取冒号后的文本
+                            if ":" in item:
+                                clean_list.append(item.split(":", 1)[1].strip())
+                            elif "：" in item:
+                                clean_list.append(item.split("：", 1)[1].strip())
+                        else:
+                            clean_list.append(item.strip())
+                prepared_data["correctiveActions"] = clean_list
+            elif isinstance(prepared_data["correctiveActions"], str):
+                prepared_data["correctiveActions"] = [prepared_data["correctiveActions"].strip()]
+        else:
+            prepared_data["correctiveActions"] = []
+            
+        if "preventiveActions" in prepared_data:
+            if isinstance(prepared_data["preventiveActions"], list):
+                # 移除前缀标记
+                clean_list = []
+                for item in prepared_data["preventiveActions"]:
+                    if isinstance(item, str):
+                        if item.lower().startswith(("预防措施:", "预防措施：")):
+                            # 提取冒号后的文本
+                            if ":" in item:
+                                clean_list.append(item.split(":", 1)[1].strip())
+                            elif "：" in item:
+                                clean_list.append(item.split("：", 1)[1].strip())
+                        else:
+                            clean_list.append(item.strip())
+                prepared_data["preventiveActions"] = clean_list
+            elif isinstance(prepared_data["preventiveActions"], str):
+                prepared_data["preventiveActions"] = [prepared_data["preventiveActions"].strip()]
+        else:
+            prepared_data["preventiveActions"] = []
+        
+        # 如果只有actions字段，按前缀分割
+        if ("actions" in prepared_data and prepared_data["actions"]) and \
+           (not prepared_data["correctiveActions"] and not prepared_data["preventiveActions"]):
+            actions = prepared_data["actions"]
+            corrective = []
+            preventive = []
+            
+            if isinstance(actions, list):
+                for action in actions:
+                    if isinstance(action, str):
+                        action = action.strip()
+                        if action.lower().startswith(("纠正措施:", "纠正措施：")):
+                            # 提取冒号后的文本
+                            if ":" in action:
+                                corrective.append(action.split(":", 1)[1].strip())
+                            elif "：" in action:
+                                corrective.append(action.split("：", 1)[1].strip())
+                        elif action.lower().startswith(("预防措施:", "预防措施：")):
+                            # 提取冒号后的文本
+                            if ":" in action:
+                                preventive.append(action.split(":", 1)[1].strip())
+                            elif "：" in action:
+                                preventive.append(action.split("：", 1)[1].strip())
+                        # 通过内容判断类型
+                        elif "更换" in action or "修复" in action or "检测" in action or "清理" in action:
+                            corrective.append(action)
+                        elif "增加" in action or "建立" in action or "开展" in action or "优化" in action or "培训" in action:
+                            preventive.append(action)
+                        
+            # 更新分组字段
+            if corrective:
+                prepared_data["correctiveActions"] = corrective
+            if preventive:
+                prepared_data["preventiveActions"] = preventive
+        
+        # 移除重复措施
+        if prepared_data["correctiveActions"] and prepared_data["preventiveActions"]:
+            # 创建集合去重
+            corrective_set = set(prepared_data["correctiveActions"])
+            preventive_set = set(prepared_data["preventiveActions"])
+            
+            # 确保措施不重复出现在两个类别中
+            # 优先保留在preventiveActions中
+            corrective_unique = corrective_set - preventive_set
+            
+            prepared_data["correctiveActions"] = list(corrective_unique)
+        
+        # 修改格式：将纠正措施和预防措施以编号的形式显示
+        # 以创建新的格式化字段
+        if prepared_data["correctiveActions"]:
+            formatted_corrective = []
+            for i, action in enumerate(prepared_data["correctiveActions"], 1):
+                formatted_corrective.append(f"{i}. {action}")
+            prepared_data["formattedCorrectiveActions"] = formatted_corrective
+        else:
+            prepared_data["formattedCorrectiveActions"] = []
+            
+        if prepared_data["preventiveActions"]:
+            formatted_preventive = []
+            for i, action in enumerate(prepared_data["preventiveActions"], 1):
+                formatted_preventive.append(f"{i}. {action}")
+            prepared_data["formattedPreventiveActions"] = formatted_preventive
+        else:
+            prepared_data["formattedPreventiveActions"] = []
+            
+        # 重新构造actions字段
+        formatted_actions = []
+        if prepared_data.get("formattedCorrectiveActions"):
+            formatted_actions.append("纠正措施:")
+            formatted_actions.extend(prepared_data["formattedCorrectiveActions"])
+            
+        if prepared_data.get("formattedPreventiveActions"):
+            if formatted_actions:  # 如果已经有纠正措施，添加空行分隔
+                formatted_actions.append("")
+            formatted_actions.append("预防措施:")
+            formatted_actions.extend(prepared_data["formattedPreventiveActions"])
+            
+        # 更新actions字段，以包含格式化的措施
+        if formatted_actions:
+            prepared_data["actions"] = formatted_actions
+        
+        # 记录发送到后端的实际数据
+        log_payload(logger, f"预处理后correctiveActions ({len(prepared_data.get('correctiveActions', []))}项)",
+                    prepared_data.get('correctiveActions', '空'))
+        log_payload(logger, f"预处理后preventiveActions ({len(prepared_data.get('preventiveActions', []))}项)",
+                    prepared_data.get('preventiveActions', '空'))
+        log_payload(logger, "预处理后formattedActions", prepared_data.get('actions', '空'))
+        
+        return prepared_data
+
     def _make_api_request(self, endpoint: str, data: Dict[str, Any], credentials: Dict[str, Any] = None) -> Dict[str, Any]:
         """向Spring Boot应用发送API请求
         
@@ -886,142 +1509,7 @@ class GMPGeneratePDFTool(Tool):
                 return {"success": False, "message": "缺少Spring应用URL或API密钥"}
             
             # 预处理数据 - 确保包含正确的分组字段
-            prepared_data = data.copy()
-            
-            # 记录处理前数据
-            logger.info("预处理前数据:")
-            logger.info(f"correctiveActions: {prepared_data.get('correctiveActions', '不存在')}")
-            logger.info(f"preventiveActions: {prepared_data.get('preventiveActions', '不存在')}")
-            logger.info(f"actions: {prepared_data.get('actions', '不存在')}")
-            
-            # 重新规范化corrective和preventive字段
-            # 确保只存储纯措施文本，不带前缀
-            if "correctiveActions" in prepared_data:
-                if isinstance(prepared_data["correctiveActions"], list):
-                    # 移除前缀标记
-                    clean_list = []
-                    for item in prepared_data["correctiveActions"]:
-                        if isinstance(item, str):
-                            if item.lower().startswith(("纠正措施:", "纠正措施：")):
-                                # 提取冒号后的文本
-                                if ":" in item:
-                                    clean_list.append(item.split(":", 1)[1].strip())
-                                elif "：" in item:
-                                    clean_list.append(item.split("：", 1)[1].strip())
-                            else:
-                                clean_list.append(item.strip())
-                    prepared_data["correctiveActions"] = clean_list
-                elif isinstance(prepared_data["correctiveActions"], str):
-                    prepared_data["correctiveActions"] = [prepared_data["correctiveActions"].strip()]
-            else:
-                prepared_data["correctiveActions"] = []
-                
-            if "preventiveActions" in prepared_data:
-                if isinstance(prepared_data["preventiveActions"], list):
-                    # 移除前缀标记
-                    clean_list = []
-                    for item in prepared_data["preventiveActions"]:
-                        if isinstance(item, str):
-                            if item.lower().startswith(("预防措施:", "预防措施：")):
-                                # 提取冒号后的文本
-                                if ":" in item:
-                                    clean_list.append(item.split(":", 1)[1].strip())
-                                elif "：" in item:
-                                    clean_list.append(item.split("：", 1)[1].strip())
-                            else:
-                                clean_list.append(item.strip())
-                    prepared_data["preventiveActions"] = clean_list
-                elif isinstance(prepared_data["preventiveActions"], str):
-                    prepared_data["preventiveActions"] = [prepared_data["preventiveActions"].strip()]
-            else:
-                prepared_data["preventiveActions"] = []
-            
-            # 如果只有actions字段，按前缀分割
-            if ("actions" in prepared_data and prepared_data["actions"]) and \
-               (not prepared_data["correctiveActions"] and not prepared_data["preventiveActions"]):
-                actions = prepared_data["actions"]
-                corrective = []
-                preventive = []
-                
-                if isinstance(actions, list):
-                    for action in actions:
-                        if isinstance(action, str):
-                            action = action.strip()
-                            if action.lower().startswith(("纠正措施:", "纠正措施：")):
-                                # 提取冒号后的文本
-                                if ":" in action:
-                                    corrective.append(action.split(":", 1)[1].strip())
-                                elif "：" in action:
-                                    corrective.append(action.split("：", 1)[1].strip())
-                            elif action.lower().startswith(("预防措施:", "预防措施：")):
-                                # 提取冒号后的文本
-                                if ":" in action:
-                                    preventive.append(action.split(":", 1)[1].strip())
-                                elif "：" in action:
-                                    preventive.append(action.split("：", 1)[1].strip())
-                            # 通过内容判断类型
-                            elif "更换" in action or "修复" in action or "检测" in action or "清理" in action:
-                                corrective.append(action)
-                            elif "增加" in action or "建立" in action or "开展" in action or "优化" in action or "培训" in action:
-                                preventive.append(action)
-                            
-                # 更新分组字段
-                if corrective:
-                    prepared_data["correctiveActions"] = corrective
-                if preventive:
-                    prepared_data["preventiveActions"] = preventive
-            
-            # 移除重复措施
-            if prepared_data["correctiveActions"] and prepared_data["preventiveActions"]:
-                # 创建集合去重
-                corrective_set = set(prepared_data["correctiveActions"])
-                preventive_set = set(prepared_data["preventiveActions"])
-                
-                # 确保措施不重复出现在两个类别中
-                # 优先保留在preventiveActions中
-                corrective_unique = corrective_set - preventive_set
-                
-                prepared_data["correctiveActions"] = list(corrective_unique)
-            
-            # 修改格式：将纠正措施和预防措施以编号的形式显示
-            # 以创建新的格式化字段
-            if prepared_data["correctiveActions"]:
-                formatted_corrective = []
-                for i, action in enumerate(prepared_data["correctiveActions"], 1):
-                    formatted_corrective.append(f"{i}. {action}")
-                prepared_data["formattedCorrectiveActions"] = formatted_corrective
-            else:
-                prepared_data["formattedCorrectiveActions"] = []
-                
-            if prepared_data["preventiveActions"]:
-                formatted_preventive = []
-                for i, action in enumerate(prepared_data["preventiveActions"], 1):
-                    formatted_preventive.append(f"{i}. {action}")
-                prepared_data["formattedPreventiveActions"] = formatted_preventive
-            else:
-                prepared_data["formattedPreventiveActions"] = []
-                
-            # 重新构造actions字段
-            formatted_actions = []
-            if prepared_data.get("formattedCorrectiveActions"):
-                formatted_actions.append("纠正措施:")
-                formatted_actions.extend(prepared_data["formattedCorrectiveActions"])
-                
-            if prepared_data.get("formattedPreventiveActions"):
-                if formatted_actions:  # 如果已经有纠正措施，添加空行分隔
-                    formatted_actions.append("")
-                formatted_actions.append("预防措施:")
-                formatted_actions.extend(prepared_data["formattedPreventiveActions"])
-                
-            # 更新actions字段，以包含格式化的措施
-            if formatted_actions:
-                prepared_data["actions"] = formatted_actions
-            
-            # 记录发送到后端的实际数据
-            logger.info("预处理后数据:")
-            logger.info(f"correctiveActions ({len(prepared_data.get('correctiveActions', []))}项): {prepared_data.get('correctiveActions', '空')}")
-            logger.info(f"preventiveActions ({len(prepared_data.get('preventiveActions', []))}项): {prepared_data.get('preventiveActions', '空')}")
-            logger.info(f"formattedActions: {prepared_data.get('actions', '空')}")
+            prepared_data = self._prepare_report_payload(data)
             
             # 设置请求头
             headers = {
@@ -1031,14 +1519,15 @@ class GMPGeneratePDFTool(Tool):
             
             # 记录请求详情
             logger.info(f"请求URL: {base_url}{endpoint}")
-            logger.info(f"请求方法: POST")
+            logger.info("请求方法: POST")
             logger.info(f"Headers: {headers}")
             
             # 发送请求
-            response = requests.post(
+            response = http_client.post(
                 f"{base_url}{endpoint}",
+                "spring",
                 headers=headers,
-                json=prepared_data,
+                json_body=prepared_data,
                 timeout=30  # 30秒超时
             )
             
@@ -2,15 +2,21 @@
 Bayer GMP Reporter - HTML预览工具
 """
 from collections.abc import Generator
-from typing import Any, Dict, List
-import requests
+from typing import Any, Dict
 import json
 import logging
 import sys
 import os
+import threading
+import time
+from collections import OrderedDict
 
-# 添加项目根目录到Python路径
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import config  # noqa: F401  加载.env
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
@@ -18,6 +24,15 @@ from dify_plugin.entities.tool import ToolInvokeMessage
 # 创建日志记录器
 logger = logging.getLogger("bayer_gmp")
 
+# 导入公共工具函数
+import http_client
+from utils import canonical_json_hash, credential_hash
+import metrics
+from metrics import span, timed
+from profiling import profiled
+from correlation import correlated
+from memory_guard import ReportTooLargeError, check_report_size
+
 # 全局配置
 DEFAULT_SPRING_APP_URL = "http://localhost:8080"
 API_ENDPOINTS = {
@@ -25,6 +40,75 @@ API_ENDPOINTS = {
     "preview_report": "/api/reports/preview-from-data"
 }
 
+# 预览缓存配置：新鲜期内直接返回缓存，过期后若有ETag则发送条件请求重新验证
+PREVIEW_CACHE_TTL = float(os.getenv("GMP_PREVIEW_CACHE_TTL", "300"))
+PREVIEW_CACHE_SIZE = int(os.getenv("GMP_PREVIEW_CACHE_SIZE", "128"))
+
+
+class PreviewCache:
+    """按Spring地址、API密钥和报告数据规范化哈希缓存的HTML预览（LRU淘汰，线程安全）"""
+    
+    def __init__(self, ttl: float = PREVIEW_CACHE_TTL, max_entries: int = PREVIEW_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+    
+    @staticmethod
+    def make_key(base_url: str, api_key: str, report_data: Any) -> str:
+        """缓存键：Spring地址 + API密钥的哈希 + 报告数据的规范化哈希
+
+        不同密钥可能对应不同的租户或权限，不能共用预览；键中只保存密钥的哈希，不保存密钥本身。
+        """
+        return f"{base_url}|{credential_hash(api_key)}|{canonical_json_hash(report_data)}"
+    
+    def get(self, key: str) -> Dict[str, Any]:
+        """返回缓存条目副本，并标记是否仍在新鲜期内；不存在时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry, fresh=time.monotonic() - entry["validated_at"] < self.ttl)
+    
+    def put(self, key: str, html_content: str, etag: str = None) -> None:
+        """写入或替换缓存条目"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "html_content": html_content,
+                "etag": etag,
+                "validated_at": time.monotonic()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def touch(self, key: str) -> None:
+        """条件请求确认未变化后，刷新条目的新鲜期"""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["validated_at"] = time.monotonic()
+    
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+
+_preview_cache = PreviewCache()
+
+
+def _preview_cache_collector():
+    """导出预览缓存统计到 /metrics"""
+    with _preview_cache._lock:
+        samples = [({"result": stat}, value) for stat, value in _preview_cache.stats.items()]
+    yield ("gmp_preview_cache_total", "counter", "HTML preview cache lookups by result", samples)
+
+
+metrics.registry.register_collector(_preview_cache_collector)
+
 class GMPPreviewReportTool(Tool):
     """预览GMP报告的HTML工具"""
     
@@ -38,6 +122,9 @@ class GMPPreviewReportTool(Tool):
         super().__init__(runtime, session)
         self.context = {}
     
+    @correlated("gmp_preview_report")
+    @timed("tool.preview")
+    @profiled("gmp_preview_report")
     def _invoke(self, tool_parameters: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """执行工具调用逻辑
         
@@ -97,6 +184,17 @@ class GMPPreviewReportTool(Tool):
             report_data_str = tool_parameters.get("report_data")
             conversation_id = tool_parameters.get("conversation_id")
             
+            # 在解析前检查报告数据大小
+            try:
+                check_report_size(report_data_str)
+            except ReportTooLargeError as e:
+                logger.error(str(e))
+                yield self.create_json_message({
+                    "success": False,
+                    "message": str(e)
+                })
+                return
+            
             # 处理report_data作为JSON字符串的情况
             report_data = None
             if report_data_str:
@@ -114,31 +212,23 @@ class GMPPreviewReportTool(Tool):
                     })
                     return
             
-            # 如果没有直接提供报告数据，但提供了对话ID，则使用提取工具
+            # 如果没有直接提供报告数据，但提供了对话ID，则从对话中提取
             if not report_data and conversation_id:
                 logger.info(f"Report data not provided, extracting from conversation: {conversation_id}")
-                from .gmp_extract_data import GMPExtractDataTool
-                extract_tool = GMPExtractDataTool(self.runtime, self.session)
+                from .gmp_extract_data import extract_report
                 
-                # 确保extract_tool有正确的上下文和凭据
-                extract_tool.context = self.context
-                extract_tool.credentials = credentials
+                # 提取使用当前的Dify上下文和凭据
+                extract_context = dict(self.context, credentials=credentials)
                 
-                # 尝试使用提取工具获取数据
                 try:
-                    logger.info(f"Calling extract tool with conversation_id: {conversation_id}")
-                    extract_responses = list(extract_tool._invoke({"conversation_id": conversation_id, "credentials": credentials}))
-                    
-                    for response in extract_responses:
-                        if hasattr(response, 'json_data'):
-                            result = json.loads(response.json_data)
-                            logger.info(f"Extract tool response: {result.get('success')}")
-                            if result.get("success"):
-                                report_data = result.get("report_data", {})
-                                logger.info(f"Successfully extracted report data with fields: {', '.join(report_data.keys())}")
-                                break
+                    logger.info(f"Extracting report data for conversation_id: {conversation_id}")
+                    result = extract_report(conversation_id, extract_context)
+                    logger.info(f"Extract result: {result.get('success')}")
+                    if result.get("success"):
+                        report_data = result.get("report_data", {})
+                        logger.info(f"Successfully extracted report data with fields: {', '.join(report_data.keys())}")
                 except Exception as e:
-                    logger.error(f"Error calling extract tool: {str(e)}")
+                    logger.error(f"Error extracting report data: {str(e)}")
                     yield self.create_json_message({
                         "success": False,
                         "message": f"无法从对话中提取报告数据: {str(e)}"
@@ -153,6 +243,20 @@ class GMPPreviewReportTool(Tool):
                 })
                 return
             
+            # 命中新鲜缓存时直接返回，不发起网络请求
+            cache_key = _preview_cache.make_key(base_url, api_key, report_data)
+            cached = _preview_cache.get(cache_key)
+            if cached and cached["fresh"]:
+                logger.info("HTML preview served from cache")
+                _preview_cache.count("hits")
+                yield self.create_json_message({
+                    "success": True,
+                    "message": "成功生成HTML预览",
+                    "html_content": cached["html_content"],
+                    "cached": True
+                })
+                return
+            
             # 调用Spring服务生成HTML预览
             try:
                 logger.info(f"Generating HTML preview with Spring App URL: {base_url}")
@@ -161,24 +265,45 @@ class GMPPreviewReportTool(Tool):
                     "X-API-KEY": api_key  # 使用X-API-KEY头而不是Authorization
                 }
                 
-                # 设置请求超时(秒)
+                # 缓存已过期但有ETag时，发送条件请求重新验证
+                if cached and cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                    logger.info(f"Revalidating cached HTML preview with ETag: {cached['etag']}")
+                
+                # 设置请求超时(秒)，http_client会进一步限制在本次调用的剩余时间内
                 timeout = 15
                 
-                response = requests.post(
-                    f"{base_url}{API_ENDPOINTS['preview_report']}",
-                    headers=headers,
-                    json=report_data,
-                    timeout=timeout
-                )
+                with span("spring.preview"):
+                    response = http_client.post(
+                        f"{base_url}{API_ENDPOINTS['preview_report']}",
+                        "spring",
+                        headers=headers,
+                        json_body=report_data,
+                        timeout=timeout
+                    )
                 
-                if response.status_code == 200:
+                if response.status_code == 304 and cached:
+                    logger.info("HTML preview not modified, using cached content")
+                    _preview_cache.touch(cache_key)
+                    _preview_cache.count("revalidated")
+                    yield self.create_json_message({
+                        "success": True,
+                        "message": "成功生成HTML预览",
+                        "html_content": cached["html_content"],
+                        "cached": True
+                    })
+                    return
+                elif response.status_code == 200:
                     logger.info("Successfully generated HTML preview")
                     html_content = response.text
+                    _preview_cache.put(cache_key, html_content, response.headers.get("ETag"))
+                    _preview_cache.count("misses")
                     
                     yield self.create_json_message({
                         "success": True,
                         "message": "成功生成HTML预览",
-                        "html_content": html_content
+                        "html_content": html_content,
+                        "cached": False
                     })
                     return
                 else:
@@ -0,0 +1,134 @@
+"""
+Bayer GMP Reporter - 报告查找工具
+"""
+from collections.abc import Generator
+from typing import Any, Dict
+import logging
+import sys
+import os
+
+# 添加项目根目录到Python路径（只添加一次）
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT_DIR not in sys.path:
+    sys.path.append(_ROOT_DIR)
+
+import config
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 导入公共工具函数
+import report_store
+from metrics import timed
+from profiling import profiled
+from correlation import correlated
+
+# 工具参数与查找条件的对应关系
+LOOKUP_PARAMETERS = {
+    "investigation_id": "investigation_id",
+    "doc_id": "doc_id",
+    "prepared_date": "prepared_date",
+    "conversation_id": "conversation_id",
+    "report_id": "report_id",
+}
+
+
+# 没有下载链接的生成结果（本地渲染的PDF在生成时以文件形式直接返回，不保存在插件中）
+NO_DOWNLOAD_NOTE = "本地渲染的PDF在生成时已直接返回，未保存下载链接；可用report_id和include_data取回报告数据后重新生成"
+
+
+class GMPRetrieveReportTool(Tool):
+    """从本地报告存储中查找已生成的GMP报告的工具"""
+
+    def __init__(self, runtime=None, session=None):
+        """初始化工具
+
+        Args:
+            runtime: 运行时环境
+            session: 会话信息
+        """
+        super().__init__(runtime, session)
+        self.context = {}
+    
+    def _spring_api_key(self, tool_parameters: Dict[str, Any]) -> str:
+        """与PDF生成工具取法相同的Spring API密钥：工具参数、上下文或插件运行时中的凭据，否则取环境变量中的默认值"""
+        credentials = tool_parameters.get("credentials") or \
+            (tool_parameters.get("context") or {}).get("credentials") or \
+            getattr(self.runtime, "credentials", None) or {}
+        return tool_parameters.get("spring_app_api_key") or credentials.get("spring_app_api_key") or \
+            config.SPRING_APP_API_KEY
+
+    @correlated("gmp_retrieve_report")
+    @timed("tool.retrieve")
+    @profiled("gmp_retrieve_report")
+    def _invoke(self, tool_parameters: Dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """执行工具调用逻辑
+
+        按调查编号、文档编号、编制日期（可为前缀，如2025-04）、对话ID或报告ID查找，
+        返回已保存的下载链接等生成结果，不调用Spring服务。只返回以同一Spring API密钥生成的报告。
+
+        Args:
+            tool_parameters: 工具参数，至少包含一个查找条件，可包含limit和include_data
+
+        Yields:
+            ToolInvokeMessage: 工具调用消息
+        """
+        try:
+            criteria = {key: tool_parameters.get(name) for name, key in LOOKUP_PARAMETERS.items()
+                        if tool_parameters.get(name)}
+            if not criteria:
+                logger.error("Missing lookup criteria for report retrieval")
+                yield self.create_json_message({
+                    "success": False,
+                    "message": "缺少查找条件：请提供调查编号、文档编号、编制日期、对话ID或报告ID中的至少一个"
+                })
+                return
+
+            api_key = self._spring_api_key(tool_parameters)
+            if not api_key:
+                logger.error("Missing Spring API key for report retrieval")
+                yield self.create_json_message({
+                    "success": False,
+                    "message": "缺少Spring服务API密钥，无法确定可查看的报告"
+                })
+                return
+            
+            limit = int(tool_parameters.get("limit") or 10)
+            include_data = bool(tool_parameters.get("include_data", False))
+            logger.info(f"Retrieving stored reports by {list(criteria.keys())}, limit {limit}")
+            reports = report_store.find_reports(api_key, limit=limit, include_data=include_data, **criteria)
+
+            if not reports:
+                yield self.create_json_message({
+                    "success": False,
+                    "message": "未找到已保存的报告",
+                    "reports": []
+                })
+                return
+
+            for report in reports:
+                if not report.get("download_url"):
+                    report["note"] = NO_DOWNLOAD_NOTE
+            result = {
+                "success": True,
+                "message": f"找到{len(reports)}份已保存的报告",
+                "reports": reports
+            }
+            # 最新一份报告有下载链接时，与PDF生成工具一样附带可直接点击的链接
+            latest_url = reports[0].get("download_url")
+            if latest_url:
+                result["download_url"] = latest_url
+                result["markdown_download_link"] = f"[下载PDF报告]({latest_url})"
+            else:
+                result["message"] += f"；最新一份没有下载链接（{reports[0].get('renderer') or '未知'}渲染）：{NO_DOWNLOAD_NOTE}"
+            yield self.create_json_message(result)
+
+        except Exception as e:
+            logger.error(f"Error retrieving stored reports: {str(e)}")
+            yield self.create_json_message({
+                "success": False,
+                "message": f"报告查找失败: {str(e)}"
+            })
@@ -1,15 +1,23 @@
 """
 Bayer GMP Reporter - 公共工具函数
 """
+import hashlib
 import json
-import requests
 import logging
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, Iterator, List
 from urllib.parse import urljoin
 
+import deadline
+import hedge
+import http_client
+import model_router
+from metrics import timed
+
 # 创建日志记录器
 logger = logging.getLogger("bayer_gmp")
 
+@timed("dify.fetch_history")
 def get_conversation_history(conversation_id: str, context: Dict[str, Any]) -> List[Dict[str, Any]]:
     """通过Dify API获取对话历史
     
@@ -57,7 +65,7 @@ def get_conversation_history(conversation_id: str, context: Dict[str, Any]) -> L
         url = f"{api_base}/messages?user={user_id}&conversation_id={conversation_id}"
         
         logger.info(f"Retrieving conversation history from: {url}")
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, "dify", headers=headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -94,12 +102,17 @@ def _get_mock_conversation_history(conversation_id: str = None) -> List[Dict[str
         {"role": "user", "content": "影响的批次已经隔离，质检部门正在进行全检。我们计划增加对灌装设备的定期维护频率，并建立密封圈磨损的定期检查程序"}
     ]
 
-def call_dify_model(prompt: str, context: Dict[str, Any]) -> str:
+@timed("dify.llm")
+def call_dify_model(prompt: str, context: Dict[str, Any], task: str = "default") -> str:
     """调用Dify平台配置的模型
     
+    按任务类型和各路由近期的耗时、失败率选择Dify应用（见model_router），
+    调用失败时在本次工具调用剩余的时间预算内依次尝试下一条路由。GMP_HEDGE开启时对慢调用发出对冲请求（见hedge）。
+    
     Args:
         prompt: 提示词
         context: 上下文信息，包含api_base和api_key
+        task: 任务类型，extract（结构化提取）或optimize（报告润色）
         
     Returns:
         模型的回复
@@ -109,27 +122,17 @@ def call_dify_model(prompt: str, context: Dict[str, Any]) -> str:
             logger.warning("Context is empty or None")
             return ""
         
-        api_base = context.get("api_base", "")
-        api_key = context.get("api_key", "")
         user_id = context.get("user_id", "plugin-user")  # 用户标识，默认为plugin-user
+        routes = model_router.plan_routes(task, context)
         
-        if not all([api_base, api_key]):
+        if not routes or not all(route.api_base for route in routes):
             logger.warning("Missing required parameters for Dify model call")
-            logger.warning(f"api_base: {'present' if api_base else 'missing'}, " +
-                         f"api_key: {'present' if api_key else 'missing'}")
+            logger.warning(f"api_base: {'present' if context.get('api_base') else 'missing'}, " +
+                         f"api_key: {'present' if context.get('api_key') else 'missing'}")
             
             # 返回空字符串，让调用方使用默认逻辑
             return ""
         
-        # 确保api_base末尾没有斜杠
-        api_base = api_base.rstrip('/')
-        model_url = f"{api_base}/completion-messages"
-            
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "inputs": {},
             "query": prompt,
@@ -137,21 +140,60 @@ def call_dify_model(prompt: str, context: Dict[str, Any]) -> str:
             "user": user_id
         }
         
-        logger.info(f"Calling Dify model at: {model_url}")
-        response = requests.post(model_url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            data = response.json()
-            answer = data.get("answer", "")
-            logger.info("Successfully received response from Dify model")
-            return answer
-        else:
+        for index, route in enumerate(routes):
+            remaining = model_router.remaining_budget()
+            if remaining <= 0:
+                logger.warning(f"Request budget exhausted before calling Dify model for {task}")
+                break
+            if index:
+                # 改用其他路由重试属于可选步骤，剩余时间不足时放弃
+                if not deadline.allows("model_fallback", deadline.DEADLINE_RETRY_MIN):
+                    break
+                model_router.record_fallback(task, routes[index - 1])
+            
+            model_url = f"{route.api_base}/completion-messages"
+            headers = {
+                "Authorization": f"Bearer {route.api_key}",
+                "Content-Type": "application/json"
+            }
+            
+            def send(timeout: float, model_url=model_url, headers=headers):
+                return http_client.post(model_url, "dify", headers=headers, json_body=payload, timeout=timeout)
+            
+            logger.info(f"Calling Dify model at: {model_url} (task: {task}, route: {route.name})")
+            start = time.perf_counter()
+            try:
+                if hedge.HEDGE_ENABLED:
+                    # 超过近期耗时的百分位仍未返回时再发一个相同请求，采用先成功返回的一个
+                    # 对冲等待时间按 (任务, 路由) 分别统计，与记分板一致
+                    response = hedge.hedger.call(f"{task}/{route.name}", send, remaining,
+                                                 is_success=lambda r: r.status_code == 200,
+                                                 discard=lambda r: r.close())
+                else:
+                    response = send(remaining)
+            except deadline.DeadlineExceeded as e:
+                # 本次调用的时间已用完，不是路由的问题，不计入记分板
+                logger.warning(f"Dify model call for {task} not sent: {str(e)}")
+                break
+            except Exception as e:
+                model_router.record_call(task, route, False, time.perf_counter() - start)
+                logger.warning(f"Error calling Dify model via route {route.name}: {str(e)}")
+                continue
+            
+            success = response.status_code == 200
+            model_router.record_call(task, route, success, time.perf_counter() - start)
+            if success:
+                data = response.json()
+                answer = data.get("answer", "")
+                logger.info("Successfully received response from Dify model")
+                return answer
             logger.warning(f"Dify model call failed: {response.status_code}, {response.text}")
-            return ""
+        return ""
     except Exception as e:
         logger.warning(f"Error calling Dify model: {str(e)}")
         return ""
 
+@timed("json.extract")
 def extract_json_from_text(text: str) -> Dict[str, Any]:
     """从文本中提取JSON结构
     
@@ -199,4 +241,53 @@ def extract_json_from_text(text: str) -> Dict[str, Any]:
         return {}
     except Exception as e:
         logger.warning(f"Error extracting JSON from text: {str(e)}")
-        return {} 
\ No newline at end of file
+        return {}
+
+
+def canonical_json_hash(data: Any) -> str:
+    """计算数据的规范化哈希（键排序、紧凑分隔符），内容相同的报告得到相同的哈希
+
+    Args:
+        data: 可JSON序列化的数据
+
+    Returns:
+        SHA-256十六进制摘要
+    """
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def canonical_json_chunks(data: Any, chunk_chars: int = 64 * 1024) -> Iterator[str]:
+    """逐段生成规范化JSON（与canonical_json_hash序列化的内容相同），大数据不会生成完整的JSON字符串
+
+    Args:
+        data: 可JSON序列化的数据
+        chunk_chars: 每段的大致字符数
+
+    Yields:
+        依次拼接即为规范化JSON的片段
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    pieces, length = [], 0
+    for piece in encoder.iterencode(data):
+        pieces.append(piece)
+        length += len(piece)
+        if length >= chunk_chars:
+            yield "".join(pieces)
+            pieces, length = [], 0
+    if pieces:
+        yield "".join(pieces)
+
+
+def credential_hash(secret: str) -> str:
+    """计算凭据（如Spring API密钥）的短哈希，用于按调用方隔离缓存和存储，不保存凭据本身
+
+    Args:
+        secret: 凭据，可为空
+
+    Returns:
+        SHA-256十六进制摘要的前16位；凭据为空时返回空字符串
+    """
+    if not secret:
+        return ""
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,103 @@
+"""
+Bayer GMP Reporter - 启动预热
+
+插件进程启动后的第一份报告需要先完成DNS解析和TCP/TLS握手。开启预热后，main.py在后台线程中
+对配置的后端逐个解析域名（写入DNS缓存）并发送一次HEAD请求，在共享Session的连接池中留下一条
+已建立的连接，后续真实请求直接复用：
+- GMP_WARMUP：是否在启动时预热（默认false）
+- GMP_WARMUP_URLS：除SPRING_APP_URL外需要预热的地址，逗号分隔（如Dify的API地址）
+- GMP_WARMUP_TIMEOUT：每个地址的超时时间（秒，默认5）
+
+预热失败只记录警告，不影响插件启动。服务端关闭空闲连接后，预热的连接不再可用，但DNS缓存仍然有效。
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import config
+
+# 创建日志记录器
+logger = logging.getLogger("bayer_gmp")
+
+# 是否在插件启动时预热
+WARMUP_ENABLED = os.getenv("GMP_WARMUP", "false").strip().lower() in ("1", "true", "yes", "on")
+# 额外需要预热的地址，逗号分隔
+WARMUP_URLS = [url.strip() for url in os.getenv("GMP_WARMUP_URLS", "").split(",") if url.strip()]
+# 每个地址的超时时间(秒)
+WARMUP_TIMEOUT = float(os.getenv("GMP_WARMUP_TIMEOUT", "5"))
+
+
+def default_urls() -> List[str]:
+    """需要预热的地址：SPRING_APP_URL加上GMP_WARMUP_URLS，去重"""
+    urls = []
+    for url in [config.SPRING_APP_URL] + WARMUP_URLS:
+        url = url.strip().rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _resolve(url: str) -> None:
+    """按urllib3建立连接时的参数解析域名，使随后的连接命中DNS缓存"""
+    from urllib3.util.connection import allowed_gai_family
+
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    socket.getaddrinfo(parsed.hostname, port, allowed_gai_family(), socket.SOCK_STREAM)
+
+
+def warm_up(urls: Optional[List[str]] = None, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """解析并预连接给定的后端地址
+
+    Args:
+        urls: 后端地址列表，默认取default_urls()
+        timeout: 每个地址的超时时间(秒)，默认取GMP_WARMUP_TIMEOUT
+
+    Returns:
+        每个地址的结果：url、success、resolve_ms、connect_ms、status或error
+    """
+    # http_client依赖requests，推迟到真正预热时再导入，不增加未开启预热时的启动耗时
+    import http_client
+
+    urls = default_urls() if urls is None else urls
+    timeout = WARMUP_TIMEOUT if timeout is None else timeout
+    session = http_client.get_session()  # 同时安装DNS缓存
+    results = []
+    for url in urls:
+        result: Dict[str, Any] = {"url": url, "success": False}
+        try:
+            start = time.perf_counter()
+            _resolve(url)
+            resolved = time.perf_counter()
+            result["resolve_ms"] = round((resolved - start) * 1000, 1)
+
+            # 任何HTTP状态码都说明连接已建立；HEAD没有响应体，连接随即放回连接池
+            response = session.head(url, timeout=timeout, allow_redirects=False)
+            response.close()
+            result["connect_ms"] = round((time.perf_counter() - resolved) * 1000, 1)
+            result["status"] = response.status_code
+            result["success"] = True
+            logger.info(f"Warmed up {url}: resolve {result['resolve_ms']}ms, "
+                        f"connect {result['connect_ms']}ms, HTTP {response.status_code}")
+        except Exception as e:
+            result["error"] = str(e)
+            logger.warning(f"Warm-up of {url} failed: {str(e)}")
+        results.append(result)
+    return results
+
+
+def start_warmup() -> Optional[threading.Thread]:
+    """GMP_WARMUP开启时在后台线程中预热，不阻塞插件启动
+
+    Returns:
+        预热线程，未开启时返回None
+    """
+    if not WARMUP_ENABLED:
+        return None
+    thread = threading.Thread(target=warm_up, name="gmp-warmup", daemon=True)
+    thread.start()
+    return thread